@@ -1,15 +1,23 @@
-from io import StringIO
+import math
 import os
 
-import pandas as pd
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, jsonify, session, abort
 from flask_session import Session
+from markupsafe import Markup
 
-from src.data_cleaning import fetch_and_aggregate_crash_data, process_and_format_crash_data
-from src.zip_code_search import get_all_unique_zip_codes, search_zip_code
+from src.data_cleaning import fetch_and_aggregate_crash_data
 from src.heatmap_generation import create_interactive_heatmap
-from src.data_fetching import is_date_range_valid, get_valid_years, get_current_month, get_current_year
-from src.data_storage import delete_all_files_in_data_dir, create_file_name, fetch_csv_file, save_dataframe_to_csv
+from src.data_fetching import is_date_range_valid, is_month_final, get_valid_years, get_current_month, get_current_year, parse_year_month, format_year_month
+from src.data_storage import COLUMNS, DATASET_DIR, create_dataset_file_name, create_file_name, fetch_csv_file, find_stored_date_range
+from src.disk_cache import DiskCache
+from src.result_cache import ResultCache, create_dataset_key
+from src.dataset_views import DatasetViews, AREAS
+from src.map_cache import MapCache
+from src.dataset_refresher import DatasetRefresher
+from src.geometry_registry import get_zip_geometry_registry
+from src.crash_cube import get_crash_cube
+from src.http_caching import create_etag, get_templates_version, make_cached_response
+from src.snapshot import DEFAULT_DATASET_SNAPSHOT, snapshot_lock, load_dataset_snapshot, save_dataset_snapshot
 
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY", "fallbackkey")
@@ -17,10 +25,52 @@ app.secret_key = os.getenv("SECRET_KEY", "fallbackkey")
 # Configure Flask-Session
 # You can use 'redis' for Redis-based sessions
 app.config['SESSION_TYPE'] = 'filesystem'
+# Only send the session cookie when the session changed, so view URLs that do not use the
+# session get the same response for every user and can be kept by shared caches
+app.config['SESSION_REFRESH_EACH_REQUEST'] = False
 Session(app)
 
 K = 5  # Number of neighbors to check for accidents with no zip code
 
+# The views of every aggregated dataset are cached once per worker and shared by every session,
+# the session itself only keeps the dataset key
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+result_cache = ResultCache(RESULT_CACHE_MAX_BYTES)
+
+# Aggregated datasets of every date range are kept on disk for every worker and restart,
+# the least recently used ranges are evicted first
+DATASET_CACHE_MAX_BYTES = int(os.getenv("DATASET_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+dataset_cache = DiskCache(DATASET_DIR, DATASET_CACHE_MAX_BYTES)
+
+# Rendered heatmaps only depend on the area and the dataset, so they are shared by every user
+MAP_CACHE_MEMORY_MAX_BYTES = int(os.getenv("MAP_CACHE_MEMORY_MAX_BYTES", 64 * 1024 * 1024))
+MAP_CACHE_DISK_MAX_BYTES = int(os.getenv("MAP_CACHE_DISK_MAX_BYTES", 512 * 1024 * 1024))
+map_cache = MapCache(MAP_CACHE_MEMORY_MAX_BYTES, MAP_CACHE_DISK_MAX_BYTES)
+
+# The default latest month dataset is rebuilt in the background when the month rolls over,
+# sessions keep getting the previous one until the new one is ready
+DEFAULT_DATASET_REFRESH_SECONDS = int(os.getenv("DEFAULT_DATASET_REFRESH_SECONDS", 5 * 60))
+DEFAULT_DATASET_WAIT_SECONDS = int(os.getenv("DEFAULT_DATASET_WAIT_SECONDS", 120))
+
+# Compressed response bodies are cached under their ETag, so each version is compressed once per worker
+COMPRESSED_CACHE_MAX_BYTES = int(os.getenv("COMPRESSED_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+compressed_cache = ResultCache(COMPRESSED_CACHE_MAX_BYTES)
+
+# Part of every page ETag, so pages rendered by an older deploy are not reused
+TEMPLATES_VERSION = get_templates_version(os.path.join(app.root_path, app.template_folder))
+
+# Views of a URL are shared by every user; views of final months never change, the latest
+# months are refreshed upstream, so proxies and browsers revalidate them sooner
+VIEW_MAX_AGE = 5 * 60
+FINAL_VIEW_MAX_AGE = 24 * 60 * 60
+
+# The valid years only change on new year, so browsers and proxies may reuse them for a while
+YEARS_MAX_AGE = 60 * 60
+
+# Zip code suggestions returned per keystroke
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 100
+
 INT_TO_MONTH = {
     1: "January",
     2: "February",
@@ -37,21 +87,123 @@ INT_TO_MONTH = {
 }
 
 
-def get_session_cached_raw_data():
-    return pd.read_json(StringIO(session['cached_raw_data']))
+def load_aggregated_data(start_month, start_year, end_month, end_year):
+    """
+    Build the aggregated dataset for a date range when it is not in the result cache.
+    Datasets whose months are all final are also kept in the disk cache so other workers and
+    restarts can reuse them. Ranges that end in a month that can still change are always rebuilt,
+    from the crash cube and the recent months, so their counts are never served stale from disk.
+    """
+    is_final = is_month_final(end_month, end_year)
+    file_name = create_dataset_file_name(start_month, start_year, end_month, end_year)
+
+    agg_df = dataset_cache.get_dataframe(file_name) if is_final else None
+    if agg_df is None:
+        agg_df = fetch_and_aggregate_crash_data(
+            start_month, start_year, end_month, end_year, K)
+        if agg_df is not None and is_final:
+            dataset_cache.set_dataframe(file_name, agg_df[COLUMNS])
+
+    return agg_df
+
+
+def load_dataset_views(start_month, start_year, end_month, end_year):
+    """
+    Build the views of every area for a date range when they are not in the result cache.
+    Heatmaps rendered from an older version of the dataset are invalidated.
+    """
+    agg_df = load_aggregated_data(start_month, start_year, end_month, end_year)
+    if agg_df is None:
+        return None
+    dataset_views = DatasetViews(agg_df)
+    map_cache.invalidate(create_dataset_key(
+        start_month, start_year, end_month, end_year), dataset_views.version)
+    return dataset_views
+
+
+def get_cached_dataset_views(start_month, start_year, end_month, end_year):
+    published = default_dataset.peek()
+    if published is not None and create_dataset_key(*published[0]) == create_dataset_key(
+            start_month, start_year, end_month, end_year):
+        return published[1]
+    return result_cache.get_or_load(
+        ('views', create_dataset_key(start_month, start_year, end_month, end_year)),
+        lambda: load_dataset_views(start_month, start_year, end_month, end_year))
+
 
+def get_session_dataset_views():
+    return get_cached_dataset_views(*get_session_date_range())
 
-def get_session_cached_formatted_data():
-    formatted_df_by_area = pd.read_json(
-        StringIO(session['cached_formatted_data']))
-    total_crashes = session['total_crashes']
-    average_crashes_per_zip = session['average_crashes_per_zip']
 
-    return total_crashes, average_crashes_per_zip, formatted_df_by_area
+def dump_json(value):
+    # Compact like jsonify, for bodies sent through make_cached_response
+    return app.json.dumps(value, separators=(',', ':'))
 
 
-def get_session_area():
-    return session['area']
+def get_decile_table_html(dataset_views, area, date_range):
+    """
+    Return the decile table of an area, rendered once per dataset version, area and date range
+    and then shared by every request.
+    """
+    return result_cache.get_or_load(
+        ('decile_table', dataset_views.version, area, date_range),
+        lambda: Markup(render_template('decile_table.html', area=area, date_range=date_range,
+                                       decile_summary=dataset_views.get_decile_summary(area))))
+
+
+def parse_url_date_range(start, end):
+    """
+    Parse the YYYY-MM start and end of a view URL, aborting with 404 for an invalid range.
+
+    Returns:
+    tuple: (start_month, start_year, end_month, end_year)
+    """
+    try:
+        start_month, start_year = parse_year_month(start)
+        end_month, end_year = parse_year_month(end)
+    except ValueError:
+        abort(404)
+    if not is_date_range_valid(start_month, start_year, end_month, end_year):
+        abort(404)
+    return start_month, start_year, end_month, end_year
+
+
+def get_url_dataset_views(date_range):
+    dataset_views = get_cached_dataset_views(*date_range)
+    if dataset_views is None:
+        abort(503)
+    return dataset_views
+
+
+@app.template_global('view_url')
+def get_view_url(endpoint, area, date_range, **values):
+    """
+    Build the canonical URL of a view, which holds everything the view depends on.
+    """
+    start_month, start_year, end_month, end_year = date_range
+    return url_for(endpoint, area=area, start=format_year_month(start_month, start_year),
+                   end=format_year_month(end_month, end_year), **values)
+
+
+def get_view_max_age(date_range):
+    _, _, end_month, end_year = date_range
+    return FINAL_VIEW_MAX_AGE if is_month_final(end_month, end_year) else VIEW_MAX_AGE
+
+
+def get_last_date_range():
+    """
+    Return the date range the session chose last, the default dataset's range for a new session.
+    """
+    if 'dataset_key' not in session:
+        get_default_data()
+    return tuple(int(value) for value in get_session_date_range())
+
+
+def render_decile_rows(dataset_views, area, decile):
+    for summary in dataset_views.get_decile_summary(area):
+        if summary['decile'] == decile:
+            return render_template('decile_rows.html', area=area, decile=decile, decile_rows=summary['rows'])
+    return None
 
 
 def get_session_date_range():
@@ -65,14 +217,9 @@ def set_session_date_range(start_month, start_year, end_month, end_year):
     session['end_year'] = end_year
 
 
-def set_session_cached_raw_data(agg_df):
-    session['cached_raw_data'] = agg_df.to_json()
-
-
-def set_session_cached_formatted_data(formatted_df_by_area, total_crashes, average_crashes_per_zip):
-    session['cached_formatted_data'] = formatted_df_by_area.to_json()
-    session['total_crashes'] = total_crashes
-    session['average_crashes_per_zip'] = average_crashes_per_zip
+def set_session_dataset(start_month, start_year, end_month, end_year):
+    session['dataset_key'] = create_dataset_key(
+        start_month, start_year, end_month, end_year)
 
 
 def set_session_area(area):
@@ -93,29 +240,86 @@ def get_latest_month_year():
     return current_month, current_year
 
 
-def get_default_data():
+def get_default_date_range():
     start_month, start_year = get_latest_month_year()
     end_month, end_year = get_latest_month_year()
+    return start_month, start_year, end_month, end_year
 
-    filename = create_file_name(
-        start_month, start_year, end_month, end_year)
 
-    agg_df = fetch_csv_file(filename)
-    if agg_df is None:
-        agg_df = fetch_and_aggregate_crash_data(
-            start_month, start_year, end_month, end_year, K)
-        if agg_df is not None:
-            delete_all_files_in_data_dir()
-            save_dataframe_to_csv(agg_df, filename)
+def load_default_dataset_views(date_range):
+    """
+    Build the default dataset once for every worker: the first worker to get the lock builds it
+    and publishes the memory-mapped snapshot, the others wait for the lock and load that snapshot.
+    """
+    date_range = tuple(int(value) for value in date_range)
+    with snapshot_lock(DEFAULT_DATASET_SNAPSHOT):
+        snapshot = load_dataset_snapshot()
+        if snapshot is not None and snapshot[0] == date_range:
+            return DatasetViews(snapshot[1])
+
+        dataset_views = load_dataset_views(*date_range)
+        if dataset_views is not None:
+            save_dataset_snapshot(dataset_views.agg_df, date_range)
+        return dataset_views
+
+
+def publish_stored_default_dataset():
+    """
+    Publish the default dataset stored by an earlier run, even if it is for an older month,
+    so the first requests after a restart do not wait for the refresher.
+    The shared snapshot is preferred over the CSV file shipped with the app.
+    """
+    snapshot = load_dataset_snapshot()
+    if snapshot is not None:
+        date_range, agg_df = snapshot
+    else:
+        date_range = find_stored_date_range()
+        if date_range is None:
+            return
+        agg_df = fetch_csv_file(create_file_name(*date_range))
+        if agg_df is None:
+            return
+    default_dataset.publish(date_range, DatasetViews(agg_df))
+
+
+def warm_up():
+    """
+    Load the zip geometry, the crash cube and the default dataset before the first request.
+
+    gunicorn.conf.py runs this once in the master before the workers fork, so every worker
+    starts with them in memory; the snapshots behind them are memory-mapped and shared. The default
+    dataset is only built here when no earlier run stored one, otherwise the stored one is published
+    and the refresher started in each worker brings it up to date.
+
+    It is not run on import, so tests and tools that import the app never fetch crash data.
+    """
+    get_zip_geometry_registry().spatial_index
+    get_crash_cube()
+    publish_stored_default_dataset()
+    if default_dataset.peek() is None:
+        default_dataset.refresh()
+
 
-    set_session_cached_raw_data(agg_df)
+default_dataset = DatasetRefresher(
+    get_default_date_range, load_default_dataset_views, DEFAULT_DATASET_REFRESH_SECONDS)
+
+
+def get_default_data():
+    # Only waits when no default dataset was ever built, right after the very first start
+    default_dataset.start()
+    published = default_dataset.get(DEFAULT_DATASET_WAIT_SECONDS)
+    if published is None:
+        abort(503)
+    start_month, start_year, end_month, end_year = published[0]
+
+    set_session_dataset(start_month, start_year, end_month, end_year)
     set_session_date_range(start_month, start_year, end_month, end_year)
 
 
 @app.route('/')
 def index():
     """ Display the available boroughs and datasets. """
-    if 'cached_raw_data' not in session:
+    if 'dataset_key' not in session:
         get_default_data()
     return render_template('index.html')
 
@@ -123,135 +327,168 @@ def index():
 @app.route('/view/<area>')
 def view_data(area):
     """
-    Display the selected area (borough or citywide) and dataset.
+    Redirect to the canonical URL of the selected area (borough or citywide) for the date range
+    the session chose last.
     """
-
-    if 'cached_raw_data' not in session:
-        get_default_data()
-    cached_raw_data = get_session_cached_raw_data()
-    total_crashes, average_crashes_per_zip, formatted_df_by_area = process_and_format_crash_data(
-        cached_raw_data, area)
-
+    if area not in AREAS:
+        abort(404)
+    date_range = get_last_date_range()
     set_session_area(area)
-    set_session_cached_formatted_data(
-        formatted_df_by_area, total_crashes, average_crashes_per_zip)
-
-    # Ensure the session date range is set
-    if 'start_month' not in session or 'start_year' not in session or 'end_month' not in session or 'end_year' not in session:
-        start_month, start_year = get_latest_month_year()
-        end_month, end_year = get_latest_month_year()
-        set_session_date_range(start_month, start_year, end_month, end_year)
-    else:
-        start_month, start_year, end_month, end_year = get_session_date_range()
+    return redirect(get_view_url('view_area', area, date_range))
+
 
-    return render_template(
+@app.route('/view/<area>/<start>/<end>')
+def view_area(area, start, end):
+    """
+    Display the selected area (borough or citywide) for a date range.
+    The page only depends on its URL, so it is shared by every user, worker and proxy.
+    """
+    if area not in AREAS:
+        abort(404)
+    date_range = parse_url_date_range(start, end)
+    dataset_views = get_url_dataset_views(date_range)
+    total_crashes, average_crashes_per_zip, _ = dataset_views.get_area(area)
+    start_month, start_year, end_month, end_year = date_range
+
+    etag = create_etag(TEMPLATES_VERSION, request.path, dataset_views.version, get_current_year())
+    return make_cached_response(request, etag, lambda: render_template(
         'view_area.html',
         area=area,
+        date_range=date_range,
         total_accidents=total_crashes,
         average_accidents_per_zip=average_crashes_per_zip,
-        decile_table=formatted_df_by_area,
+        decile_table_html=get_decile_table_html(dataset_views, area, date_range),
         years=get_valid_years(),
-        start_year=start_year,
-        end_year=end_year,
-        start_month_name=INT_TO_MONTH[int(start_month)],
-        end_month_name=INT_TO_MONTH[int(end_month)]
-    )
+        months=INT_TO_MONTH,
+        start_month=start_month,
+        start_year=str(start_year),
+        end_month=end_month,
+        end_year=str(end_year),
+        start_month_name=INT_TO_MONTH[start_month],
+        end_month_name=INT_TO_MONTH[end_month]
+    ), compressed_cache, max_age=get_view_max_age(date_range), private=False)
+
+
+@app.route('/view/<area>/<start>/<end>/deciles/<int:decile>')
+def view_decile_rows(area, start, end, decile):
+    """
+    Return the zip code rows of one decile as an HTML fragment, loaded when the decile is expanded.
+    """
+    if area not in AREAS:
+        abort(404)
+    date_range = parse_url_date_range(start, end)
+    dataset_views = get_url_dataset_views(date_range)
 
+    def render():
+        decile_rows_html = result_cache.get_or_load(
+            ('decile_rows', dataset_views.version, area, decile),
+            lambda: render_decile_rows(dataset_views, area, decile))
+        if decile_rows_html is None:
+            abort(404)
+        return decile_rows_html
 
-@app.route('/download', methods=['POST'])
+    etag = create_etag(TEMPLATES_VERSION, request.path, dataset_views.version)
+    return make_cached_response(request, etag, render, compressed_cache,
+                                max_age=get_view_max_age(date_range), private=False)
+
+
+@app.route('/download', methods=['GET', 'POST'])
 def download_crash_data():
-    start_month = request.form.get('start_month')
-    start_year = request.form.get('start_year')
-    end_month = request.form.get('end_month')
-    end_year = request.form.get('end_year')
-
-    area = get_session_area()
-    agg_df = get_session_cached_raw_data()
-    if is_date_range_valid(int(start_month), int(start_year), int(end_month), int(end_year)):
-        agg_df = fetch_and_aggregate_crash_data(
-            start_month, start_year, end_month, end_year, K)
-        set_session_cached_raw_data(agg_df)
-        total_crashes, average_crashes_per_zip, formatted_df_by_area = process_and_format_crash_data(
-            agg_df, area)
-        set_session_cached_formatted_data(
-            formatted_df_by_area, total_crashes, average_crashes_per_zip)
-        set_session_date_range(start_month, start_year, end_month, end_year)
-        return render_template(
-            'view_area.html',
-            area=area,
-            total_accidents=total_crashes,
-            average_accidents_per_zip=average_crashes_per_zip,
-            decile_table=formatted_df_by_area,
-            years=get_valid_years(),
-            start_year=start_year,
-            end_year=end_year,
-            start_month_name=INT_TO_MONTH[int(start_month)],
-            end_month_name=INT_TO_MONTH[int(end_month)]
-        )
-    else:
-        start_month, start_year, end_month, end_year = get_session_date_range()
-        total_crashes, average_crashes_per_zip, formatted_df_by_area = get_session_cached_formatted_data()
-        return render_template(
-            'view_area.html',
-            area=area,
-            total_accidents=total_crashes,
-            average_accidents_per_zip=average_crashes_per_zip,
-            decile_table=formatted_df_by_area,
-            years=get_valid_years(),
-            start_month=start_month,
-            start_year=start_year,
-            end_month=end_month,
-            end_year=end_year,
-            start_month_name=INT_TO_MONTH[int(start_month)],
-            end_month_name=INT_TO_MONTH[int(end_month)]
-        )
+    """
+    Remember the chosen date range and redirect to the canonical URL of the area for it.
+    An invalid range redirects to the range chosen before.
+    """
+    area = request.values.get('area') or session.get('area', 'Citywide')
+    if area not in AREAS:
+        area = 'Citywide'
+    set_session_area(area)
+
+    try:
+        date_range = tuple(int(request.values[name])
+                           for name in ('start_month', 'start_year', 'end_month', 'end_year'))
+    except (KeyError, ValueError):
+        date_range = None
+    if date_range is None or not is_date_range_valid(*date_range):
+        return redirect(get_view_url('view_area', area, get_last_date_range()), code=303)
+
+    set_session_dataset(*date_range)
+    set_session_date_range(*date_range)
+    return redirect(get_view_url('view_area', area, date_range), code=303)
 
 
 @app.route('/years')
 def get_years():
-    return jsonify(get_valid_years())
+    return make_cached_response(
+        request, create_etag(request.path, get_current_year()), lambda: dump_json(get_valid_years()),
+        compressed_cache, max_age=YEARS_MAX_AGE, private=False, mimetype='application/json')
 
 
 @app.route('/view_map/<area>')
 def view_map(area):
-    # Create the heatmap using your function.
-    if 'cached_formatted_data' not in session:
-        flash("Error generating heatmap")
-        return redirect(url_for("view_data", area=area))
-
-    cached_formatted_data = pd.read_json(
-        StringIO(session['cached_formatted_data']))
-    heatmap = create_interactive_heatmap(area, cached_formatted_data)
-    if not heatmap:
-        flash("Error generating heatmap")
-        return redirect(url_for("view_data", area=area))
-
-    heatmap_html = heatmap.get_root().render()  # Render the heatmap to HTML.
-    if not heatmap_html.strip():  # Check if the HTML content is empty.
-        flash("Heatmap HTML is empty")
-        return redirect(url_for("view_data", area=area))
+    """
+    Redirect to the canonical heatmap URL of the area for the date range the session chose last.
+    """
+    if area not in AREAS:
+        abort(404)
+    return redirect(get_view_url('view_area_map', area, get_last_date_range()))
+
+
+@app.route('/view_map/<area>/<start>/<end>')
+def view_area_map(area, start, end):
+    if area not in AREAS:
+        abort(404)
+    date_range = parse_url_date_range(start, end)
+    dataset_views = get_url_dataset_views(date_range)
+
+    etag = create_etag(TEMPLATES_VERSION, request.path, dataset_views.version)
+    return make_cached_response(
+        request, etag, lambda: render_heatmap_page(area, date_range, dataset_views), compressed_cache,
+        max_age=get_view_max_age(date_range), private=False)
+
+
+def render_heatmap_page(area, date_range, dataset_views):
+    """
+    Render the heatmap page of an area, or redirect back to the area when the heatmap fails.
+    The page is shared by every user, so a failure is only logged and never kept in the session.
+    """
+    dataset_key = create_dataset_key(*date_range)
+    heatmap_html = map_cache.get(area, dataset_key, dataset_views.version)
+    if heatmap_html is None:
+        _, _, formatted_df_by_area = dataset_views.get_area(area)
+        heatmap = create_interactive_heatmap(area, formatted_df_by_area)
+        if not heatmap:
+            print(f"Error generating heatmap for {area} {dataset_key}")
+            return redirect(get_view_url('view_area', area, date_range))
+
+        heatmap_html = heatmap.get_root().render()  # Render the heatmap to HTML.
+        if not heatmap_html.strip():  # Check if the HTML content is empty.
+            print(f"Heatmap HTML for {area} {dataset_key} is empty")
+            return redirect(get_view_url('view_area', area, date_range))
+        map_cache.set(area, dataset_key, dataset_views.version, heatmap_html)
 
     return render_template('view_map.html', area=area, heatmap_html=heatmap_html)
 
 
 @app.route('/autocomplete_zipcode')
 def autocomplete_zipcode():
-    if 'cached_raw_data' not in session:
+    if 'dataset_key' not in session:
         get_default_data()
-    cached_raw_data = get_session_cached_raw_data()
+    dataset_views = get_session_dataset_views()
     query = request.args.get('query', '')
-    zipcodes = get_all_unique_zip_codes(
-        cached_raw_data)  # Fetch all unique zip codes
-    matches = [int(zipcode)
-               for zipcode in zipcodes if str(zipcode).startswith(query)]
-    return jsonify(matches)
+    limit = min(max(request.args.get('limit', AUTOCOMPLETE_LIMIT, type=int), 1), AUTOCOMPLETE_MAX_LIMIT)
+
+    # The suggestions only change with the session's dataset
+    etag = create_etag(request.path, dataset_views.version, limit, query)
+    return make_cached_response(
+        request, etag, lambda: dump_json(dataset_views.zip_prefix_index.lookup(query, limit)),
+        compressed_cache, mimetype='application/json')
 
 
 @app.route('/search', methods=['GET'])
 def search_zip():
-    if 'cached_raw_data' not in session:
+    if 'dataset_key' not in session:
         get_default_data()
-    cached_raw_data = get_session_cached_raw_data()
+    dataset_views = get_session_dataset_views()
     # Check if `zipcode` parameter is provided in the request
     zip_code = request.args.get('zipcode')
 
@@ -266,14 +503,8 @@ def search_zip():
         # Redirect to index if zip code is not a valid integer
         return redirect(url_for('index'))
 
-    # Validate the zip code by checking if it exists in the unique zip codes
-    valid_zip_codes = get_all_unique_zip_codes(cached_raw_data)
-    if zip_code not in valid_zip_codes:
-        # Redirect to index if zip code is not found in the dataset
-        return redirect(url_for('index'))
-
-    # Call the search_zip_code function to retrieve data
-    result = search_zip_code(cached_raw_data, zip_code)
+    # Look up the records built with the dataset, None if the zip code is not in the dataset
+    result = dataset_views.get_zip_record(zip_code)
 
     # Check if result is None or citywide_record is missing
     if result is None or result.get("citywide_record") is None:
@@ -288,7 +519,8 @@ def search_zip():
         return redirect(url_for('index'))
 
     # If all data is valid, render the template with all values
-    return render_template(
+    etag = create_etag(TEMPLATES_VERSION, request.path, dataset_views.version, zip_code)
+    return make_cached_response(request, etag, lambda: render_template(
         'view_search.html',
         zip_code=zip_code,
         citywide_record=result["citywide_record"],
@@ -296,8 +528,103 @@ def search_zip():
         borough_highest_rank=result["borough_record"].get("highest_rank"),
         borough_name=borough,
         error=None
-    )
+    ), compressed_cache)
+
+
+def api_error(message, status):
+    response = jsonify({'error': message})
+    response.status_code = status
+    return response
+
+
+def get_api_dataset_views():
+    """
+    Return the date range and views of the dataset an API request asks for with the start and
+    end query parameters as YYYY-MM, end defaulting to start. Without them the default dataset
+    is used. Aborts with a JSON error for an invalid range or when the data is unavailable.
+    """
+    start = request.args.get('start')
+    end = request.args.get('end', start)
+    if start is None:
+        if end is not None:
+            abort(api_error("end requires start", 400))
+        published = default_dataset.get(DEFAULT_DATASET_WAIT_SECONDS)
+        if published is None:
+            abort(api_error("The default dataset is not available yet", 503))
+        return published
+
+    try:
+        start_month, start_year = parse_year_month(start)
+        end_month, end_year = parse_year_month(end)
+    except ValueError as e:
+        abort(api_error(str(e), 400))
+    if not is_date_range_valid(start_month, start_year, end_month, end_year):
+        abort(api_error(f"Invalid date range {start} to {end}", 400))
+
+    date_range = (start_month, start_year, end_month, end_year)
+    dataset_views = get_cached_dataset_views(*date_range)
+    if dataset_views is None:
+        abort(api_error(f"No data is available for {start} to {end}", 503))
+    return date_range, dataset_views
+
+
+def create_api_payload(date_range, dataset_views, **fields):
+    start_month, start_year, end_month, end_year = date_range
+    return {
+        'version': dataset_views.version,
+        'start': format_year_month(start_month, start_year),
+        'end': format_year_month(end_month, end_year),
+        **fields,
+    }
+
+
+def make_api_response(date_range, dataset_views, create_payload):
+    """
+    Send an API payload with an ETag of the dataset version, compressed when it is large.
+    The API does not depend on the session, so shared caches may keep it too.
+    """
+    etag = create_etag(request.path, date_range, dataset_views.version)
+    return make_cached_response(request, etag, lambda: dump_json(create_payload()), compressed_cache,
+                                private=False, mimetype='application/json')
+
+
+@app.route('/api/v1/area/<area>')
+def api_area(area):
+    """
+    Return the ranked table of an area as one array per column.
+    """
+    if area not in AREAS:
+        return api_error(f"Unknown area {area}, expected one of {', '.join(AREAS)}", 404)
+    date_range, dataset_views = get_api_dataset_views()
+    total_crashes, average_crashes_per_zip, _ = dataset_views.get_area(area)
+    return make_api_response(date_range, dataset_views, lambda: create_api_payload(
+        date_range, dataset_views,
+        area=area,
+        total_accidents=int(total_crashes),
+        average_accidents_per_zip=None if math.isnan(average_crashes_per_zip) else float(average_crashes_per_zip),
+        columns=dataset_views.get_area_columns(area)))
+
+
+@app.route('/api/v1/zip/<int:zip_code>')
+def api_zip(zip_code):
+    """
+    Return the citywide and borough rank, decile and accident likelihood of a zip code.
+    """
+    date_range, dataset_views = get_api_dataset_views()
+    record = dataset_views.get_zip_record(zip_code)
+    if record is None:
+        return api_error(f"Zip code {zip_code} is not in the dataset", 404)
+    citywide_record = dict(record['citywide_record'])
+    if not isinstance(citywide_record['borough'], str):
+        citywide_record['borough'] = None
+    return make_api_response(date_range, dataset_views, lambda: create_api_payload(
+        date_range, dataset_views,
+        zip_code=zip_code,
+        citywide_record=citywide_record,
+        borough_record=record['borough_record']))
 
 
 if __name__ == '__main__':
+    warm_up()
+    default_dataset.start()
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
@@ -0,0 +1,399 @@
+"""
+Replays browsing sessions against the app and reports throughput and latency percentiles per route.
+
+    python -m benchmarks.load_test --launch --rows 200k --users 16 --duration 60 --output load.json
+    python -m benchmarks.load_test --url http://localhost:5000 --users 16 --duration 60
+
+With --launch the app is started under gunicorn against tests/stub_server.py, a local stand-in of
+the Carto API serving seeded synthetic records, in a temporary copy of the app, so nothing it
+stores mixes with the data of the real app. With --url an already running app is tested.
+
+Every virtual user keeps its own cookies and repeats the flow of a visitor: the index, an area
+view, expanding a decile, typing a zip code into the autocomplete, searching it, opening the
+heatmap and changing the date range. Like a browser, a user revalidates pages it has seen
+before with If-None-Match.
+"""
+import argparse
+import contextlib
+import html
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import quote, urljoin, urlsplit
+
+import numpy as np
+import requests
+
+from benchmarks.run_benchmarks import get_environment, parse_row_count
+from src.dataset_views import AREAS
+
+RESULTS_VERSION = 1
+
+REQUEST_TIMEOUT = 120
+READY_TIMEOUT = 600
+
+# Longest typed prefix before the visitor picks a suggestion, the debounce skips most keystrokes
+AUTOCOMPLETE_PREFIX_LENGTHS = (1, 3)
+
+# Requests are reported by the route that answered them
+ROUTES = [
+    ('/', re.compile(r'^/$')),
+    ('/view/<area>', re.compile(r'^/view/[^/]+$')),
+    ('/view/<area>/<start>/<end>', re.compile(r'^/view/[^/]+/[^/]+/[^/]+$')),
+    ('/view/<area>/<start>/<end>/deciles/<decile>', re.compile(r'^/view/[^/]+/[^/]+/[^/]+/deciles/\d+$')),
+    ('/view_map/<area>', re.compile(r'^/view_map/[^/]+$')),
+    ('/view_map/<area>/<start>/<end>', re.compile(r'^/view_map/[^/]+/[^/]+/[^/]+$')),
+    ('/autocomplete_zipcode', re.compile(r'^/autocomplete_zipcode$')),
+    ('/search', re.compile(r'^/search$')),
+    ('/download', re.compile(r'^/download$')),
+    ('/years', re.compile(r'^/years$')),
+]
+
+DECILE_URL_PATTERN = re.compile(r'data-url="([^"]+)"')
+
+# What --launch copies of the repository, everything the app writes goes next to these
+APP_FILES = ['app.py', 'gunicorn.conf.py']
+APP_DIRS = ['src', 'templates', 'static', os.path.join('data', 'nyc_shapefile')]
+REPOSITORY_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+
+def get_route_label(url):
+    path = urlsplit(url).path
+    for label, pattern in ROUTES:
+        if pattern.match(path):
+            return label
+    return path
+
+
+class VirtualUser:
+    """
+    One visitor with its own cookies, recording (route, status, seconds) of every request it makes.
+    A status of None is a request that failed without a response.
+    """
+
+    def __init__(self, base_url, rng, months, think_time=0.0, timeout=REQUEST_TIMEOUT):
+        self.base_url = base_url
+        self.rng = rng
+        self.months = months
+        self.think_time = think_time
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.seen = {}  # url to (etag, body) of the responses a browser would have cached
+        self.samples = []
+
+    def get(self, url, params=None):
+        """
+        Make one request, revalidating a cached body, and return (status, headers, body).
+        """
+        url = urljoin(self.base_url, url)
+        request = self.session.prepare_request(requests.Request('GET', url, params=params))
+        cached = self.seen.get(request.url)
+        if cached is not None:
+            request.headers['If-None-Match'] = cached[0]
+
+        start = time.perf_counter()
+        try:
+            response = self.session.send(request, allow_redirects=False, timeout=self.timeout)
+            status, headers, body = response.status_code, response.headers, response.text
+        except requests.exceptions.RequestException:
+            status, headers, body = None, {}, ''
+        self.samples.append((get_route_label(url), status, time.perf_counter() - start))
+
+        if status == 304 and cached is not None:
+            body = cached[1]
+        elif status == 200 and 'ETag' in headers:
+            self.seen[request.url] = (headers['ETag'], body)
+        if self.think_time:
+            time.sleep(self.rng.uniform(0, 2 * self.think_time))
+        return status, headers, body
+
+    def follow(self, url, params=None):
+        """
+        Make a request and follow its redirects, the way the browser does.
+        """
+        status, headers, body = self.get(url, params)
+        while status in (301, 302, 303, 307, 308) and 'Location' in headers:
+            status, headers, body = self.get(headers['Location'])
+        return status, headers, body
+
+    def choose_date_range(self):
+        first, second = sorted(self.rng.sample(range(len(self.months)), 2)) if len(self.months) > 1 else (0, 0)
+        (start_year, start_month), (end_year, end_month) = self.months[first], self.months[second]
+        return {'start_month': start_month, 'start_year': start_year, 'end_month': end_month, 'end_year': end_year}
+
+    def run_flow(self):
+        self.follow('/')
+        area = self.rng.choice(AREAS)
+        _, _, page = self.follow(f"/view/{quote(area)}")
+
+        decile_urls = DECILE_URL_PATTERN.findall(page)
+        if decile_urls:
+            self.get(html.unescape(self.rng.choice(decile_urls)))
+
+        status, _, body = self.get('/autocomplete_zipcode', {'query': '1', 'limit': 10})
+        suggestions = json.loads(body) if status in (200, 304) and body else []
+        if suggestions:
+            zip_code = str(self.rng.choice(suggestions))
+            for length in AUTOCOMPLETE_PREFIX_LENGTHS[1:]:
+                self.get('/autocomplete_zipcode', {'query': zip_code[:length], 'limit': 10})
+            self.follow('/search', {'zipcode': zip_code})
+
+        self.follow(f"/view_map/{quote(area)}")
+        self.follow('/download', {'area': area, **self.choose_date_range()})
+
+
+def run_user(user, deadline, errors):
+    while time.monotonic() < deadline:
+        try:
+            user.run_flow()
+        except (ValueError, KeyError) as e:  # an unexpected body, keep going with the next flow
+            errors.append(f"{type(e).__name__}: {e}")
+
+
+def run_load_test(base_url, months, users=8, duration=60.0, ramp_up=0.0, think_time=0.0, seed=0,
+                  timeout=REQUEST_TIMEOUT):
+    """
+    Replay the flow with concurrent users for duration seconds.
+
+    Parameters:
+    base_url (str): URL of the running app
+    months (list): (year, month) pairs the users choose date ranges from
+    users (int): Number of concurrent virtual users
+    duration (float): Seconds to keep starting flows, flows running at the end are finished
+    ramp_up (float): Seconds over which the users start
+    think_time (float): Mean seconds a user waits after every request
+    seed (int): Seed of the users' choices
+    timeout (float): Seconds before a request counts as failed
+
+    Returns:
+    tuple: (list of (route, status, seconds) samples, elapsed seconds, list of flow errors)
+    """
+    virtual_users = [VirtualUser(base_url, random.Random(seed * 1_000_003 + index), months, think_time, timeout)
+                     for index in range(users)]
+    errors = []
+    start = time.monotonic()
+    deadline = start + ramp_up + duration
+    threads = []
+    for index, user in enumerate(virtual_users):
+        if ramp_up and index:
+            time.sleep(ramp_up / users)
+        thread = threading.Thread(target=run_user, args=(user, deadline, errors), daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+    return [sample for user in virtual_users for sample in user.samples], elapsed, errors
+
+
+def summarize_latencies(route, statuses, seconds, elapsed):
+    latencies = np.array(seconds) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (None, None, None)
+    return {
+        'route': route,
+        'requests': len(latencies),
+        'errors': sum(1 for status in statuses if status is None or status >= 400),
+        'not_modified': sum(1 for status in statuses if status == 304),
+        'throughput_rps': len(latencies) / elapsed if elapsed else None,
+        'mean_ms': float(latencies.mean()) if len(latencies) else None,
+        'p50_ms': None if p50 is None else float(p50),
+        'p95_ms': None if p95 is None else float(p95),
+        'p99_ms': None if p99 is None else float(p99),
+        'max_ms': float(latencies.max()) if len(latencies) else None,
+    }
+
+
+def summarize(samples, elapsed):
+    """
+    Summarize samples per route in ROUTES order, followed by a row of every request.
+
+    Returns:
+    list: One dictionary per route with request, error and 304 counts, throughput in requests
+          per second and latency percentiles in milliseconds
+    """
+    by_route = {}
+    for route, status, seconds in samples:
+        route_statuses, route_seconds = by_route.setdefault(route, ([], []))
+        route_statuses.append(status)
+        route_seconds.append(seconds)
+
+    order = {label: position for position, (label, _) in enumerate(ROUTES)}
+    summary = [summarize_latencies(route, statuses, seconds, elapsed)
+               for route, (statuses, seconds) in sorted(by_route.items(),
+                                                        key=lambda item: (order.get(item[0], len(order)), item[0]))]
+    summary.append(summarize_latencies('all', [status for _, status, _ in samples],
+                                       [seconds for _, _, seconds in samples], elapsed))
+    return summary
+
+
+def format_summary(summary):
+    lines = [f"{'route':<46}{'requests':>9}{'errors':>8}{'304':>7}{'req/s':>9}"
+             f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"]
+    for row in summary:
+        if not row['requests']:
+            continue
+        lines.append(f"{row['route']:<46}{row['requests']:>9,}{row['errors']:>8,}{row['not_modified']:>7,}"
+                     f"{row['throughput_rps']:>9.1f}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+    return '\n'.join(lines)
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def copy_app(target_dir):
+    for file_name in APP_FILES:
+        shutil.copy(os.path.join(REPOSITORY_DIR, file_name), target_dir)
+    for dir_name in APP_DIRS:
+        shutil.copytree(os.path.join(REPOSITORY_DIR, dir_name), os.path.join(target_dir, dir_name),
+                        ignore=shutil.ignore_patterns('__pycache__'))
+
+
+def wait_until_ready(base_url, process, log_path, timeout=READY_TIMEOUT):
+    """
+    Wait until the app answers its index page, which needs the default dataset.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            if requests.get(base_url, timeout=REQUEST_TIMEOUT).status_code == 200:
+                return
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(1)
+    with open(log_path, errors='replace') as file:
+        log_tail = ''.join(file.readlines()[-40:])
+    raise RuntimeError(f"The app did not start within {timeout} seconds:\n{log_tail}")
+
+
+@contextlib.contextmanager
+def launch_app(stub, port=None, workers=4, page_size=None, log_path=None):
+    """
+    Run the app under gunicorn with gunicorn.conf.py, fetching from the stub, in a temporary copy
+    of the repository.
+
+    Parameters:
+    stub (StubCrashApi): The started stand-in of the Carto API
+    port (int): Port of the app, a free port if None
+    workers (int): Number of gunicorn workers
+    page_size (int): Records per page the app fetches, the app's default if None
+    log_path (str): File for the app's output, a file in the temporary copy if None
+
+    Yields:
+    str: The URL of the app
+    """
+    port = port or get_free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as app_dir:
+        copy_app(app_dir)
+        env = dict(os.environ, CRASH_DATA_SOURCE='carto', CARTO_SQL_URL=stub.carto_url,
+                   SOCRATA_URL=stub.socrata_url, PORT=str(port), WEB_CONCURRENCY=str(workers))
+        if page_size:
+            env['CRASH_DATA_PAGE_SIZE'] = str(page_size)
+        log_path = log_path or os.path.join(app_dir, 'app.log')
+        with open(log_path, 'w') as log_file:
+            process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+                                       cwd=app_dir, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+            try:
+                wait_until_ready(base_url, process, log_path)
+                yield base_url
+            finally:
+                process.terminate()
+                try:
+                    process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+
+
+def main(argv=None):
+    from tests.stub_server import StubCrashApi, get_recent_months
+    from src.data_fetching import get_months_in_range
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help="URL of a running app")
+    target.add_argument('--launch', action='store_true', help="Start the app under gunicorn against the stub")
+    parser.add_argument('--users', type=int, default=8, help="Concurrent virtual users")
+    parser.add_argument('--duration', type=float, default=60.0, help="Seconds to run after the ramp-up")
+    parser.add_argument('--ramp-up', type=float, default=0.0, help="Seconds over which the users start")
+    parser.add_argument('--think-time', type=float, default=0.0, help="Mean seconds users wait between requests")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--months', type=int, default=12,
+                        help="Months up to the latest month that date changes choose from, and the stub serves")
+    parser.add_argument('--rows', default='100k', help="Synthetic records the stub serves, with --launch")
+    parser.add_argument('--workers', type=int, default=4, help="gunicorn workers, with --launch")
+    parser.add_argument('--port', type=int, help="Port of the app, a free port if not given, with --launch")
+    parser.add_argument('--page-size', type=int, help="Records per page the app fetches, with --launch")
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds the stub adds to every response")
+    parser.add_argument('--latency-jitter', type=float, default=0.05, help="Up to this many more seconds")
+    parser.add_argument('--latency-per-row', type=float, default=0.0, help="Seconds the stub adds per row")
+    parser.add_argument('--app-log', help="Write the output of the launched app to this file")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    start_month, start_year, end_month, end_year = get_recent_months(args.months)
+    months = get_months_in_range(start_month, start_year, end_month, end_year)
+    parameters = {key: value for key, value in vars(args).items() if key not in ('output', 'app_log')}
+
+    with contextlib.ExitStack() as stack:
+        stub = None
+        base_url = args.url
+        if args.launch:
+            start = time.perf_counter()
+            stub = StubCrashApi.from_synthetic(
+                parse_row_count(args.rows), seed=args.seed, start_month=start_month, start_year=start_year,
+                end_month=end_month, end_year=end_year, latency=args.latency, latency_jitter=args.latency_jitter,
+                latency_per_row=args.latency_per_row).start()
+            stack.callback(stub.stop)
+            print(f"Serving {args.rows} synthetic records at {stub.carto_url} "
+                  f"after {time.perf_counter() - start:0.1f} seconds", file=sys.stderr)
+
+            start = time.perf_counter()
+            base_url = stack.enter_context(launch_app(stub, args.port, args.workers, args.page_size, args.app_log))
+            print(f"Started the app at {base_url} with {args.workers} workers "
+                  f"after {time.perf_counter() - start:0.1f} seconds", file=sys.stderr)
+        upstream_requests_before = len(stub.requests) if stub else None
+
+        print(f"Running {args.users} users for {args.duration:g} seconds", file=sys.stderr)
+        samples, elapsed, errors = run_load_test(
+            base_url, months, users=args.users, duration=args.duration, ramp_up=args.ramp_up,
+            think_time=args.think_time, seed=args.seed)
+        upstream_requests = len(stub.requests) - upstream_requests_before if stub else None
+
+    summary = summarize(samples, elapsed)
+    print(format_summary(summary), file=sys.stderr)
+    for error in sorted(set(errors)):
+        print(f"Flow error: {error}", file=sys.stderr)
+
+    report = {
+        'version': RESULTS_VERSION,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': get_environment(),
+        'parameters': parameters,
+        'elapsed_seconds': elapsed,
+        'upstream_requests': upstream_requests,
+        'flow_errors': len(errors),
+        'routes': summary,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    return 0 if summary[-1]['errors'] == 0 and not errors else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
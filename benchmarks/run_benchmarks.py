@@ -0,0 +1,268 @@
+"""
+Times every stage of the crash data pipeline on synthetic records and writes the results as JSON.
+
+    python -m benchmarks.run_benchmarks --rows 10k 100k 1M 10M --output results.json
+    python -m benchmarks.run_benchmarks --rows 10k 100k --baseline results.json
+
+Each stage is run --repeat times on a fresh copy of its input and the fastest wall time is kept,
+then once more under tracemalloc for its peak memory. With --baseline the results are compared
+with an earlier run and the command exits with status 1 when a stage got slower or used more
+memory than the allowed tolerance.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_data import (MISSING_BOROUGH_RATE, MISSING_COORDINATES_RATE, MISSING_ZIP_RATE,
+                                       PARTIAL_COORDINATES_RATE, generate_crash_records)
+from src import data_cleaning
+from src.data_cleaning import aggregate_and_format_data, fill_missing_data, preprocess_dataframe, process_and_format_crash_data
+from src.heatmap_generation import create_interactive_heatmap
+from src.reference_index import ReferenceIndex
+
+RESULTS_VERSION = 1
+
+DEFAULT_ROWS = ['10k', '100k', '1M', '10M']
+DEFAULT_REPEAT = 3
+K = 5  # Number of neighbors, as in app.py
+
+# Differences below these are noise rather than regressions
+MIN_COMPARED_SECONDS = 0.005
+MIN_COMPARED_BYTES = 1024 * 1024
+
+ROW_SUFFIXES = {'k': 1_000, 'm': 1_000_000}
+
+
+def parse_row_count(value):
+    """
+    Parse a row count such as 10000, 10k or 10M.
+    """
+    value = value.strip().lower()
+    if value and value[-1] in ROW_SUFFIXES:
+        return int(float(value[:-1]) * ROW_SUFFIXES[value[-1]])
+    return int(value)
+
+
+def render_heatmap(formatted_df):
+    heatmap = create_interactive_heatmap('Citywide', formatted_df)
+    return heatmap.get_root().render()
+
+
+# Every stage takes the output of the stage before it, in the order the app runs them
+STAGES = [
+    ('preprocess_dataframe', preprocess_dataframe),
+    ('fill_missing_data', lambda df: fill_missing_data(df, K)),
+    ('aggregate_and_format_data', aggregate_and_format_data),
+    ('process_and_format_crash_data', lambda agg_df: process_and_format_crash_data(agg_df)[2]),
+    ('create_interactive_heatmap', render_heatmap),
+]
+
+
+def copy_input(value):
+    return value.copy() if isinstance(value, pd.DataFrame) else value
+
+
+def measure_stage(function, stage_input, repeat, measure_memory):
+    """
+    Run a stage repeat times for its wall time and once under tracemalloc for its peak memory.
+    The input is copied before every run, outside the measurement, since stages modify it.
+
+    Returns:
+    tuple: (output of the last run, list of wall times in seconds, peak memory in bytes or None)
+    """
+    wall_times = []
+    output = None
+    for _ in range(repeat):
+        run_input = copy_input(stage_input)
+        start = time.perf_counter()
+        output = function(run_input)
+        wall_times.append(time.perf_counter() - start)
+
+    peak_memory = None
+    if measure_memory:
+        run_input = copy_input(stage_input)
+        tracemalloc.start()
+        try:
+            function(run_input)
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return output, wall_times, peak_memory
+
+
+def run_benchmarks(row_counts, repeat=DEFAULT_REPEAT, seed=0, stages=None, measure_memory=True, verbose=False,
+                   **generator_options):
+    """
+    Time the pipeline stages on synthetic records of every row count.
+
+    Zip codes are filled without the persisted reference index, from the generated records
+    only, so results do not depend on what earlier runs of the app stored.
+
+    Parameters:
+    row_counts (list): The numbers of records to generate
+    repeat (int): Timed runs per stage, the fastest is reported
+    seed (int): Seed of the record generator
+    stages (list): Names of the stages to report, every stage if None
+    measure_memory (bool): Whether to run every stage once more under tracemalloc
+    verbose (bool): Whether to show what the stages print
+    generator_options: Missing value rates passed to generate_crash_records
+
+    Returns:
+    list: One dictionary per stage and row count
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as reference_dir, \
+            mock.patch.object(data_cleaning, 'get_reference_index', return_value=ReferenceIndex(reference_dir)):
+        for row_count in row_counts:
+            start = time.perf_counter()
+            stage_input = generate_crash_records(row_count, seed=seed, **generator_options)
+            print(f"Generated {row_count:,} records in {time.perf_counter() - start:0.2f} seconds", file=sys.stderr)
+
+            for name, function in STAGES:
+                output_capture = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+                with output_capture:
+                    stage_output, wall_times, peak_memory = measure_stage(
+                        function, stage_input, repeat, measure_memory)
+                if stages is None or name in stages:
+                    results.append({
+                        'stage': name,
+                        'rows': row_count,
+                        'wall_seconds': min(wall_times),
+                        'wall_seconds_runs': wall_times,
+                        'peak_memory_bytes': peak_memory,
+                    })
+                    print(format_result(results[-1]), file=sys.stderr)
+                stage_input = stage_output
+    return results
+
+
+def format_result(result):
+    memory = result['peak_memory_bytes']
+    memory_text = '' if memory is None else f"{memory / 2 ** 20:10.1f} MiB"
+    return f"{result['stage']:<32}{result['rows']:>12,}{result['wall_seconds']:12.4f} s{memory_text}"
+
+
+def get_environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'commit': commit,
+    }
+
+
+def compare_results(baseline, results, max_slowdown, max_memory_growth):
+    """
+    Compare results with the results of an earlier run on the same stages and row counts.
+
+    Parameters:
+    baseline (list): The results of the earlier run
+    results (list): The results of this run
+    max_slowdown (float): Allowed relative growth of the wall time, 0.25 allows 25% slower
+    max_memory_growth (float): Allowed relative growth of the peak memory
+
+    Returns:
+    list: A description of every regression, empty if there are none
+    """
+    baseline_by_key = {(result['stage'], result['rows']): result for result in baseline}
+    regressions = []
+    for result in results:
+        previous = baseline_by_key.get((result['stage'], result['rows']))
+        if previous is None:
+            continue
+        label = f"{result['stage']} at {result['rows']:,} rows"
+
+        if max(previous['wall_seconds'], result['wall_seconds']) >= MIN_COMPARED_SECONDS \
+                and result['wall_seconds'] > previous['wall_seconds'] * (1 + max_slowdown):
+            regressions.append(f"{label} took {result['wall_seconds']:.4f} s, "
+                               f"baseline {previous['wall_seconds']:.4f} s")
+
+        memory, previous_memory = result.get('peak_memory_bytes'), previous.get('peak_memory_bytes')
+        if memory is not None and previous_memory is not None \
+                and max(memory, previous_memory) >= MIN_COMPARED_BYTES \
+                and memory > previous_memory * (1 + max_memory_growth):
+            regressions.append(f"{label} peaked at {memory / 2 ** 20:.1f} MiB, "
+                               f"baseline {previous_memory / 2 ** 20:.1f} MiB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', nargs='+', default=DEFAULT_ROWS, help="Row counts such as 10k 1M")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="Timed runs per stage")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stages', nargs='+', choices=[name for name, _ in STAGES],
+                        help="Only report these stages, the stages before them still run")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc runs")
+    parser.add_argument('--missing-zip-rate', type=float, default=MISSING_ZIP_RATE)
+    parser.add_argument('--missing-borough-rate', type=float, default=MISSING_BOROUGH_RATE)
+    parser.add_argument('--missing-coordinates-rate', type=float, default=MISSING_COORDINATES_RATE)
+    parser.add_argument('--partial-coordinates-rate', type=float, default=PARTIAL_COORDINATES_RATE)
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    parser.add_argument('--baseline', help="Results of an earlier run to compare with")
+    parser.add_argument('--max-slowdown', type=float, default=0.25)
+    parser.add_argument('--max-memory-growth', type=float, default=0.25)
+    parser.add_argument('--verbose', action='store_true', help="Show what the stages print")
+    args = parser.parse_args(argv)
+
+    generator_options = {
+        'missing_zip_rate': args.missing_zip_rate,
+        'missing_borough_rate': args.missing_borough_rate,
+        'missing_coordinates_rate': args.missing_coordinates_rate,
+        'partial_coordinates_rate': args.partial_coordinates_rate,
+    }
+    row_counts = [parse_row_count(value) for value in args.rows]
+    results = run_benchmarks(row_counts, repeat=args.repeat, seed=args.seed, stages=args.stages,
+                             measure_memory=not args.no_memory, verbose=args.verbose, **generator_options)
+
+    report = {
+        'version': RESULTS_VERSION,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': get_environment(),
+        'parameters': {'repeat': args.repeat, 'seed': args.seed, 'k': K, **generator_options},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline.get('parameters', {}) != report['parameters']:
+            print("Warning: the baseline was run with different parameters", file=sys.stderr)
+        regressions = compare_results(baseline['results'], results, args.max_slowdown, args.max_memory_growth)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+        print("No regressions against the baseline", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
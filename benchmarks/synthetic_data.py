@@ -0,0 +1,162 @@
+"""
+Seeded generator of synthetic NYC crash records shaped like the rows the data sources return:
+zip_code, borough, crash_count, latitude, longitude, year and month.
+
+Crash locations are sampled inside the zip code polygons of the shapefile, so zip codes,
+boroughs and coordinates agree the way real records do. Zip codes, boroughs and coordinates
+are then removed independently at configurable rates to exercise every missingness
+combination the cleaning pipeline handles.
+"""
+import numpy as np
+import pandas as pd
+import shapely
+
+from src.data_fetching import get_months_in_range
+from src.geometry_registry import UNASSIGNED_ZIP_CODE, get_zip_geometry_registry
+
+RECORD_COLUMNS = ['zip_code', 'borough', 'crash_count', 'latitude', 'longitude', 'year', 'month']
+
+# Default shares of records missing each kind of locational data, override them to model other data
+MISSING_ZIP_RATE = 0.12
+MISSING_BOROUGH_RATE = 0.10
+MISSING_COORDINATES_RATE = 0.07
+# Records with only one of latitude and longitude, which the pipeline drops
+PARTIAL_COORDINATES_RATE = 0.001
+
+# NYC zip codes are assigned to boroughs by their first three digits
+ZIP_PREFIX_TO_BOROUGH = {
+    '100': 'Manhattan',
+    '101': 'Manhattan',
+    '102': 'Manhattan',
+    '103': 'Staten Island',
+    '104': 'The Bronx',
+    '110': 'Queens',
+    '111': 'Queens',
+    '112': 'Brooklyn',
+    '113': 'Queens',
+    '114': 'Queens',
+    '116': 'Queens',
+}
+
+
+# CrashMapper writes the Bronx without the article
+SOURCE_BOROUGH_NAMES = {'The Bronx': 'Bronx'}
+
+
+def get_zip_polygons(registry=None):
+    """
+    Return the zip codes, boroughs and polygons of every real zip code in the shapefile.
+    """
+    if registry is None:
+        registry = get_zip_geometry_registry()
+    rows = np.flatnonzero(registry.zip_codes != UNASSIGNED_ZIP_CODE)
+    zip_codes = registry.zip_codes[rows]
+    boroughs = [ZIP_PREFIX_TO_BOROUGH.get(zip_code[:3]) for zip_code in zip_codes]
+    boroughs = np.array([SOURCE_BOROUGH_NAMES.get(borough, borough) for borough in boroughs], dtype=object)
+    return zip_codes.astype(np.int64), boroughs, registry.zip_gdf.geometry.values[rows]
+
+
+def sample_points_in_polygon(polygon, count, rng):
+    """
+    Sample count points uniformly inside a polygon by rejection sampling in its bounding box.
+
+    Returns:
+    tuple: (longitudes, latitudes) as float64 arrays
+    """
+    min_x, min_y, max_x, max_y = polygon.bounds
+    fill_ratio = max(polygon.area / ((max_x - min_x) * (max_y - min_y)), 0.05)
+    shapely.prepare(polygon)
+    longitudes, latitudes = [], []
+    remaining = count
+    while remaining > 0:
+        candidates = int(remaining / fill_ratio * 1.2) + 16
+        x = rng.uniform(min_x, max_x, candidates)
+        y = rng.uniform(min_y, max_y, candidates)
+        inside = shapely.contains_xy(polygon, x, y)
+        longitudes.append(x[inside][:remaining])
+        latitudes.append(y[inside][:remaining])
+        remaining -= len(longitudes[-1])
+    return np.concatenate(longitudes), np.concatenate(latitudes)
+
+
+def generate_crash_records(row_count, seed=0, start_month=1, start_year=2024, end_month=12, end_year=2024,
+                           missing_zip_rate=MISSING_ZIP_RATE, missing_borough_rate=MISSING_BOROUGH_RATE,
+                           missing_coordinates_rate=MISSING_COORDINATES_RATE,
+                           partial_coordinates_rate=PARTIAL_COORDINATES_RATE, registry=None):
+    """
+    Generate row_count crash records. The same arguments always produce the same records.
+
+    Crashes are spread over the zip codes with skewed weights, like real crash counts, and
+    evenly over the months of the date range.
+
+    Parameters:
+    row_count (int): The number of records
+    seed (int): Seed of the random generator
+    start_month, start_year, end_month, end_year (int): The months the records fall in
+    missing_zip_rate (float): Share of records without a zip code
+    missing_borough_rate (float): Share of records without a borough
+    missing_coordinates_rate (float): Share of records without latitude and longitude
+    partial_coordinates_rate (float): Share of records with only one of latitude and longitude
+    registry (ZipGeometryRegistry): The zip code polygons, the shared registry if None
+
+    Returns:
+    pd.DataFrame: The records with RECORD_COLUMNS, missing values as NaN or None like the
+                  DataFrames built from the data source's JSON
+    """
+    rng = np.random.default_rng(seed)
+    zip_codes, boroughs, polygons = get_zip_polygons(registry)
+
+    # Skewed like real crash counts: a few zip codes have many times the crashes of most
+    weights = rng.lognormal(mean=0.0, sigma=0.8, size=len(polygons))
+    counts = rng.multinomial(row_count, weights / weights.sum())
+
+    polygon_rows = np.repeat(np.arange(len(polygons)), counts)
+    longitudes = np.empty(row_count)
+    latitudes = np.empty(row_count)
+    position = 0
+    for row, count in enumerate(counts):
+        if count:
+            longitudes[position:position + count], latitudes[position:position + count] = \
+                sample_points_in_polygon(polygons[row], count, rng)
+            position += count
+
+    # Records arrive in no particular zip code order
+    order = rng.permutation(row_count)
+    polygon_rows, longitudes, latitudes = polygon_rows[order], longitudes[order], latitudes[order]
+
+    zip_column = zip_codes[polygon_rows].astype(np.float64)
+    zip_column[rng.random(row_count) < missing_zip_rate] = np.nan
+    borough_column = boroughs[polygon_rows]
+    borough_column[rng.random(row_count) < missing_borough_rate] = None
+
+    no_coordinates = rng.random(row_count) < missing_coordinates_rate
+    latitudes[no_coordinates] = np.nan
+    longitudes[no_coordinates] = np.nan
+    partial = ~no_coordinates & (rng.random(row_count) < partial_coordinates_rate)
+    longitudes[partial] = np.nan
+
+    months = get_months_in_range(start_month, start_year, end_month, end_year)
+    month_rows = rng.integers(0, len(months), row_count)
+    years = np.array([year for year, _ in months], dtype=np.int64)
+    month_numbers = np.array([month for _, month in months], dtype=np.int64)
+
+    return pd.DataFrame({
+        'zip_code': zip_column,
+        'borough': pd.array(borough_column, dtype='str'),
+        'crash_count': 1 + rng.binomial(2, 0.03, row_count),
+        'latitude': np.round(latitudes, 6),
+        'longitude': np.round(longitudes, 6),
+        'year': years[month_rows],
+        'month': month_numbers[month_rows],
+    }, columns=RECORD_COLUMNS)
+
+
+def to_records(df):
+    """
+    Convert generated records to the dictionaries a data source page holds, None for missing values.
+    """
+    records = df.astype(object).where(df.notna(), None).to_dict('records')
+    for record in records:
+        if record['zip_code'] is not None:
+            record['zip_code'] = int(record['zip_code'])
+    return records
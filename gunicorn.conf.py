@@ -0,0 +1,21 @@
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", 4))
+
+# Import app.py once in the master, and warm it up there before the workers are forked,
+# so every worker starts with the zip geometry and the default dataset already loaded
+preload_app = True
+
+
+def on_starting(server):
+    # The HTTP connections warm-up opens stay in the master, every forked worker drops the
+    # inherited session and opens its own, see src.data_sources.reset_http_session
+    from app import warm_up
+    warm_up()
+
+
+def post_fork(server, worker):
+    # Threads do not survive the fork, every worker runs its own default dataset refresher
+    from app import default_dataset
+    default_dataset.start()
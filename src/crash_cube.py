@@ -0,0 +1,178 @@
+import threading
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from src.data_fetching import EARLIEST_DATE
+from src.data_storage import fetch_month_file, list_stored_months
+
+# The arrays of a cube are replaced together, so readers never mix two versions
+CubeState = namedtuple('CubeState', [
+    'zip_codes', 'boroughs', 'counts', 'has_rows', 'crash_prefix_sums', 'row_prefix_sums', 'month_prefix_sums'])
+
+
+def get_month_index(month, year):
+    """
+    Return the position of a month on the month axis of the cube, 0 for EARLIEST_DATE.
+    """
+    return (int(year) - EARLIEST_DATE.year) * 12 + int(month) - EARLIEST_DATE.month
+
+
+def create_prefix_sums(values):
+    """
+    Cumulative sums along the last axis with a leading zero, so the sum over positions
+    start to end inclusive is prefix_sums[..., end + 1] - prefix_sums[..., start].
+    """
+    prefix_sums = np.zeros(values.shape[:-1] + (values.shape[-1] + 1,), dtype=np.int64)
+    np.cumsum(values, axis=-1, out=prefix_sums[..., 1:])
+    return prefix_sums
+
+
+def create_state(zip_codes, boroughs, counts, has_rows, has_month):
+    return CubeState(zip_codes, boroughs, counts, has_rows, create_prefix_sums(counts),
+                     create_prefix_sums(has_rows), create_prefix_sums(has_month))
+
+
+class CrashCube:
+    """
+    Crash counts of every (zip code, borough) pair in every month since EARLIEST_DATE, with
+    cumulative sums along the month axis, so the totals of any contiguous range of months
+    take one vectorized subtraction instead of a groupby over the monthly rows.
+
+    Months are added once they are final; sum_range and aggregate only answer for ranges
+    whose months have all been added, which covers_range checks in constant time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._has_month = np.zeros(0, dtype=np.int64)
+        self._state = create_state(np.empty(0, dtype=np.int64), np.empty(0, dtype=object),
+                                   np.zeros((0, 0), dtype=np.int64), np.zeros((0, 0), dtype=np.int64),
+                                   self._has_month)
+
+    def add_months(self, monthly_dfs):
+        """
+        Add months of cleaned crash counts and rebuild the prefix sums.
+
+        Parameters:
+        monthly_dfs (dict): (year, month) to a DataFrame with 'zip_code', 'borough' and 'crash_count'
+        """
+        if not monthly_dfs:
+            return
+        with self._lock:
+            state = self._state
+            month_indices = [get_month_index(month, year) for year, month in monthly_dfs]
+            n_months = max(len(self._has_month), max(month_indices) + 1)
+
+            new_rows = pd.concat(
+                [df.assign(month_index=index)[['zip_code', 'borough', 'crash_count', 'month_index']]
+                 for index, df in zip(month_indices, monthly_dfs.values())],
+                ignore_index=True).dropna(subset=['zip_code', 'borough'])
+
+            # Keys in the order groupby would sort them
+            keys = pd.concat([
+                pd.DataFrame({'zip_code': state.zip_codes, 'borough': state.boroughs}),
+                new_rows[['zip_code', 'borough']],
+            ], ignore_index=True).drop_duplicates().sort_values(['zip_code', 'borough'], ignore_index=True)
+            key_index = pd.MultiIndex.from_frame(keys)
+
+            counts = np.zeros((len(keys), n_months), dtype=np.int64)
+            has_rows = np.zeros((len(keys), n_months), dtype=np.int64)
+            old_rows = key_index.get_indexer(pd.MultiIndex.from_arrays([state.zip_codes, state.boroughs]))
+            counts[old_rows, :state.counts.shape[1]] = state.counts
+            has_rows[old_rows, :state.has_rows.shape[1]] = state.has_rows
+
+            # Months that are added again replace their earlier counts
+            replaced = np.array(month_indices)
+            counts[:, replaced] = 0
+            has_rows[:, replaced] = 0
+            rows = key_index.get_indexer(pd.MultiIndex.from_frame(new_rows[['zip_code', 'borough']]))
+            columns = new_rows['month_index'].to_numpy()
+            np.add.at(counts, (rows, columns), new_rows['crash_count'].to_numpy(dtype=np.int64))
+            has_rows[rows, columns] = 1
+
+            has_month = np.zeros(n_months, dtype=np.int64)
+            has_month[:len(self._has_month)] = self._has_month
+            has_month[replaced] = 1
+            self._has_month = has_month
+            self._state = create_state(keys['zip_code'].to_numpy(dtype=np.int64),
+                                       keys['borough'].to_numpy(dtype=object), counts, has_rows, has_month)
+
+    def has_month(self, month, year):
+        return self.covers_range(month, year, month, year)
+
+    def covers_range(self, start_month, start_year, end_month, end_year):
+        """
+        Check in constant time whether every month of a range has been added.
+        """
+        state = self._state
+        start = get_month_index(start_month, start_year)
+        end = get_month_index(end_month, end_year)
+        if start < 0 or end < start or end + 1 >= len(state.month_prefix_sums):
+            return False
+        return int(state.month_prefix_sums[end + 1] - state.month_prefix_sums[start]) == end - start + 1
+
+    def sum_range(self, start_month, start_year, end_month, end_year):
+        """
+        Sum the crashes of every (zip code, borough) pair over a range of added months.
+
+        Returns:
+        pd.DataFrame: 'zip_code', 'borough' and 'crash_count' of the pairs with crashes in the range,
+                      sorted by zip code and borough
+        """
+        state = self._state
+        start = max(get_month_index(start_month, start_year), 0)
+        end = min(get_month_index(end_month, end_year), state.counts.shape[1] - 1)
+        if end < start:
+            return pd.DataFrame({'zip_code': np.empty(0, dtype=np.int64),
+                                 'borough': np.empty(0, dtype=object), 'crash_count': np.empty(0, dtype=np.int64)})
+
+        totals = state.crash_prefix_sums[:, end + 1] - state.crash_prefix_sums[:, start]
+        has_rows = state.row_prefix_sums[:, end + 1] - state.row_prefix_sums[:, start] > 0
+        return pd.DataFrame({
+            'zip_code': state.zip_codes[has_rows],
+            'borough': state.boroughs[has_rows],
+            'crash_count': totals[has_rows],
+        })
+
+    def aggregate(self, start_month, start_year, end_month, end_year):
+        """
+        Same result as aggregate_crashes_by_zip over the monthly rows of the range.
+
+        Returns:
+        pd.DataFrame: 'zip_code', 'borough', 'total_crashes' sorted by total_crashes in descending order
+        """
+        aggregated_df = self.sum_range(start_month, start_year, end_month, end_year).rename(
+            columns={'crash_count': 'total_crashes'})
+        return aggregated_df.sort_values(by='total_crashes', ascending=False)
+
+
+def load_crash_cube():
+    """
+    Build a cube from every month in the month store.
+    """
+    cube = CrashCube()
+    monthly_dfs = {}
+    for year, month in list_stored_months():
+        month_df = fetch_month_file(month, year)
+        if month_df is not None:
+            monthly_dfs[(year, month)] = month_df
+    cube.add_months(monthly_dfs)
+    return cube
+
+
+_crash_cube = None
+_crash_cube_lock = threading.Lock()
+
+
+def get_crash_cube():
+    """
+    Return the process-wide cube, building it from the month store the first time it is needed.
+    """
+    global _crash_cube
+    if _crash_cube is None:
+        with _crash_cube_lock:
+            if _crash_cube is None:
+                _crash_cube = load_crash_cube()
+    return _crash_cube
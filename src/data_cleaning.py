@@ -1,11 +1,25 @@
-import tracemalloc
+import os
+import numpy as np
 import pandas as pd
+import requests
 import time
 
-from src.data_loading import get_zip_lat_long_borough, get_zip_lat_long_no_borough, get_zip_no_lat_long_borough, get_zip_no_lat_long_no_borough, get_no_zip_lat_long_borough, get_no_zip_lat_long_no_borough, get_no_zip_no_lat_long_borough, get_no_zip_no_lat_long_no_borough
-from src.data_processing import assign_zip_codes_kdtree, create_zip_to_borough_dict, update_boroughs, aggregate_crashes_by_zip
+from src.data_loading import get_missingness_codes, ZIP_PRESENT, LAT_LONG_PRESENT, ZIP_LAT_LONG_BOROUGH, NO_ZIP_LAT_LONG_BOROUGH, NO_ZIP_LAT_LONG_NO_BOROUGH
+from src.data_processing import assign_zip_codes_polygon, assign_zip_codes_kdtree, create_zip_to_borough_dict, update_boroughs, aggregate_crashes_by_zip, aggregate_crashes_by_month
 from src.data_formatting import filter_by_borough, rank_by_crash_count, create_crash_likelihood_column, get_total_crashes, get_average_crashes_per_zip, group_into_deciles, rename_columns, rename_bronx_to_the_bronx
-from src.data_fetching import fetch_crash_data
+from src.data_fetching import iter_crash_data_months, map_months, get_months_in_range, group_consecutive_months, is_month_final
+from src.data_storage import fetch_month_file, save_month_file, MONTH_COLUMNS
+from src.data_sources import get_data_source, LOCATION_PARTIAL, LOCATION_PRESENT
+from src.geometry_registry import get_zip_geometry_registry
+from src.reference_index import get_reference_index, create_month_label, COORDINATE_DECIMALS
+from src.crash_cube import get_crash_cube
+
+# Let the data source group the records that already have a zip code, set to 0 to download every record
+PUSHDOWN_ENABLED = os.getenv("CRASH_DATA_PUSHDOWN", "1") == "1"
+
+RECORD_COLUMNS = ['zip_code', 'borough', 'crash_count', 'latitude', 'longitude', 'year', 'month']
+
+ZIP_COUNT_COLUMNS = ['zip_code', 'borough', 'year', 'month', 'location_state', 'row_count', 'crash_count']
 
 
 def preprocess_dataframe(df):
@@ -26,114 +40,322 @@ def preprocess_dataframe(df):
     return df
 
 
-def split_dataframe_by_conditions(df):
+def fill_missing_data(df, k, codes=None):
     """
-    Splits the dataframe into parts based on zip code, latitude/longitude, and borough conditions.
+    Fills in missing data in the dataframe by assigning zip codes to rows that are missing them.
 
-    Parameters: 
-    df (pd.DataFrame): The dataframe to split
+    Every row is classified once by get_missingness_codes; zip codes and boroughs are then filled
+    in place through row positions instead of splitting the dataframe into parts and concatenating them.
+    Rows that can not be filled, with neither a zip code nor a full latitude/longitude, are dropped.
+
+    Parameters:
+    df (pd.DataFrame): The dataframe to fill missing data in
+    k (int): The number of nearest neighbors to consider when assigning zip codes
+    codes (np.ndarray): The missingness codes of df, computed when not given
 
     Returns:
-    dict: A dictionary containing the split dataframes
+    pd.DataFrame: The dataframe with missing data filled in
     """
-    return {
-        "df_zip_lat_long_borough": get_zip_lat_long_borough(df),
-        "df_zip_lat_long_no_borough": get_zip_lat_long_no_borough(df),
-        "df_zip_no_lat_long_borough": get_zip_no_lat_long_borough(df),
-        "df_zip_no_lat_long_no_borough": get_zip_no_lat_long_no_borough(df),
-        "df_no_zip_lat_long_borough": get_no_zip_lat_long_borough(df),
-        "df_no_zip_lat_long_no_borough": get_no_zip_lat_long_no_borough(df),
-    }
+    if codes is None:
+        codes = get_missingness_codes(df)
+
+    training_rows = np.flatnonzero(codes == ZIP_LAT_LONG_BOROUGH)
+    missing_zip_rows = np.flatnonzero(
+        (codes == NO_ZIP_LAT_LONG_BOROUGH) | (codes == NO_ZIP_LAT_LONG_NO_BOROUGH))
+
+    # Create a mapping of zip codes to boroughs
+    df_training = df.iloc[training_rows]
+    zip_borough_map = create_zip_to_borough_dict(df_training)
+
+    # Assign missing zip codes
+    start = time.perf_counter()
+    if len(missing_zip_rows) > 0:
+        df_without_zip = assign_zip_codes_polygon(
+            df_training, df.iloc[missing_zip_rows].copy(), k,
+            reference_index=get_reference_index())
+        df.iloc[missing_zip_rows, df.columns.get_loc("zip_code")] = df_without_zip["zip_code"].array
+    end = time.perf_counter()
+    print(f"Zip code assignment took {end - start:0.4f} seconds")
+
+    # Drop the rows that could not be filled
+    is_fillable = (codes >= 0) & ((codes & (ZIP_PRESENT | LAT_LONG_PRESENT)) != 0)
+    if not is_fillable.all():
+        df = df[is_fillable]
+
+    # Update boroughs in place
+    df = update_boroughs(df, zip_borough_map)
+
+    return df
+
+
+def aggregate_and_format_data(df):
+    agg_df = aggregate_crashes_by_zip(df)
+    agg_df = rename_bronx_to_the_bronx(agg_df)
+    return agg_df
 
 
-def assign_missing_zip_codes(df_parts, k):
+def update_reference_index(months, latitudes, longitudes, zip_codes):
     """
-    Assigns zip codes to rows missing them using k-d tree.
+    Adds geocoded crashes with a known zip code from months that will no longer change
+    to the persisted reference index.
 
     Parameters:
-    df_parts (dict): A dictionary containing the split dataframes
-    k (int): The number of nearest neighbors to consider when assigning zip codes
+    months (list): The final (year, month) tuples the crashes were taken from
+    latitudes (np.ndarray): The latitude of each crash
+    longitudes (np.ndarray): The longitude of each crash
+    zip_codes (np.ndarray): The zip code of each crash
+    """
+    if months and len(zip_codes) > 0:
+        get_reference_index().add_months(months, latitudes, longitudes, zip_codes)
 
-    Returns:
-    dict: A dictionary containing the updated dataframes with missing zip codes filled in
+
+def count_crashes_by_month(df):
+    """
+    Sums crash_count by year, month, zip code and borough, keeping the groups without a borough
+    so it can still be filled in from the zip code once every page has been read.
     """
-    if not df_parts["df_no_zip_lat_long_borough"].empty:
-        df_parts["df_no_zip_lat_long_borough"] = assign_zip_codes_kdtree(
-            df_parts["df_zip_lat_long_borough"], df_parts["df_no_zip_lat_long_borough"], k
-        )
-    if not df_parts["df_no_zip_lat_long_no_borough"].empty:
-        df_parts["df_no_zip_lat_long_no_borough"] = assign_zip_codes_kdtree(
-            df_parts["df_zip_lat_long_borough"], df_parts["df_no_zip_lat_long_no_borough"], k
-        )
-    return df_parts
+    return df.groupby(['year', 'month', 'zip_code', 'borough'], dropna=False)['crash_count'].sum().reset_index()
 
 
-def combine_dataframes(df_parts):
+class MonthlyCrashAccumulator:
+    """
+    Cleans crash records one page at a time, keeping only what is needed to finish the months:
+    the crash counts by month, zip code and borough, the zip code to borough counts, the
+    deduplicated geocoded locations and the few records that lie outside every zip code polygon.
+
+    Raw records are dropped once their page is cleaned; what is kept grows with the crash count
+    groups and the geocoded locations, which are deduplicated within every page as it arrives and
+    across pages once in finish(). finish() gives the same result as fill_missing_data on all records at once,
+    except that crashes outside every polygon are matched against the reference index or, when it
+    is empty, against the deduplicated locations.
     """
-    Combines all dataframe parts into a single dataframe.
+
+    def __init__(self, k):
+        self.k = k
+        self.record_count = 0
+        self.month_counts = []
+        self.borough_counts = []
+        self.unresolved = []
+        self.final_months = set()
+        # per page, the distinct rounded latitude, longitude, zip code and whether the month is final
+        self.location_pages = []
+
+    def add_page(self, records):
+        """
+        Clean one page of records from the data source.
+        """
+        df = preprocess_dataframe(pd.DataFrame(records, columns=RECORD_COLUMNS))
+        self.record_count += len(df)
+        codes = get_missingness_codes(df)
+
+        df_training = df[codes == ZIP_LAT_LONG_BOROUGH]
+        self.borough_counts.append(
+            df_training.groupby(["zip_code", "borough"]).size().reset_index(name='row_count'))
+        self.add_locations(df_training)
+
+        # Assign missing zip codes from the polygons; points outside every polygon wait for finish()
+        is_resolved = (codes >= 0) & ((codes & (ZIP_PRESENT | LAT_LONG_PRESENT)) != 0)
+        missing_zip_rows = np.flatnonzero(
+            (codes == NO_ZIP_LAT_LONG_BOROUGH) | (codes == NO_ZIP_LAT_LONG_NO_BOROUGH))
+        if len(missing_zip_rows) > 0:
+            zip_codes = get_zip_geometry_registry().lookup_zip_codes(
+                df["latitude"].to_numpy()[missing_zip_rows], df["longitude"].to_numpy()[missing_zip_rows])
+            is_inside = zip_codes >= 0
+            df.iloc[missing_zip_rows[is_inside], df.columns.get_loc("zip_code")] = pd.array(
+                zip_codes[is_inside], dtype="Int32")
+            outside_rows = missing_zip_rows[~is_inside]
+            if len(outside_rows) > 0:
+                self.unresolved.append(df.iloc[outside_rows])
+                is_resolved[outside_rows] = False
+
+        self.month_counts.append(count_crashes_by_month(df[is_resolved]))
+
+    def add_locations(self, df_training):
+        if df_training.empty:
+            return
+        months = df_training[["year", "month"]].drop_duplicates().itertuples(index=False)
+        final_months = {(int(year), int(month)) for year, month in months if is_month_final(month, year)}
+        self.final_months |= final_months
+        month_index = (df_training["year"].astype(int) * 12 + df_training["month"].astype(int)).to_numpy()
+        is_final = np.isin(month_index, [year * 12 + month for year, month in final_months])
+        locations = np.column_stack([
+            np.round(df_training["latitude"].to_numpy(dtype=np.float64), COORDINATE_DECIMALS),
+            np.round(df_training["longitude"].to_numpy(dtype=np.float64), COORDINATE_DECIMALS),
+            df_training["zip_code"].to_numpy(dtype=np.float64),
+            is_final,
+        ])
+        self.location_pages.append(np.unique(locations, axis=0))
+
+    def finish(self):
+        """
+        Resolve the remaining zip codes and boroughs and aggregate the crashes per month.
+
+        Returns:
+        dict: A dictionary of (year, month) to the cleaned crash counts for that month
+        """
+        if self.record_count == 0:
+            return {}
+
+        locations = np.unique(np.vstack(self.location_pages), axis=0) if self.location_pages else np.empty((0, 4))
+        self.location_pages = []
+        final_locations = locations[locations[:, 3] == 1]
+        update_reference_index(sorted(self.final_months), final_locations[:, 0],
+                               final_locations[:, 1], final_locations[:, 2].astype(np.int64))
+
+        month_counts = self.month_counts
+        if self.unresolved:
+            df_unresolved = pd.concat(self.unresolved, ignore_index=True)
+            reference_index = get_reference_index()
+            if len(reference_index) > 0:
+                df_unresolved["zip_code"] = pd.array(reference_index.assign_zip_codes(
+                    df_unresolved["latitude"].to_numpy(), df_unresolved["longitude"].to_numpy(), self.k),
+                    dtype="Int32")
+            elif len(locations) > 0:
+                df_locations = pd.DataFrame({
+                    "latitude": locations[:, 0], "longitude": locations[:, 1],
+                    "zip_code": locations[:, 2].astype(np.int64)})
+                df_unresolved = assign_zip_codes_kdtree(df_locations, df_unresolved, self.k)
+            month_counts = month_counts + [count_crashes_by_month(df_unresolved)]
+
+        zip_borough_map = create_zip_to_borough_dict(
+            pd.concat(self.borough_counts, ignore_index=True), count_column="row_count")
+        df = pd.concat(month_counts, ignore_index=True)
+        df = update_boroughs(df, zip_borough_map)
+        return split_by_month(aggregate_crashes_by_month(df))
+
+
+def split_by_month(monthly_df):
+    """
+    Splits the output of aggregate_crashes_by_month into one dataframe per month.
 
     Parameters:
-    df_parts (dict): A dictionary containing the split dataframes
+    monthly_df (pd.DataFrame): The crash counts by year, month, zip code and borough
 
     Returns:
-    pd.DataFrame: The combined dataframe
+    dict: A dictionary of (year, month) to the crash counts for that month
     """
-    return pd.concat([
-        df_parts["df_zip_lat_long_borough"],
-        df_parts["df_zip_lat_long_no_borough"],
-        df_parts["df_zip_no_lat_long_borough"],
-        df_parts["df_zip_no_lat_long_no_borough"],
-        df_parts["df_no_zip_lat_long_borough"],
-        df_parts["df_no_zip_lat_long_no_borough"]
-    ])
+    return {
+        (year, month): month_df.reset_index(drop=True)
+        for (year, month), month_df in monthly_df.groupby(['year', 'month'])
+    }
 
 
-def fill_missing_data(df, k):
+def fetch_and_clean_months_pushdown(source, months, k):
     """
-    Fills in missing data in the dataframe by assigning zip codes to rows that are missing them.
+    Fetches a run of consecutive months with the aggregation pushed down to the data source.
+
+    Records that already have a zip code arrive grouped by zip code, borough and month; only the
+    records that need a zip code are downloaded with their coordinates. Every month is queried
+    on its own and the months are fetched concurrently. Zip codes are assigned from
+    the polygons and the reference index, since no geocoded records are downloaded to train on.
+    For final months the reference index has not learned yet, the distinct geocoded locations
+    are downloaded as well and added to it first, so the index keeps up with every month.
 
     Parameters:
-    df (pd.DataFrame): The dataframe to fill missing data in
+    source (CrashDataSource): The data source to fetch from
+    months (list): Consecutive (year, month) tuples in chronological order
     k (int): The number of nearest neighbors to consider when assigning zip codes
 
     Returns:
-    pd.DataFrame: The dataframe with missing data filled in
+    dict: A dictionary of (year, month) to the cleaned crash counts for that month
     """
-    # Split the dataframe into parts
-
-    df_parts = split_dataframe_by_conditions(df)
-
-    # Create a mapping of zip codes to boroughs
+    reference_index = get_reference_index()
+    new_reference_months = [(year, month) for year, month in months
+                            if is_month_final(month, year) and create_month_label(month, year) not in reference_index.months]
 
-    zip_borough_map = create_zip_to_borough_dict(
-        df_parts["df_zip_lat_long_borough"])
+    def fetch_month(year, month):
+        return (source.fetch_zip_counts(month, year, month, year),
+                source.fetch_records_without_zip(month, year, month, year),
+                source.fetch_zip_locations(month, year, month, year) if (year, month) in new_reference_months else [])
 
-    # Assign missing zip codes
     start = time.perf_counter()
-    df_parts = assign_missing_zip_codes(df_parts, k)
+    zip_counts, records_without_zip, zip_locations = [], [], []
+    try:
+        for _, (month_zip_counts, month_records_without_zip, month_zip_locations) in map_months(fetch_month, months):
+            zip_counts += month_zip_counts
+            records_without_zip += month_records_without_zip
+            zip_locations += month_zip_locations
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching data: {e}")
+        return {}
+    if not zip_counts and not records_without_zip:
+        return {}
     end = time.perf_counter()
-    print(f"Zip code assignment took {end - start:0.4f} seconds")
+    print(f"Data fetching took {end - start:0.4f} seconds ({len(zip_counts)} zip code groups, "
+          f"{len(records_without_zip)} records without zip code, {len(zip_locations)} new reference locations)")
+
+    df_locations = pd.DataFrame(zip_locations, columns=['latitude', 'longitude', 'zip_code']).apply(
+        pd.to_numeric, errors='coerce').dropna()
+    update_reference_index(new_reference_months, df_locations["latitude"].to_numpy(),
+                           df_locations["longitude"].to_numpy(), df_locations["zip_code"].to_numpy(dtype=np.int64))
+
+    # Same zip code to borough majority as fill_missing_data, counted over the grouped records
+    df_counts = pd.DataFrame(zip_counts, columns=ZIP_COUNT_COLUMNS)
+    df_counts["zip_code"] = pd.to_numeric(
+        df_counts["zip_code"], errors='coerce').astype('Int32')
+    df_counts["borough"] = df_counts["borough"].astype(pd.StringDtype())
+    df_counts = df_counts[df_counts["location_state"] != LOCATION_PARTIAL]
+    zip_borough_map = create_zip_to_borough_dict(
+        df_counts[(df_counts["location_state"] == LOCATION_PRESENT) & df_counts["borough"].notna()],
+        count_column="row_count")
 
-    # Combine all dataframes into one
+    df_without_zip = preprocess_dataframe(
+        pd.DataFrame(records_without_zip, columns=RECORD_COLUMNS))
+    if not df_without_zip.empty:
+        df_without_zip = assign_zip_codes_polygon(
+            df_without_zip.iloc[0:0], df_without_zip, k, reference_index=reference_index)
 
-    combined_df = combine_dataframes(df_parts)
+    columns = ['year', 'month'] + MONTH_COLUMNS
+    df = pd.concat([df_counts[columns], df_without_zip[columns]], ignore_index=True)
+    df = update_boroughs(df, zip_borough_map)
+    return split_by_month(aggregate_crashes_by_month(df))
 
-    # Update boroughs in the combined dataframe
-    combined_df = update_boroughs(combined_df, zip_borough_map)
 
-    return combined_df
+def fetch_and_clean_months(months, k):
+    """
+    Fetches a run of consecutive months from the API, fills in missing data and aggregates it per month.
 
+    When the data source supports it and the reference index has locations, the aggregation is
+    pushed down to the data source with fetch_and_clean_months_pushdown. Otherwise the records
+    are downloaded and cleaned page by page with MonthlyCrashAccumulator.
 
-def aggregate_and_format_data(df):
-    agg_df = aggregate_crashes_by_zip(df)
-    agg_df = rename_bronx_to_the_bronx(agg_df)
-    return agg_df
+    Parameters:
+    months (list): Consecutive (year, month) tuples in chronological order
+    k (int): The number of nearest neighbors to consider when assigning zip codes
+
+    Returns:
+    dict: A dictionary of (year, month) to the cleaned crash counts for that month
+    """
+    source = get_data_source()
+    if PUSHDOWN_ENABLED and source.supports_pushdown and len(get_reference_index()) > 0:
+        return fetch_and_clean_months_pushdown(source, months, k)
+
+    # Months are fetched concurrently and cleaned page by page in month order,
+    # so only the months in flight are ever held in memory
+    start = time.perf_counter()
+    accumulator = MonthlyCrashAccumulator(k)
+    try:
+        for _, pages in iter_crash_data_months(months):
+            for records in pages:
+                accumulator.add_page(records)
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching data: {e}")
+        return {}
+    end = time.perf_counter()
+    print(f"Data fetching and cleaning took {end - start:0.4f} seconds ({accumulator.record_count} records)")
+
+    return accumulator.finish()
 
 
 def fetch_and_aggregate_crash_data(start_month, start_year, end_month, end_year, k):
     """
     Fetches and aggregates crash data for a given time period.
 
+    Months that will no longer change are kept in the crash cube, which sums any range of
+    them without touching the monthly rows. Final months the cube does not have yet are read
+    from the month store or fetched from the API, saved and added to the cube; the months that
+    can still change are fetched and added to the cube's totals.
+
     Parameters:
     start_month (int): The starting month
     start_year (int): The starting year
@@ -144,29 +366,42 @@ def fetch_and_aggregate_crash_data(start_month, start_year, end_month, end_year,
     Returns:
     pd.DataFrame: The aggregated crash
     """
+    crash_cube = get_crash_cube()
+    months = get_months_in_range(start_month, start_year, end_month, end_year)
+
+    stored_dfs = {}
+    missing_months = []
+    for year, month in months:
+        if crash_cube.has_month(month, year):
+            continue
+        month_df = fetch_month_file(month, year) if is_month_final(month, year) else None
+        if month_df is None:
+            missing_months.append((year, month))
+        else:
+            stored_dfs[(year, month)] = month_df
+    print(f"{len(months) - len(missing_months)} of {len(months)} months loaded from the crash cube and month store")
+
+    recent_dfs = {}
+    for run in group_consecutive_months(missing_months):
+        for (year, month), month_df in fetch_and_clean_months(run, k).items():
+            if is_month_final(month, year):
+                save_month_file(month_df, month, year)
+                stored_dfs[(year, month)] = month_df
+            else:
+                recent_dfs[(year, month)] = month_df
+    crash_cube.add_months(stored_dfs)
+
+    cube_runs = group_consecutive_months(
+        [(year, month) for year, month in months if crash_cube.has_month(month, year)])
+    agg_df = None
+    if not recent_dfs and len(cube_runs) == 1 and len(cube_runs[0]) == len(months):
+        agg_df = rename_bronx_to_the_bronx(
+            crash_cube.aggregate(start_month, start_year, end_month, end_year))
+    elif cube_runs or recent_dfs:
+        run_dfs = [crash_cube.sum_range(run[0][1], run[0][0], run[-1][1], run[-1][0]) for run in cube_runs]
+        df = pd.concat(run_dfs + [recent_dfs[key] for key in sorted(recent_dfs)], ignore_index=True)
+        agg_df = aggregate_and_format_data(df)
 
-    start = time.perf_counter()
-    tracemalloc.start()
-    data = fetch_crash_data(start_month, start_year, end_month, end_year)
-    if data is None or len(data) == 0:
-        return None
-
-    df = pd.DataFrame(data)
-    end = time.perf_counter()
-    print(f"Data fetching took {end - start:0.4f} seconds")
-
-    df = preprocess_dataframe(df)
-    # start = time.perf_counter()
-    df = fill_missing_data(df, k)
-    # end = time.perf_counter()
-    # print(f"Data filling took {end - start:0.4f} seconds")
-
-    agg_df = aggregate_and_format_data(df)
-
-    # Your code here
-    current, peak = tracemalloc.get_traced_memory()
-    print(f"Current memory usage: {current / 10**6} MB; Peak: {peak / 10**6} MB")
-    tracemalloc.stop()
     return agg_df
 
 
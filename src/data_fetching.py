@@ -1,6 +1,13 @@
 import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from src.data_sources import get_data_source, PageFetchError, PAGE_SIZE, FETCH_CONCURRENCY
+
+# number of times a month is fetched again after a failure
+MONTH_RETRIES = 2
+
 # the earliest date possible is August 2011
 EARLIEST_DATE = datetime(2011, 8, 1)
 
@@ -90,6 +97,92 @@ def is_date_range_valid(start_month, start_year, end_month, end_year):
     return False
 
 
+def parse_year_month(value):
+    """
+    Parse a month written as YYYY-MM.
+
+    Parameters:
+    value (str): The month, for example '2025-02'
+
+    Returns:
+    tuple: (month, year) as ints
+
+    Raises:
+    ValueError: If value is not a YYYY-MM month
+    """
+    year, separator, month = value.partition('-')
+    if not separator or len(year) != 4 or len(month) != 2 or not year.isdigit() or not month.isdigit():
+        raise ValueError(f"Expected a month as YYYY-MM, got {value!r}")
+    month, year = int(month), int(year)
+    if not 1 <= month <= 12:
+        raise ValueError(f"Expected a month as YYYY-MM, got {value!r}")
+    return month, year
+
+
+def format_year_month(month, year):
+    """
+    Write a month as YYYY-MM, the format parse_year_month reads.
+    """
+    return f"{int(year):04d}-{int(month):02d}"
+
+
+def get_months_in_range(start_month, start_year, end_month, end_year):
+    """
+    List every calendar month in the date range, inclusive of both ends.
+
+    Parameters:
+    start_month (int): The starting month
+    start_year (int): The starting year
+    end_month (int): The ending month
+    end_year (int): The ending year
+
+    Returns:
+    list: (year, month) tuples in chronological order
+    """
+    start_index = int(start_year) * 12 + int(start_month) - 1
+    end_index = int(end_year) * 12 + int(end_month) - 1
+    return [(index // 12, index % 12 + 1) for index in range(start_index, end_index + 1)]
+
+
+def group_consecutive_months(months):
+    """
+    Group a chronological list of (year, month) tuples into runs of consecutive months,
+    so each run can be fetched with a single range query.
+
+    Parameters:
+    months (list): (year, month) tuples in chronological order
+
+    Returns:
+    list: A list of runs, each a list of consecutive (year, month) tuples
+    """
+    runs = []
+    previous_index = None
+    for year, month in months:
+        index = year * 12 + month - 1
+        if previous_index is None or index != previous_index + 1:
+            runs.append([])
+        runs[-1].append((year, month))
+        previous_index = index
+    return runs
+
+
+def is_month_final(month, year):
+    """
+    Check if a month is old enough that its published crash data is no longer updated.
+    The current month and the month before it are still being filled in upstream.
+
+    Parameters:
+    month (int): The month
+    year (int): The year
+
+    Returns:
+    bool: True if the month's data can be stored permanently, False otherwise
+    """
+    latest_date = get_latest_date()
+    latest_index = latest_date.year * 12 + latest_date.month - 1
+    return int(year) * 12 + int(month) - 1 < latest_index - 1
+
+
 # def fetch_crash_data(start_month, start_year, end_month, end_year):
 #     """
 #     Fetch crash data from the API for a given date range.
@@ -120,42 +213,125 @@ def is_date_range_valid(start_month, start_year, end_month, end_year):
 #         print(f"Failed to fetch data. Status code: {response.status_code}")
 #         return None
 
+def fetch_month_with_retries(fetch_month, year, month):
+    """
+    Call fetch_month(year, month), calling it again up to MONTH_RETRIES times when a request fails.
+    """
+    for attempt in range(MONTH_RETRIES + 1):
+        try:
+            return fetch_month(year, month)
+        except requests.exceptions.RequestException as e:
+            if attempt == MONTH_RETRIES:
+                raise
+            print(f"Retrying {year}-{str(month).zfill(2)} after error: {e}")
+
+
+def map_months(fetch_month, months, max_workers=None):
+    """
+    Fetch months concurrently and yield the results in the order of months.
+
+    At most max_workers months are in flight at once, and a month is only started once
+    the results before it leave room, so memory stays bounded by max_workers months.
+    :param fetch_month: Function of (year, month) returning that month's data
+    :param months: List of (year, month) tuples
+    :param max_workers: Maximum number of concurrent fetches, FETCH_CONCURRENCY by default
+    :return: Generator of ((year, month), result) tuples, raises the error of a month that keeps failing
+    """
+    max_workers = max_workers or FETCH_CONCURRENCY
+    months = iter(months)
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fetch-month')
+    try:
+        in_flight = deque()
+
+        def submit_next():
+            key = next(months, None)
+            if key is not None:
+                in_flight.append((key, executor.submit(fetch_month_with_retries, fetch_month, *key)))
+
+        for _ in range(max_workers):
+            submit_next()
+        while in_flight:
+            key, future = in_flight.popleft()
+            result = future.result()
+            submit_next()
+            yield key, result
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def iter_crash_data_months(months, page_size=None, max_workers=None):
+    """
+    Fetch the crash records of several months concurrently, one query per month, paged within the month.
+    Every page of a month is kept until the month is complete so a month is yielded whole, so memory is
+    bounded by the size of max_workers months rather than by the page size; use iter_crash_data_pages
+    to hold a single page at a time.
+    A month whose page keeps failing is retried from the resume point of that page, keeping the pages
+    it already received, instead of starting the month over.
+    :param months: List of (year, month) tuples
+    :param page_size: Maximum number of records per page, PAGE_SIZE by default
+    :param max_workers: Maximum number of concurrent fetches, FETCH_CONCURRENCY by default
+    :return: Generator of ((year, month), pages) tuples in the order of months, pages is a list of record lists
+    """
+    source = get_data_source()
+    page_size = page_size or PAGE_SIZE
+    # (year, month) to the pages received and the resume point of a month that failed
+    progress = {}
+
+    def fetch_month(year, month):
+        pages, resume_point = progress.pop((year, month), ([], None))
+        try:
+            for page in source.iter_record_pages(month, year, month, year, page_size=page_size,
+                                                 resume_point=resume_point):
+                pages.append(page.records)
+        except PageFetchError as e:
+            progress[(year, month)] = (pages, e.resume_point)
+            raise
+        return pages
+
+    return map_months(fetch_month, months, max_workers)
+
+
 def fetch_crash_data(start_month, start_year, end_month, end_year):
     """
-    Fetch crash data from the API for a given date range.
+    Fetch crash data from the configured data source for a given date range.
+    The months of the range are fetched concurrently and reassembled in order.
+    Every record of the range is held in memory, numbered in place as it arrives.
     :param start_month: Start month (1-12)
     :param start_year: Start year (YYYY)
     :param end_month: End month (1-12)
     :param end_year: End year (YYYY)
     :return: List of crash records
     """
-    # Construct the API URL
-    start_date = f"{start_year}{str(start_month).zfill(2)}"
-    end_date = f"{end_year}{str(end_month).zfill(2)}"
-    url = (
-        "https://chekpeds.carto.com/api/v2/sql?q="
-        "SELECT c.zip_code, c.borough, c.crash_count, c.latitude, c.longitude "
-        "FROM crashes_all_prod c "
-        f"WHERE (year::text || LPAD(month::text, 2, '0') >= '{start_date}' "
-        f"AND year::text || LPAD(month::text, 2, '0') <= '{end_date}')"
-    )
-
     try:
-        # Measure the time taken for the request
-        response = requests.get(url, timeout=10)  # Add a timeout to prevent hanging
-
-        # Check for successful response
-        response.raise_for_status()
-        data = response.json().get('rows', [])
+        months = get_months_in_range(start_month, start_year, end_month, end_year)
+        data = []
+        for _, pages in iter_crash_data_months(months):
+            for records in pages:
+                for record in records:
+                    # Add incremental IDs to each record
+                    record['id'] = len(data)
+                    data.append(record)
 
         # Return an empty list if no data is found
         if not data:
             print("No data found for the given date range.")
-            return []
-
-        # Add incremental IDs to each record
-        return [{'id': i, **record} for i, record in enumerate(data)]
+        return data
 
     except requests.exceptions.RequestException as e:
         print(f"Error fetching data: {e}")
         return []
+
+
+def iter_crash_data_pages(start_month, start_year, end_month, end_year, page_size=None, resume_point=None):
+    """
+    Fetch crash data from the configured data source one page at a time.
+    :param start_month: Start month (1-12)
+    :param start_year: Start year (YYYY)
+    :param end_month: End month (1-12)
+    :param end_year: End year (YYYY)
+    :param page_size: Maximum number of records per page, PAGE_SIZE by default
+    :param resume_point: The resume_point of the last page received, to continue an interrupted download
+    :return: Generator of RecordPage tuples, raises PageFetchError when a page keeps failing
+    """
+    return get_data_source().iter_record_pages(
+        start_month, start_year, end_month, end_year, page_size=page_size or PAGE_SIZE, resume_point=resume_point)
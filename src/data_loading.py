@@ -13,132 +13,47 @@ Zip code (missing), Lat/Long (present), Borough (present)
 Zip code (missing), Lat/Long (present), Borough (missing) 
 Zip code (missing), Lat/Long (missing), Borough (present) 
 Zip code (missing), Lat/Long (missing), Borough (missing)
-"""
-
-
-def get_zip_lat_long_borough(df):  # no filling needed
-    """
-    Returns records where zip_code, latitude, longitude, and borough are all present.
-    Zip code (present), Lat/Long (present), Borough (present)
-
-    Parameters:
-    df (pd.DataFrame): The dataframe to split
-
-    Returns:
-    pd.DataFrame: The dataframe with zip code, latitude, longitude, and borough all present
-    """
-    return df[df["zip_code"].notna() & df["latitude"].notna() & df["longitude"].notna() & df["borough"].notna()]
-
-
-def get_zip_lat_long_no_borough(df):  # can fill borough with zip code
-    """
-    Returns records where zip_code, latitude, and longitude are present, but borough is missing.
-    Zip code (present), Lat/Long (present), Borough (missing)
-
-    Parameters:
-    df (pd.DataFrame): The dataframe to split
-
-    Returns:
-    pd.DataFrame: The dataframe with zip code, latitude, and longitude present, but borough missing
-    """
-    return df[df["zip_code"].notna() & df["latitude"].notna() & df["longitude"].notna() & df["borough"].isna()]
-
-
-def get_zip_no_lat_long_borough(df):  # no filling needed
-    """
-    Returns records where zip_code is present, latitude and longitude are missing, and borough is present.
-    Zip code (present), Lat/Long (missing), Borough (present)
-
-    Parameters:
-    df (pd.DataFrame): The dataframe to split
-
-    Returns:
-    pd.DataFrame: The dataframe with zip code present, latitude and longitude missing, and borough present
-    """
-    return df[df["zip_code"].notna() & df["latitude"].isna() & df["longitude"].isna() & df["borough"].notna()]
-
-
-# zip code can determine borough # usually has 0 records
-def get_zip_no_lat_long_no_borough(df):
-    """
-    Returns records where zip_code is present, latitude and longitude are missing, and borough is missing.
-    Zip code (present), Lat/Long (missing), Borough (missing)
-
-    Parameters:
-    df (pd.DataFrame): The dataframe to split
-
-    Returns:
-    pd.DataFrame: The dataframe with zip code present, latitude and longitude missing, and borough missing
-    """
-    return df[df["zip_code"].notna() & df["latitude"].isna() & df["longitude"].isna() & df["borough"].isna()]
-
-
-def get_no_zip_lat_long_borough(df):  # lat/long can determine zip code
-    """
-    Returns records where zip_code is missing, latitude and longitude are present, and borough is present.
-    Zip code (missing), Lat/Long (present), Borough (present)
-
-    Parameters:
-    df (pd.DataFrame): The dataframe to split
-
-    Returns:
-    pd.DataFrame: The dataframe with zip code missing, latitude and longitude present, and borough present
-    """
-    return df[df["zip_code"].isna() & df["latitude"].notna() & df["longitude"].notna() & df["borough"].notna()]
-
-
-# lat/long can determine zip code, zip code can determine borough
-def get_no_zip_lat_long_no_borough(df):
-    """
-    Returns records where zip_code is missing, latitude and longitude are present, and borough is missing.
-    Zip code (missing), Lat/Long (present), Borough (missing)
-
-    Parameters:
-    df (pd.DataFrame): The dataframe to split
-
-    Returns:
-    pd.DataFrame: The dataframe with zip code missing, latitude and longitude present, and borough missing
-    """
-    return df[df["zip_code"].isna() & df["latitude"].notna() & df["longitude"].notna() & df["borough"].isna()]
 
+get_missingness_codes classifies every row into one of these combinations in a single pass,
+with one bit per type of locational data, so the cleaning pipeline does not have to split the dataframe.
+"""
+import numpy as np
 
-# usually has 0 records # can not be filled
-def get_no_zip_no_lat_long_borough(df):
-    """
-    Returns records where zip_code and latitude/longitude are missing, and borough is present.
-    Zip code (missing), Lat/Long (missing), Borough (present)
+ZIP_PRESENT = 4
+LAT_LONG_PRESENT = 2
+BOROUGH_PRESENT = 1
 
-    Parameters:
-    df (pd.DataFrame): The dataframe to split
+ZIP_LAT_LONG_BOROUGH = ZIP_PRESENT | LAT_LONG_PRESENT | BOROUGH_PRESENT
+ZIP_LAT_LONG_NO_BOROUGH = ZIP_PRESENT | LAT_LONG_PRESENT
+ZIP_NO_LAT_LONG_BOROUGH = ZIP_PRESENT | BOROUGH_PRESENT
+ZIP_NO_LAT_LONG_NO_BOROUGH = ZIP_PRESENT
+NO_ZIP_LAT_LONG_BOROUGH = LAT_LONG_PRESENT | BOROUGH_PRESENT
+NO_ZIP_LAT_LONG_NO_BOROUGH = LAT_LONG_PRESENT
+NO_ZIP_NO_LAT_LONG_BOROUGH = BOROUGH_PRESENT
+NO_ZIP_NO_LAT_LONG_NO_BOROUGH = 0
 
-    Returns:
-    pd.DataFrame: The dataframe with zip code and latitude/longitude missing, and borough present
-    """
-    return df[df["zip_code"].isna() & df["latitude"].isna() & df["longitude"].isna() & df["borough"].notna()]
+# only one of latitude and longitude is present, which matches none of the combinations
+PARTIAL_LAT_LONG = -1
 
 
-def get_no_zip_no_lat_long_no_borough(df):  # can not be filled
+def get_missingness_codes(df):
     """
-    Returns records where zip_code and latitude/longitude are missing, and borough is missing.
-    Zip code (missing), Lat/Long (missing), Borough (missing)
+    Returns the combination of present and missing locational data of every record as a code
+    built from ZIP_PRESENT, LAT_LONG_PRESENT and BOROUGH_PRESENT.
+    Records with only one of latitude and longitude get PARTIAL_LAT_LONG.
 
     Parameters:
-    df (pd.DataFrame): The dataframe to split
+    df (pd.DataFrame): The dataframe to classify
 
     Returns:
-    pd.DataFrame: The dataframe with zip code and latitude/longitude missing, and borough missing
+    np.ndarray: The code of every record, in the dataframe's row order
     """
-    return df[df["zip_code"].isna() & df["latitude"].isna() & df["longitude"].isna() & df["borough"].isna()]
+    latitude_present = df["latitude"].notna().to_numpy()
+    longitude_present = df["longitude"].notna().to_numpy()
 
+    codes = (df["zip_code"].notna().to_numpy() * ZIP_PRESENT
+             + (latitude_present & longitude_present) * LAT_LONG_PRESENT
+             + df["borough"].notna().to_numpy() * BOROUGH_PRESENT).astype(np.int8)
+    codes[latitude_present != longitude_present] = PARTIAL_LAT_LONG
+    return codes
 
-def get_null_crash_count(df):  # usually has 0 records
-    """
-    Returns records where crash_count is missing.
-    
-    Parameters:
-    df (pd.DataFrame): The dataframe to split
-    
-    Returns:
-    pd.DataFrame: The dataframe with crash_count missing
-    """
-    return df[df["crash_count"].isna()]
@@ -3,8 +3,10 @@ import pandas as pd
 import numpy as np
 from sklearn.neighbors import KDTree
 
+from src.geometry_registry import get_zip_geometry_registry
 
-def create_zip_to_borough_dict(df):
+
+def create_zip_to_borough_dict(df, count_column=None):
     """
     Return a dictionary of zip code to borough mapping.
 
@@ -12,12 +14,18 @@ def create_zip_to_borough_dict(df):
 
     Parameters:
     df (pd.DataFrame): The DataFrame to create the mapping from
+    count_column (str): Optional column holding the number of records each row stands for,
+                        for DataFrames that were already grouped
 
     Returns:
     dict: A dictionary of zip codes to boroughs
     """
-    zip_borough_counts = df.groupby(
-        ["zip_code", "borough"]).size().reset_index(name='accident_count')
+    if count_column is None:
+        zip_borough_counts = df.groupby(
+            ["zip_code", "borough"]).size().reset_index(name='accident_count')
+    else:
+        zip_borough_counts = df.groupby(
+            ["zip_code", "borough"])[count_column].sum().reset_index(name='accident_count')
     zip_borough_mapping = zip_borough_counts.loc[zip_borough_counts.groupby(
         "zip_code")["accident_count"].idxmax()].reset_index(drop=True)
     zip_to_borough = zip_borough_mapping.set_index("zip_code")["borough"]
@@ -51,7 +59,37 @@ def update_boroughs(df, zip_to_borough_dict):
     return df
 
 
-def assign_zip_codes_kdtree(df_with_zip, df_without_zip, n_neighbors):
+def get_neighbor_majority(neighbor_zips, distances=None):
+    """
+    Return the most common zip code among the neighbors of every row.
+
+    Ties go to the smallest zip code, the same as np.bincount(row).argmax().
+    When distances are given each neighbor's vote is weighted by the inverse of its distance.
+
+    Parameters:
+    neighbor_zips (np.ndarray): (n, k) array of the zip codes of each row's k nearest neighbors
+    distances (np.ndarray): Optional (n, k) array of the distances to those neighbors
+
+    Returns:
+    np.ndarray: The winning zip code of every row
+    """
+    neighbor_zips = np.asarray(neighbor_zips, dtype=np.int64)
+    if distances is None:
+        weights = np.ones(neighbor_zips.shape)
+    else:
+        weights = 1.0 / np.maximum(np.asarray(distances, dtype=np.float64), 1e-12)
+
+    # votes[i, j] is the total weight of the neighbors of row i that share neighbor j's zip code
+    votes = np.zeros(neighbor_zips.shape)
+    for neighbor in range(neighbor_zips.shape[1]):
+        votes += (neighbor_zips == neighbor_zips[:, [neighbor]]) * weights[:, [neighbor]]
+
+    is_best = votes == votes.max(axis=1, keepdims=True)
+    candidates = np.where(is_best, neighbor_zips, np.iinfo(np.int64).max)
+    return candidates.min(axis=1)
+
+
+def assign_zip_codes_kdtree(df_with_zip, df_without_zip, n_neighbors, weighted=False):
     """
     Assign zip codes using KD-Tree for faster nearest neighbor search.
 
@@ -59,6 +97,7 @@ def assign_zip_codes_kdtree(df_with_zip, df_without_zip, n_neighbors):
     df_with_zip (pd.DataFrame): DataFrame with zip codes
     df_without_zip (pd.DataFrame): DataFrame without zip codes
     n_neighbors (int): Number of neighbors to consider
+    weighted (bool): Weight each neighbor's vote by the inverse of its distance
 
     Returns:
     pd.DataFrame: DataFrame with zip codes filled in
@@ -68,7 +107,7 @@ def assign_zip_codes_kdtree(df_with_zip, df_without_zip, n_neighbors):
     # Step 1: Extract training and testing data
     step1_start = time.perf_counter()
     X_train = df_with_zip[["latitude", "longitude"]].values
-    y_train = df_with_zip["zip_code"].values
+    y_train = df_with_zip["zip_code"].to_numpy(dtype=np.int64)
     X_test = df_without_zip[["latitude", "longitude"]].values
     step1_end = time.perf_counter()
     print(f"Step 1 (Data extraction): {step1_end - step1_start:.6f} seconds")
@@ -81,17 +120,16 @@ def assign_zip_codes_kdtree(df_with_zip, df_without_zip, n_neighbors):
 
     # Step 3: Query KD-Tree for nearest neighbors
     step3_start = time.perf_counter()
-    _, indices = tree.query(X_test, k=n_neighbors)
+    distances, indices = tree.query(X_test, k=n_neighbors)
     step3_end = time.perf_counter()
     print(f"Step 3 (KD-Tree query): {step3_end - step3_start:.6f} seconds")
 
     # Step 4: Assign the most common zip code among neighbors
     step4_start = time.perf_counter()
     nearest_zips = y_train[indices]
-    most_common_zips = np.apply_along_axis(
-        lambda zips: np.bincount(zips).argmax(), axis=1, arr=nearest_zips
-    )
-    df_without_zip.loc[:, "zip_code"] = most_common_zips
+    most_common_zips = get_neighbor_majority(
+        nearest_zips, distances if weighted else None)
+    df_without_zip.loc[:, "zip_code"] = pd.array(most_common_zips, dtype="Int32")
     step4_end = time.perf_counter()
     print(f"Step 4 (Assign zip codes): {step4_end - step4_start:.6f} seconds")
 
@@ -101,6 +139,47 @@ def assign_zip_codes_kdtree(df_with_zip, df_without_zip, n_neighbors):
     return df_without_zip
 
 
+def assign_zip_codes_polygon(df_with_zip, df_without_zip, n_neighbors, registry=None, reference_index=None):
+    """
+    Assign zip codes by looking up the zip code polygon that contains each crash.
+    Crashes outside every polygon fall back to a vote among their nearest neighbors, taken from
+    the persisted reference index when it has locations and from df_with_zip otherwise.
+
+    Parameters:
+    df_with_zip (pd.DataFrame): DataFrame with zip codes, only used for the fallback
+    df_without_zip (pd.DataFrame): DataFrame without zip codes
+    n_neighbors (int): Number of neighbors to consider in the fallback
+    registry (ZipGeometryRegistry): The zip code polygons, defaults to the NYC shapefile
+    reference_index (ReferenceIndex): Optional prebuilt index of locations with known zip codes
+
+    Returns:
+    pd.DataFrame: DataFrame with zip codes filled in
+    """
+    if registry is None:
+        registry = get_zip_geometry_registry()
+
+    start_time = time.perf_counter()
+    zip_codes = registry.lookup_zip_codes(
+        df_without_zip["latitude"].to_numpy(), df_without_zip["longitude"].to_numpy())
+    inside = zip_codes != -1
+    df_without_zip.loc[inside, "zip_code"] = zip_codes[inside]
+    end_time = time.perf_counter()
+    print(f"Polygon lookup: {inside.sum()} of {len(zip_codes)} crashes in {end_time - start_time:.6f} seconds")
+
+    if inside.all():
+        return df_without_zip
+
+    df_outside = df_without_zip.loc[~inside].copy()
+    if reference_index is not None and len(reference_index) > 0:
+        df_without_zip.loc[~inside, "zip_code"] = reference_index.assign_zip_codes(
+            df_outside["latitude"].to_numpy(), df_outside["longitude"].to_numpy(), n_neighbors)
+    elif not df_with_zip.empty:
+        df_without_zip.loc[~inside, "zip_code"] = assign_zip_codes_kdtree(
+            df_with_zip, df_outside, n_neighbors)["zip_code"]
+
+    return df_without_zip
+
+
 def create_combined_dataframe(df_zip_lat_long_borough,
                               df_zip_lat_long_no_borough,
                               df_zip_no_lat_long_borough,
@@ -148,3 +227,19 @@ def aggregate_crashes_by_zip(df):
         by='total_crashes', ascending=False)
 
     return aggregated_df
+
+
+def aggregate_crashes_by_month(df):
+    """
+    Aggregates crash count by year, month, zip_code and borough so each month can be stored on its own.
+
+    :param df: DataFrame with 'year', 'month', 'zip_code', 'borough', 'crash_count'
+    :return: DataFrame with 'year', 'month', 'zip_code', 'borough', 'crash_count'
+    """
+    monthly_df = df.groupby(['year', 'month', 'zip_code', 'borough']).agg(
+        crash_count=('crash_count', 'sum')
+    ).reset_index()
+    monthly_df['year'] = monthly_df['year'].astype(int)
+    monthly_df['month'] = monthly_df['month'].astype(int)
+
+    return monthly_df
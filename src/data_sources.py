@@ -0,0 +1,354 @@
+"""
+Upstream sources of NYC crash data.
+
+Every source returns plain lists of records with the same fields, so the cleaning pipeline
+does not depend on where the data comes from:
+
+fetch_records             one record per crash location: zip_code, borough, crash_count, latitude, longitude, year, month
+fetch_zip_counts          crash counts grouped on the server by zip_code, borough, year, month and location_state,
+                          for the records that already have a zip code
+fetch_records_without_zip the records of fetch_records that have coordinates but no zip code
+fetch_zip_locations       the distinct latitude, longitude and zip_code of the records that have a zip code,
+                          a borough and both coordinates, the locations the reference index learns from
+
+iter_record_pages         the records of fetch_records one page at a time, month by month
+
+location_state is LOCATION_PRESENT when both latitude and longitude are present, LOCATION_MISSING
+when both are missing and LOCATION_PARTIAL otherwise. row_count is the number of records in a group.
+
+Errors are raised as requests.exceptions.RequestException.
+"""
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import namedtuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CARTO_SQL_URL = os.getenv("CARTO_SQL_URL", "https://chekpeds.carto.com/api/v2/sql")
+SOCRATA_URL = os.getenv("SOCRATA_URL", "https://data.cityofnewyork.us/resource/h9gi-nx95.json")
+
+LOCATION_MISSING = 0
+LOCATION_PARTIAL = 1
+LOCATION_PRESENT = 2
+
+REQUEST_TIMEOUT = 10  # seconds, per request or per page
+
+PAGE_SIZE = int(os.getenv("CRASH_DATA_PAGE_SIZE", 50000))
+PAGE_RETRIES = 2
+
+# Maximum number of months fetched at once, also the connection pool size of the shared session
+FETCH_CONCURRENCY = int(os.getenv("CRASH_DATA_FETCH_CONCURRENCY", 6))
+
+# Where a paged download continues: the month being read and the source's cursor within that month
+ResumePoint = namedtuple('ResumePoint', ['year', 'month', 'cursor'])
+RecordPage = namedtuple('RecordPage', ['records', 'resume_point'])
+
+
+class PageFetchError(requests.exceptions.RequestException):
+    """
+    Raised when a page still fails after its retries. resume_point is where the download stopped,
+    it can be passed back to iter_record_pages to continue from there.
+    """
+
+    def __init__(self, message, resume_point):
+        super().__init__(message)
+        self.resume_point = resume_point
+
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """
+    Return the process-wide HTTP session, so every data source reuses its pooled connections.
+    The pool keeps one connection per concurrent fetch.
+    """
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=len(DATA_SOURCES), pool_maxsize=FETCH_CONCURRENCY)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _http_session = session
+    return _http_session
+
+
+def reset_http_session():
+    """
+    Drop the HTTP session inherited from the parent process, so a forked process (a gunicorn
+    worker forked after the master warmed up) opens its own connections instead of sharing the
+    parent's keep-alive sockets. The lock is replaced too, another thread may have held it at the fork.
+    """
+    global _http_session, _http_session_lock
+    session = _http_session
+    _http_session = None
+    _http_session_lock = threading.Lock()
+    if session is not None:
+        session.close()
+
+
+os.register_at_fork(after_in_child=reset_http_session)
+
+
+def create_month_number(month, year):
+    """
+    Create a sortable YYYYMM number for a month.
+    """
+    return int(year) * 100 + int(month)
+
+
+class CrashDataSource(ABC):
+    """
+    Base class of the upstream crash data sources.
+    """
+    name = None
+    supports_pushdown = False
+
+    def __init__(self, url, timeout=REQUEST_TIMEOUT, session=None):
+        self.url = url
+        self.timeout = timeout
+        self.session = session or get_http_session()
+
+    def get_json(self, params):
+        response = self.session.get(self.url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    @abstractmethod
+    def fetch_records(self, start_month, start_year, end_month, end_year):
+        pass
+
+    @abstractmethod
+    def fetch_zip_counts(self, start_month, start_year, end_month, end_year):
+        pass
+
+    @abstractmethod
+    def fetch_records_without_zip(self, start_month, start_year, end_month, end_year):
+        pass
+
+    @abstractmethod
+    def fetch_zip_locations(self, start_month, start_year, end_month, end_year):
+        pass
+
+    @abstractmethod
+    def fetch_page(self, year, month, cursor, page_size):
+        """
+        Fetch up to page_size records of one month starting at cursor, None for the first page.
+        Returns the records and the cursor of the next page.
+        """
+
+    def iter_record_pages(self, start_month, start_year, end_month, end_year,
+                          page_size=PAGE_SIZE, resume_point=None):
+        """
+        Yield the records of a date range as RecordPage tuples, month by month and page by page,
+        so only one page is held in memory at a time.
+
+        Every page is its own request with its own timeout and is retried PAGE_RETRIES times.
+        A RecordPage's resume_point is where the download continues after that page.
+        """
+        start_index = int(start_year) * 12 + int(start_month) - 1
+        end_index = int(end_year) * 12 + int(end_month) - 1
+        if resume_point is not None:
+            start_index = resume_point.year * 12 + resume_point.month - 1
+
+        for index in range(start_index, end_index + 1):
+            year, month = index // 12, index % 12 + 1
+            cursor = None
+            if resume_point is not None and (year, month) == (resume_point.year, resume_point.month):
+                cursor = resume_point.cursor
+
+            while True:
+                records, next_cursor = self.fetch_page_with_retries(year, month, cursor, page_size)
+                if records:
+                    yield RecordPage(records, ResumePoint(year, month, next_cursor))
+                if len(records) < page_size:
+                    break
+                cursor = next_cursor
+
+    def fetch_page_with_retries(self, year, month, cursor, page_size):
+        for attempt in range(PAGE_RETRIES + 1):
+            try:
+                return self.fetch_page(year, month, cursor, page_size)
+            except requests.exceptions.RequestException as e:
+                if attempt == PAGE_RETRIES:
+                    raise PageFetchError(
+                        f"Page of {year}-{str(month).zfill(2)} failed: {e}", ResumePoint(year, month, cursor)) from e
+                print(f"Retrying page of {year}-{str(month).zfill(2)} after error: {e}")
+
+
+class CartoDataSource(CrashDataSource):
+    """
+    The CrashMapper Carto SQL API, https://crashmapper.org
+    """
+    name = 'carto'
+    supports_pushdown = True
+
+    def __init__(self, url=CARTO_SQL_URL, timeout=REQUEST_TIMEOUT, session=None):
+        super().__init__(url, timeout, session)
+
+    def create_where_clause(self, start_month, start_year, end_month, end_year):
+        return (f"WHERE (c.year * 100 + c.month) BETWEEN {create_month_number(start_month, start_year)} "
+                f"AND {create_month_number(end_month, end_year)}")
+
+    def query(self, sql):
+        return self.get_json({'q': sql}).get('rows', [])
+
+    def fetch_records(self, start_month, start_year, end_month, end_year):
+        return self.query(
+            "SELECT c.zip_code, c.borough, c.crash_count, c.latitude, c.longitude, c.year, c.month "
+            "FROM crashes_all_prod c "
+            f"{self.create_where_clause(start_month, start_year, end_month, end_year)}"
+        )
+
+    def fetch_zip_counts(self, start_month, start_year, end_month, end_year):
+        return self.query(
+            "SELECT c.zip_code, c.borough, c.year, c.month, "
+            f"CASE WHEN c.latitude IS NOT NULL AND c.longitude IS NOT NULL THEN {LOCATION_PRESENT} "
+            f"WHEN c.latitude IS NULL AND c.longitude IS NULL THEN {LOCATION_MISSING} "
+            f"ELSE {LOCATION_PARTIAL} END AS location_state, "
+            "COUNT(*) AS row_count, SUM(c.crash_count) AS crash_count "
+            "FROM crashes_all_prod c "
+            f"{self.create_where_clause(start_month, start_year, end_month, end_year)} "
+            "AND c.zip_code IS NOT NULL "
+            "GROUP BY c.zip_code, c.borough, c.year, c.month, location_state"
+        )
+
+    def fetch_page(self, year, month, cursor, page_size):
+        # keyset pagination on cartodb_id, the primary key of every Carto table
+        last_id = cursor or 0
+        rows = self.query(
+            "SELECT c.cartodb_id, c.zip_code, c.borough, c.crash_count, c.latitude, c.longitude, c.year, c.month "
+            "FROM crashes_all_prod c "
+            f"WHERE c.year = {int(year)} AND c.month = {int(month)} AND c.cartodb_id > {int(last_id)} "
+            f"ORDER BY c.cartodb_id LIMIT {int(page_size)}"
+        )
+        if rows:
+            last_id = rows[-1]['cartodb_id']
+        for row in rows:
+            del row['cartodb_id']
+        return rows, last_id
+
+    def fetch_records_without_zip(self, start_month, start_year, end_month, end_year):
+        return self.query(
+            "SELECT c.zip_code, c.borough, c.crash_count, c.latitude, c.longitude, c.year, c.month "
+            "FROM crashes_all_prod c "
+            f"{self.create_where_clause(start_month, start_year, end_month, end_year)} "
+            "AND c.zip_code IS NULL AND c.latitude IS NOT NULL AND c.longitude IS NOT NULL"
+        )
+
+    def fetch_zip_locations(self, start_month, start_year, end_month, end_year):
+        return self.query(
+            "SELECT DISTINCT c.latitude, c.longitude, c.zip_code "
+            "FROM crashes_all_prod c "
+            f"{self.create_where_clause(start_month, start_year, end_month, end_year)} "
+            "AND c.zip_code IS NOT NULL AND c.borough IS NOT NULL "
+            "AND c.latitude IS NOT NULL AND c.longitude IS NOT NULL"
+        )
+
+
+class SocrataDataSource(CrashDataSource):
+    """
+    NYC Open Data's Motor Vehicle Collisions - Crashes dataset through the Socrata SODA API.
+    Every record is one crash, and borough names are title cased to match CrashMapper.
+    """
+    name = 'socrata'
+    supports_pushdown = True
+
+    def __init__(self, url=SOCRATA_URL, timeout=REQUEST_TIMEOUT, session=None):
+        super().__init__(url, timeout, session)
+
+    def create_where_clause(self, start_month, start_year, end_month, end_year):
+        end_month_number = int(end_year) * 12 + int(end_month)  # the month after the end month
+        return (f"crash_date >= '{int(start_year)}-{str(start_month).zfill(2)}-01T00:00:00' "
+                f"AND crash_date < '{end_month_number // 12}-{str(end_month_number % 12 + 1).zfill(2)}-01T00:00:00'")
+
+    def normalize(self, records):
+        for record in records:
+            if record.get('borough'):
+                record['borough'] = record['borough'].title()
+            record.setdefault('crash_count', record.get('row_count', 1))
+            for field in ('year', 'month', 'location_state', 'row_count', 'crash_count'):
+                if field in record:
+                    record[field] = int(record[field])
+        return records
+
+    def get_all(self, params, order):
+        """
+        Request every row of a query in pages of PAGE_SIZE rows, like the Carto queries, instead of
+        asking for one unbounded response. order must sort the rows completely, so pages do not overlap.
+        """
+        rows, offset = [], 0
+        while True:
+            page = self.get_json({**params, '$order': order, '$limit': PAGE_SIZE, '$offset': offset})
+            rows += page
+            if len(page) < PAGE_SIZE:
+                return rows
+            offset += len(page)
+
+    def fetch_records(self, start_month, start_year, end_month, end_year, where=None):
+        where_clause = self.create_where_clause(start_month, start_year, end_month, end_year)
+        if where:
+            where_clause = f"{where_clause} AND {where}"
+        return self.normalize(self.get_all({
+            '$select': "zip_code, borough, latitude, longitude, "
+                       "date_extract_y(crash_date) AS year, date_extract_m(crash_date) AS month",
+            '$where': where_clause,
+        }, order=':id'))
+
+    def fetch_zip_counts(self, start_month, start_year, end_month, end_year):
+        location_state = (f"case(latitude IS NOT NULL AND longitude IS NOT NULL, {LOCATION_PRESENT}, "
+                          f"latitude IS NULL AND longitude IS NULL, {LOCATION_MISSING}, true, {LOCATION_PARTIAL})")
+        return self.normalize(self.get_all({
+            '$select': "zip_code, borough, date_extract_y(crash_date) AS year, "
+                       f"date_extract_m(crash_date) AS month, {location_state} AS location_state, "
+                       "count(*) AS row_count",
+            '$where': f"{self.create_where_clause(start_month, start_year, end_month, end_year)} "
+                      "AND zip_code IS NOT NULL",
+            '$group': "zip_code, borough, year, month, location_state",
+        }, order="zip_code, borough, year, month, location_state"))
+
+    def fetch_page(self, year, month, cursor, page_size):
+        # offset pagination in the order of the :id system field
+        offset = cursor or 0
+        records = self.normalize(self.get_json({
+            '$select': "zip_code, borough, latitude, longitude, "
+                       "date_extract_y(crash_date) AS year, date_extract_m(crash_date) AS month",
+            '$where': self.create_where_clause(month, year, month, year),
+            '$order': ':id',
+            '$limit': int(page_size),
+            '$offset': offset,
+        }))
+        return records, offset + len(records)
+
+    def fetch_records_without_zip(self, start_month, start_year, end_month, end_year):
+        return self.fetch_records(start_month, start_year, end_month, end_year,
+                                  where="zip_code IS NULL AND latitude IS NOT NULL AND longitude IS NOT NULL")
+
+    def fetch_zip_locations(self, start_month, start_year, end_month, end_year):
+        return self.get_all({
+            '$select': "latitude, longitude, zip_code",
+            '$where': f"{self.create_where_clause(start_month, start_year, end_month, end_year)} "
+                      "AND zip_code IS NOT NULL AND borough IS NOT NULL "
+                      "AND latitude IS NOT NULL AND longitude IS NOT NULL",
+            '$group': "latitude, longitude, zip_code",
+        }, order="latitude, longitude, zip_code")
+
+
+DATA_SOURCES = {
+    CartoDataSource.name: CartoDataSource,
+    SocrataDataSource.name: SocrataDataSource,
+}
+
+
+def get_data_source(name=None):
+    """
+    Return the configured crash data source, 'carto' unless the CRASH_DATA_SOURCE environment variable says otherwise.
+    """
+    if name is None:
+        name = os.getenv("CRASH_DATA_SOURCE", CartoDataSource.name)
+    return DATA_SOURCES[name]()
@@ -1,12 +1,23 @@
 import os
+import re
 import pandas as pd
 
-# data will be stored in data/nyc_csv
+# the default dataset shipped with the app is stored in data/nyc_csv
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), '../data/nyc_csv')
 
 COLUMNS = ['zip_code', 'borough', 'total_crashes']
 
+# aggregated datasets of any date range will be cached in data/nyc_datasets
+
+DATASET_DIR = os.path.join(os.path.dirname(__file__), '../data/nyc_datasets')
+
+# cleaned crash counts for single months will be stored in data/nyc_months
+
+MONTH_DIR = os.path.join(os.path.dirname(__file__), '../data/nyc_months')
+
+MONTH_COLUMNS = ['zip_code', 'borough', 'crash_count']
+
 
 def create_file_name(start_month, start_year, end_month, end_year):
     """
@@ -14,6 +25,30 @@ def create_file_name(start_month, start_year, end_month, end_year):
     """
     return f"accidents_{start_month}_{start_year}-{end_month}_{end_year}.csv"
 
+def create_dataset_file_name(start_month, start_year, end_month, end_year):
+    """
+    Create the file name of an aggregated dataset in the DATASET_DIR disk cache.
+    """
+    return f"accidents_{int(start_month)}_{int(start_year)}-{int(end_month)}_{int(end_year)}.npz"
+
+def find_stored_date_range():
+    """
+    Find the date range of the most recent dataset stored in the DATA_DIR.
+
+    Returns:
+    tuple: (start_month, start_year, end_month, end_year) as integers, or None if nothing is stored
+    """
+    if not os.path.isdir(DATA_DIR):
+        return None
+    pattern = re.compile(r"accidents_(\d+)_(\d+)-(\d+)_(\d+)\.csv$")
+    date_ranges = [
+        tuple(int(value) for value in match.groups())
+        for match in map(pattern.match, os.listdir(DATA_DIR)) if match
+    ]
+    if not date_ranges:
+        return None
+    return max(date_ranges, key=lambda date_range: (date_range[3], date_range[2], date_range[1], date_range[0]))
+
 def fetch_csv_file(file_name: str) -> pd.DataFrame:
     """
     Fetch the CSV file with the given filename from the DATA_DIR.
@@ -30,32 +65,63 @@ def fetch_csv_file(file_name: str) -> pd.DataFrame:
         return pd.read_csv(file_path)
     else:
         return None
-    
-def delete_all_files_in_data_dir():
+
+
+def create_month_file_name(month, year):
     """
-    Delete all files in the DATA_DIR.
+    Create a file name for a single month of cleaned crash data.
     """
-    for file_name in os.listdir(DATA_DIR):
-        file_path = os.path.join(DATA_DIR, file_name)
-        if os.path.isfile(file_path):
-            os.remove(file_path)
+    return f"crashes_{year}_{str(month).zfill(2)}.csv"
+
 
-def save_dataframe_to_csv(df, file_name):
+def list_stored_months():
     """
-    Save a DataFrame to a CSV file in the DATA_DIR with specified COLUMNS.
-    
+    List the months of cleaned crash data stored in the MONTH_DIR.
+
+    Returns:
+    list: The stored (year, month) tuples in chronological order
+    """
+    if not os.path.isdir(MONTH_DIR):
+        return []
+    pattern = re.compile(r"crashes_(\d{4})_(\d{2})\.csv$")
+    return sorted(
+        (int(match.group(1)), int(match.group(2)))
+        for match in map(pattern.match, os.listdir(MONTH_DIR)) if match
+    )
+
+
+def fetch_month_file(month, year):
+    """
+    Fetch a month of cleaned crash data from the MONTH_DIR.
+
     Parameters:
-    df (pd.DataFrame): The DataFrame to save.
-    file_name (str): The name of the file to save the DataFrame to.
+    month (int): The month
+    year (int): The year
+
+    Returns:
+    pd.DataFrame: The DataFrame with 'zip_code', 'borough' and 'crash_count', or None if the month is not stored.
     """
-    # Ensure the DataFrame contains only the specified columns
-    df_to_save = df[COLUMNS]
-    
-    # Create the full file path
-    file_path = os.path.join(DATA_DIR, file_name)
-    
-    # Save the DataFrame to a CSV file
-    df_to_save.to_csv(file_path, index=False)
+    file_path = os.path.join(MONTH_DIR, create_month_file_name(month, year))
+
+    if os.path.exists(file_path):
+        return pd.read_csv(file_path)
+    else:
+        return None
+
 
+def save_month_file(df, month, year):
+    """
+    Save a month of cleaned crash data to the MONTH_DIR with specified MONTH_COLUMNS.
+    The file is written under a temporary name first so readers never see a partial month.
 
+    Parameters:
+    df (pd.DataFrame): The DataFrame to save, aggregated by zip code and borough
+    month (int): The month
+    year (int): The year
+    """
+    os.makedirs(MONTH_DIR, exist_ok=True)
+    file_path = os.path.join(MONTH_DIR, create_month_file_name(month, year))
+    temp_path = f"{file_path}.{os.getpid()}.tmp"
 
+    df[MONTH_COLUMNS].to_csv(temp_path, index=False)
+    os.replace(temp_path, file_path)
@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+
+
+class DatasetRefresher:
+    """
+    Keeps a dataset whose date range depends on the current date, such as the latest month,
+    built ahead of the requests that need it.
+
+    A background thread calls get_target() every interval seconds and rebuilds the dataset with
+    load(target) when the target changed, for example when the month rolls over. Until the new
+    dataset is ready get() keeps returning the previous one, so requests never wait for a rebuild.
+    If a rebuild fails the previous dataset stays published and the rebuild is tried again on the
+    next check.
+    """
+
+    def __init__(self, get_target, load, interval):
+        self.get_target = get_target
+        self.load = load
+        self.interval = interval
+        self._published = None
+        self._ready = threading.Event()
+        self._stopping = threading.Event()
+        self._refresh_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def publish(self, target, value):
+        """
+        Make value the dataset returned by get(), for example a dataset stored by an earlier run.
+        """
+        self._published = (target, value)
+        self._ready.set()
+
+    def peek(self):
+        """
+        Return the published (target, value) tuple, or None if nothing was published yet.
+        """
+        return self._published
+
+    def get(self, timeout=None):
+        """
+        Return the published (target, value) tuple, which may be for an older target.
+        Only blocks when nothing was ever published, waiting at most timeout seconds for the first build.
+        """
+        self._ready.wait(timeout)
+        return self._published
+
+    def is_stale(self):
+        published = self._published
+        return published is None or published[0] != self.get_target()
+
+    def refresh(self):
+        """
+        Rebuild and publish the dataset if its target changed.
+
+        Returns:
+        bool: True if a new dataset was published
+        """
+        with self._refresh_lock:
+            if not self.is_stale():
+                return False
+            target = self.get_target()
+            start = time.perf_counter()
+            try:
+                value = self.load(target)
+            except Exception as e:
+                print(f"Refreshing the dataset for {target} failed: {e}")
+                return False
+            if value is None:
+                print(f"Refreshing the dataset for {target} returned no data")
+                return False
+            self.publish(target, value)
+            end = time.perf_counter()
+            print(f"Refreshed the dataset for {target} in {end - start:0.4f} seconds")
+            return True
+
+    def run(self):
+        while not self._stopping.is_set():
+            self.refresh()
+            self._stopping.wait(self.interval)
+
+    def start(self):
+        """
+        Start the background thread unless it is already running in this process.
+        Threads do not survive a fork, so a forked worker starts its own.
+        """
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self.run, name='dataset-refresher', daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
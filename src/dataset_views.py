@@ -0,0 +1,213 @@
+import hashlib
+import math
+import sys
+
+import numpy as np
+import pandas as pd
+
+from src.data_formatting import rename_columns
+from src.result_cache import estimate_size
+from src.zip_code_search import ZipPrefixIndex, create_zip_records
+
+BOROUGHS = ['Brooklyn', 'Manhattan', 'Queens', 'Staten Island', 'The Bronx']
+
+AREAS = ['Citywide'] + BOROUGHS
+
+
+def get_dataset_version(agg_df):
+    """
+    Return a short fingerprint of an aggregated dataset's contents.
+    Every worker computes the same version for the same data, so it can key shared caches.
+    """
+    canonical_df = pd.DataFrame({
+        'zip_code': agg_df['zip_code'].astype('int64').to_numpy(),
+        'borough': agg_df['borough'].astype(str).to_numpy(),
+        'total_crashes': agg_df['total_crashes'].astype('int64').to_numpy(),
+    })
+    row_hashes = pd.util.hash_pandas_object(canonical_df, index=False).to_numpy()
+    return hashlib.sha1(row_hashes.tobytes()).hexdigest()[:16]
+
+
+def get_decile_lookup(zip_count):
+    """
+    Return the decile of every rank from 1 to zip_count, matching group_into_deciles.
+
+    Parameters:
+    zip_count (int): The number of ranked zip codes in the area
+
+    Returns:
+    np.ndarray: The decile (1 to 10) of each rank, indexed by rank - 1
+    """
+    if zip_count <= 1:
+        return np.ones(zip_count, dtype=np.int64)
+    return pd.qcut(np.arange(1, zip_count + 1), 10, labels=False) + 1
+
+
+def build_area_tables(agg_df):
+    """
+    Rank, score and group into deciles the citywide table and every borough table in one grouped pass.
+
+    Each table matches the output of process_and_format_crash_data for the same area.
+
+    Parameters:
+    agg_df (pd.DataFrame): The DataFrame returned from aggregate_and_format_data
+
+    Returns:
+    dict: A dictionary of area to (total crashes, average crashes per zip code, formatted DataFrame)
+    """
+    in_borough = agg_df['borough'].isin(BOROUGHS).to_numpy()
+    stacked_df = pd.concat([
+        agg_df.assign(area='Citywide'),
+        agg_df[in_borough].assign(area=agg_df.loc[in_borough, 'borough']),
+    ])
+
+    by_area = stacked_df.groupby('area', sort=False)['total_crashes']
+    totals = by_area.sum()
+    averages = by_area.mean().round(2)
+
+    rank = by_area.rank(method='first', ascending=False).astype(int)
+    stacked_df['rank'] = rank
+    stacked_df['crash_likelihood'] = round(
+        stacked_df['total_crashes'] / stacked_df['area'].map(averages), 2)
+
+    zip_counts = by_area.size()
+    deciles = np.empty(len(stacked_df), dtype=np.int64)
+    area_values = stacked_df['area'].to_numpy()
+    rank_values = rank.to_numpy()
+    for area, zip_count in zip_counts.items():
+        in_area = area_values == area
+        deciles[in_area] = get_decile_lookup(zip_count)[rank_values[in_area] - 1]
+    stacked_df['decile'] = deciles
+
+    tables = {}
+    for area, area_df in stacked_df.groupby('area', sort=False):
+        tables[area] = (totals[area], averages[area],
+                        rename_columns(area_df.drop(columns='area')))
+
+    empty_df = rename_columns(stacked_df.drop(columns='area').iloc[0:0])
+    for area in AREAS:
+        if area not in tables:
+            tables[area] = (0, float('nan'), empty_df)
+
+    return tables
+
+
+def get_likelihood(accident_likelihood):
+    """
+    Return an accident likelihood as a float, 0 for the NaN of an area without crashes.
+    """
+    accident_likelihood = float(accident_likelihood)
+    return 0.0 if math.isnan(accident_likelihood) else accident_likelihood
+
+
+def create_area_columns(formatted_df):
+    """
+    Convert an area table to one list per column, the payload of the JSON API.
+    Missing boroughs become None and the likelihoods of an area without crashes 0,
+    so the lists serialize as valid JSON.
+
+    Parameters:
+    formatted_df (pd.DataFrame): A table returned from process_and_format_crash_data
+
+    Returns:
+    dict: Column name to a list of plain values, in rank order
+    """
+    return {
+        'zip_code': [int(zip_code) for zip_code in formatted_df['Zip Code'].tolist()],
+        'borough': [None if pd.isna(borough) else borough for borough in formatted_df['Borough'].tolist()],
+        'accident_count': [int(count) for count in formatted_df['Accident Count'].tolist()],
+        'rank': [int(rank) for rank in formatted_df['Rank'].tolist()],
+        'decile': [int(decile) for decile in formatted_df['Decile'].tolist()],
+        'accident_likelihood': [get_likelihood(likelihood) for likelihood in formatted_df['Accident Likelihood'].tolist()],
+    }
+
+
+def create_decile_summary(formatted_df, total_crashes):
+    """
+    Group an area table into the deciles shown by view_area.html, as plain values the
+    template only has to print.
+
+    Parameters:
+    formatted_df (pd.DataFrame): A table returned from process_and_format_crash_data
+    total_crashes (int): The total crashes of the area
+
+    Returns:
+    list: One dictionary per decile with its number, total accidents, percentage of the
+          area's accidents and its rows, in the order the deciles first appear in the table.
+          The percentages and likelihoods of an area without crashes are 0
+    """
+    decile_summary = []
+    for decile, group in formatted_df.groupby('Decile', sort=False):
+        decile_accidents = int(group['Accident Count'].sum())
+        rows = [
+            {
+                'rank': int(rank),
+                'zip_code': int(zip_code),
+                'borough': borough,
+                'accident_count': int(accident_count),
+                'accident_likelihood': round(get_likelihood(accident_likelihood), 2),
+            }
+            for rank, zip_code, borough, accident_count, accident_likelihood in zip(
+                group['Rank'].tolist(), group['Zip Code'].tolist(), group['Borough'].tolist(),
+                group['Accident Count'].tolist(), group['Accident Likelihood'].tolist())
+        ]
+        decile_summary.append({
+            'decile': int(decile),
+            'total_accidents': decile_accidents,
+            'percentage': round(decile_accidents / int(total_crashes) * 100, 2) if total_crashes else 0.0,
+            'rows': rows,
+        })
+    return decile_summary
+
+
+class DatasetViews:
+    """
+    The formatted tables of every area for one aggregated dataset.
+    Built once when the dataset is produced so requests only have to look tables up.
+    """
+
+    def __init__(self, agg_df):
+        self.agg_df = agg_df
+        self.version = get_dataset_version(agg_df)
+        self.area_tables = build_area_tables(agg_df)
+        self.zip_prefix_index = ZipPrefixIndex(agg_df['zip_code'])
+        self.zip_records = create_zip_records(self.area_tables)
+        self.area_columns = {area: create_area_columns(formatted_df)
+                             for area, (_, _, formatted_df) in self.area_tables.items()}
+        self.decile_summaries = {area: create_decile_summary(formatted_df, total_crashes)
+                                 for area, (total_crashes, _, formatted_df) in self.area_tables.items()}
+        # The result cache budgets datasets by sys.getsizeof, the views never change so they are measured once
+        self.size = (estimate_size(agg_df) + estimate_size(self.area_tables) + sys.getsizeof(self.zip_prefix_index)
+                     + estimate_size(self.zip_records) + estimate_size(self.area_columns)
+                     + estimate_size(self.decile_summaries))
+
+    def get_area(self, area):
+        """
+        Return the total crashes, average crashes per zip code and formatted table of an area.
+        Raises KeyError for an unknown area.
+        """
+        return self.area_tables[area]
+
+    def get_zip_record(self, zip_code):
+        """
+        Return the citywide and borough records of a zip code, or None if it is not in the dataset.
+        The records are shared by every session and must not be modified.
+        """
+        return self.zip_records.get(zip_code)
+
+    def get_area_columns(self, area):
+        """
+        Return the table of an area as built by create_area_columns.
+        Raises KeyError for an unknown area.
+        """
+        return self.area_columns[area]
+
+    def get_decile_summary(self, area):
+        """
+        Return the deciles of an area as built by create_decile_summary.
+        Raises KeyError for an unknown area.
+        """
+        return self.decile_summaries[area]
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + self.size
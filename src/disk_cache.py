@@ -0,0 +1,144 @@
+import io
+import os
+import threading
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from src.snapshot import file_lock, to_column_arrays
+
+
+def encode_dataframe(df):
+    """
+    Encode a DataFrame as an .npz archive with one typed array per column, readable without pickle.
+    String columns keep their missing values through a separate mask.
+
+    Parameters:
+    df (pd.DataFrame): The DataFrame to encode, with numeric or string columns
+
+    Returns:
+    bytes: The encoded DataFrame
+    """
+    arrays = {'columns': np.array([str(column) for column in df.columns])}
+    for position, column in enumerate(df.columns):
+        values, mask = to_column_arrays(df[column].to_numpy())
+        arrays[f"values_{position}"] = values
+        if mask is not None:
+            arrays[f"mask_{position}"] = mask
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def decode_dataframe(data):
+    """
+    Decode a DataFrame encoded by encode_dataframe.
+    """
+    with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+        columns = {}
+        for position, column in enumerate(archive['columns'].tolist()):
+            values = archive[f"values_{position}"]
+            if f"mask_{position}" in archive.files:
+                values = pd.array(np.where(archive[f"mask_{position}"], None, values), dtype='str')
+            columns[column] = values
+    return pd.DataFrame(columns)
+
+
+class DiskCache:
+    """
+    Directory of cached files shared by every worker process, bounded by a byte budget.
+
+    Files are written under a temporary name and renamed into place, so a reader never sees
+    a partial file. Writers hold an fcntl lock next to the directory while they write and evict,
+    so two workers never evict from under each other. Reading a file marks it as recently used,
+    and eviction removes the least recently used files first, so ranges that keep being read
+    survive one-off queries.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock_path = f"{os.path.normpath(directory)}.lock"
+
+    def get_path(self, file_name):
+        return os.path.join(self.directory, file_name)
+
+    def get(self, file_name):
+        """
+        Return the bytes of a cached file, or None if it is not cached.
+        """
+        file_path = self.get_path(file_name)
+        try:
+            with open(file_path, 'rb') as file:
+                data = file.read()
+            os.utime(file_path)  # mark as recently used for eviction
+        except FileNotFoundError:
+            return None
+        return data
+
+    def set(self, file_name, data):
+        """
+        Store the bytes of a file, then evict the least recently used files until the
+        directory fits the budget. Data larger than the whole budget is not stored.
+        """
+        if len(data) > self.max_bytes:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        file_path = self.get_path(file_name)
+        temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with file_lock(self.lock_path):
+            with open(temp_path, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, file_path)
+            self.evict()
+
+    def discard(self, file_name):
+        try:
+            os.remove(self.get_path(file_name))
+        except FileNotFoundError:
+            pass
+
+    def file_names(self):
+        """
+        Return the names of the cached files, leaving out files still being written.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        return [file_name for file_name in os.listdir(self.directory) if not file_name.endswith('.tmp')]
+
+    def evict(self):
+        """
+        Delete the least recently used files until the directory fits the budget.
+        """
+        entries = []
+        for file_name in self.file_names():
+            try:
+                stat = os.stat(self.get_path(file_name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, file_name))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, file_name in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            self.discard(file_name)
+            total_bytes -= size
+
+    def get_dataframe(self, file_name):
+        """
+        Return a cached DataFrame, or None if it is not cached or can not be read.
+        """
+        data = self.get(file_name)
+        if data is None:
+            return None
+        try:
+            return decode_dataframe(data)
+        except (ValueError, KeyError, OSError, zipfile.BadZipFile) as e:
+            print(f"Discarding unreadable cache file {file_name}: {e}")
+            self.discard(file_name)
+            return None
+
+    def set_dataframe(self, file_name, df):
+        self.set(file_name, encode_dataframe(df))
@@ -0,0 +1,196 @@
+import os
+import threading
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from src.snapshot import SNAPSHOT_DIR, load_snapshot, save_snapshot, snapshot_lock
+
+SHAPEFILE_PATH = os.path.join(os.path.dirname(__file__), '../data/nyc_shapefile/nyc_zip_code_map.shp')
+
+GEOMETRY_SNAPSHOT = 'zip_geometry'
+
+# modzcta used for areas without a zip code such as parks and airports
+UNASSIGNED_ZIP_CODE = '99999'
+
+class ZipGeometryRegistry:
+    """
+    The NYC zip code polygons with everything the heatmap needs precomputed:
+    the zero-padded join key, the centroid of every polygon and a zip code to row index.
+    """
+
+    def __init__(self, shapefile_path=SHAPEFILE_PATH, zip_gdf=None, centroid_latitudes=None, centroid_longitudes=None):
+        if zip_gdf is None:
+            zip_gdf = gpd.read_file(shapefile_path)
+            zip_gdf['ZIPCODE'] = zip_gdf['modzcta'].astype(str).str.strip()
+        self.zip_gdf = zip_gdf
+
+        if centroid_latitudes is None or centroid_longitudes is None:
+            centroids = shapely.centroid(zip_gdf.geometry.values)
+            centroid_latitudes = shapely.get_y(centroids)
+            centroid_longitudes = shapely.get_x(centroids)
+        self.centroid_latitudes = centroid_latitudes
+        self.centroid_longitudes = centroid_longitudes
+
+        self.zip_codes = zip_gdf['ZIPCODE'].to_numpy()
+        self.zip_to_row = {zip_code: row for row, zip_code in enumerate(self.zip_codes)}
+
+        # Only polygons of real zip codes take part in point lookups
+        self._lookup_rows = np.flatnonzero(self.zip_codes != UNASSIGNED_ZIP_CODE)
+        self._lookup_zip_codes = self.zip_codes[self._lookup_rows].astype(np.int64)
+        self._spatial_index = None
+        self._spatial_index_lock = threading.Lock()
+
+    @property
+    def spatial_index(self):
+        """
+        STRtree over the zip code polygons used for point lookups, built on first use.
+        """
+        if self._spatial_index is None:
+            with self._spatial_index_lock:
+                if self._spatial_index is None:
+                    self._spatial_index = shapely.STRtree(
+                        self.zip_gdf.geometry.values[self._lookup_rows])
+        return self._spatial_index
+
+    def lookup_zip_codes(self, latitudes, longitudes):
+        """
+        Find the zip code polygon that contains each point.
+        A point on the border of several polygons gets the first one in shapefile order.
+
+        Parameters:
+        latitudes (np.ndarray): The latitude of each point
+        longitudes (np.ndarray): The longitude of each point
+
+        Returns:
+        np.ndarray: The zip code of each point as an integer, or -1 for points outside every polygon
+        """
+        points = shapely.points(np.asarray(longitudes, dtype=np.float64),
+                                np.asarray(latitudes, dtype=np.float64))
+        point_rows, polygon_rows = self.spatial_index.query(points, predicate='intersects')
+
+        order = np.lexsort((polygon_rows, point_rows))
+        point_rows, polygon_rows = point_rows[order], polygon_rows[order]
+        is_first = np.ones(len(point_rows), dtype=bool)
+        is_first[1:] = point_rows[1:] != point_rows[:-1]
+
+        zip_codes = np.full(len(points), -1, dtype=np.int64)
+        zip_codes[point_rows[is_first]] = self._lookup_zip_codes[polygon_rows[is_first]]
+        return zip_codes
+
+    def get_rows(self, zip_codes):
+        """
+        Return the registry rows of the given zero-padded zip codes in shapefile order.
+        Zip codes without a polygon are skipped.
+
+        Parameters:
+        zip_codes (iterable): Zero-padded zip code strings
+
+        Returns:
+        np.ndarray: The sorted row positions in zip_gdf
+        """
+        rows = [self.zip_to_row[zip_code] for zip_code in zip_codes if zip_code in self.zip_to_row]
+        return np.sort(np.array(rows, dtype=np.int64))
+
+
+    def save_snapshot(self, metadata, snapshot_dir=SNAPSHOT_DIR):
+        """
+        Publish the registry as a columnar snapshot: the attribute columns, the centroids and
+        the polygons as concatenated WKB bytes with the offset of every polygon.
+        Callers hold snapshot_lock(GEOMETRY_SNAPSHOT), see load_zip_geometry_registry.
+        """
+        wkb = shapely.to_wkb(self.zip_gdf.geometry.values)
+        offsets = np.zeros(len(wkb) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(polygon) for polygon in wkb])
+        attribute_columns = [column for column in self.zip_gdf.columns if column != self.zip_gdf.geometry.name]
+        columns = {f"attribute_{column}": self.zip_gdf[column].to_numpy() for column in attribute_columns}
+        columns.update({
+            'centroid_latitudes': self.centroid_latitudes,
+            'centroid_longitudes': self.centroid_longitudes,
+            'wkb': np.frombuffer(b''.join(wkb), dtype=np.uint8),
+            'wkb_offsets': offsets,
+        })
+        save_snapshot(GEOMETRY_SNAPSHOT, columns, {
+            **metadata, 'columns': list(self.zip_gdf.columns), 'geometry_column': self.zip_gdf.geometry.name,
+            'crs': self.zip_gdf.crs.to_wkt()}, snapshot_dir)
+
+    @classmethod
+    def from_snapshot(cls, columns, metadata):
+        """
+        Rebuild a registry from save_snapshot's columns without reading the shapefile.
+        The centroids stay memory-mapped; the polygons are parsed from the shared WKB bytes.
+        """
+        wkb, offsets = columns['wkb'], columns['wkb_offsets']
+        geometry = shapely.from_wkb([wkb[start:end].tobytes() for start, end in zip(offsets[:-1], offsets[1:])])
+        geometry_column = metadata['geometry_column']
+        zip_gdf = gpd.GeoDataFrame({
+            column: geometry if column == geometry_column else columns[f"attribute_{column}"]
+            for column in metadata['columns']
+        }, geometry=geometry_column, crs=metadata['crs'])
+        return cls(zip_gdf=zip_gdf, centroid_latitudes=columns['centroid_latitudes'],
+                   centroid_longitudes=columns['centroid_longitudes'])
+
+
+def get_shapefile_signature(shapefile_path):
+    """
+    Identify a version of a shapefile by its path, size and modification time.
+    """
+    stat = os.stat(shapefile_path)
+    return {'shapefile': os.path.abspath(shapefile_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def load_registry_snapshot(signature):
+    """
+    Load the registry from its snapshot, None if there is none or it was made from another shapefile.
+    """
+    snapshot = load_snapshot(GEOMETRY_SNAPSHOT)
+    if snapshot is None:
+        return None
+    columns, metadata = snapshot
+    if not all(metadata.get(key) == value for key, value in signature.items()):
+        return None
+    return ZipGeometryRegistry.from_snapshot(columns, metadata)
+
+
+def load_zip_geometry_registry(shapefile_path=SHAPEFILE_PATH):
+    """
+    Load the registry of a shapefile from its snapshot, building and publishing the snapshot
+    from the shapefile when it is missing or was made from another version of the shapefile.
+
+    The snapshot is built under its snapshot lock, like the default dataset snapshot, so only one
+    worker builds it while the others wait and then load what it published.
+    """
+    signature = get_shapefile_signature(shapefile_path)
+    registry = load_registry_snapshot(signature)
+    if registry is not None:
+        return registry
+
+    try:
+        with snapshot_lock(GEOMETRY_SNAPSHOT):
+            registry = load_registry_snapshot(signature)
+            if registry is None:
+                registry = ZipGeometryRegistry(shapefile_path)
+                registry.save_snapshot(signature)
+    except OSError as e:
+        print(f"Could not save the zip geometry snapshot: {e}")
+    return registry if registry is not None else ZipGeometryRegistry(shapefile_path)
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_zip_geometry_registry(shapefile_path=SHAPEFILE_PATH):
+    """
+    Return the zip geometry registry of a shapefile, loading it the first time it is needed.
+    The registry is shared by every request in the process and must be treated as read-only.
+    """
+    registry = _registries.get(shapefile_path)
+    if registry is None:
+        with _registries_lock:
+            registry = _registries.get(shapefile_path)
+            if registry is None:
+                registry = load_zip_geometry_registry(shapefile_path)
+                _registries[shapefile_path] = registry
+    return registry
@@ -1,7 +1,6 @@
-import geopandas as gpd
 import folium
 
-SHAPEFILE_PATH = "data/nyc_shapefile/nyc_zip_code_map.shp"
+from src.geometry_registry import SHAPEFILE_PATH, get_zip_geometry_registry
 
 
 def create_interactive_heatmap(borough: str, decile_table, shapefile_path=SHAPEFILE_PATH):
@@ -9,16 +8,17 @@ def create_interactive_heatmap(borough: str, decile_table, shapefile_path=SHAPEF
     Create an interactive heatmap for the selected borough or citywide using the decile table and NYC's shapefile.
     """
     try:
-        nyc_gdf = gpd.read_file(shapefile_path)
-        nyc_gdf['ZIPCODE'] = nyc_gdf['modzcta'].astype(str).str.strip()
+        registry = get_zip_geometry_registry(shapefile_path)
+        nyc_gdf = registry.zip_gdf
 
-        decile_table['Zip Code'] = decile_table['Zip Code'].apply(
-            lambda x: str(int(x)).zfill(5)).str.strip()
+        decile_table = decile_table.assign(**{
+            'Zip Code': decile_table['Zip Code'].astype(int).astype(str).str.zfill(5)
+        })
 
         if borough != "Citywide":
             decile_table = decile_table[decile_table['Borough'] == borough]
             zip_codes_in_borough = decile_table['Zip Code'].unique()
-            nyc_gdf = nyc_gdf[nyc_gdf['ZIPCODE'].isin(zip_codes_in_borough)]
+            nyc_gdf = nyc_gdf.iloc[registry.get_rows(zip_codes_in_borough)]
 
         merged_gdf = nyc_gdf.merge(
             decile_table, left_on='ZIPCODE', right_on='Zip Code', how='left')
@@ -45,16 +45,16 @@ def create_interactive_heatmap(borough: str, decile_table, shapefile_path=SHAPEF
             reset=True
         ).add_to(m)
 
-        for _, row in merged_gdf.iterrows():
-            centroid = row['geometry'].centroid
-            zip_code = row['ZIPCODE']
-            accidents = row['Accident Count']
-            decile = row['Decile']
-            rank = row['Rank']
+        rows = merged_gdf['ZIPCODE'].map(registry.zip_to_row).to_numpy()
+        markers = zip(registry.centroid_latitudes[rows], registry.centroid_longitudes[rows],
+                      merged_gdf['ZIPCODE'].to_numpy(), merged_gdf['Accident Count'].to_numpy(),
+                      merged_gdf['Decile'].to_numpy(), merged_gdf['Rank'].to_numpy())
+
+        for latitude, longitude, zip_code, accidents, decile, rank in markers:
             tooltip_text = f"Zip Code: {zip_code}<br>Accidents: {accidents}<br>Decile: {decile}<br>Rank: {rank}"
 
             folium.Marker(
-                location=[centroid.y, centroid.x],
+                location=[latitude, longitude],
                 icon=None,
                 tooltip=tooltip_text
             ).add_to(m)
@@ -64,6 +64,3 @@ def create_interactive_heatmap(borough: str, decile_table, shapefile_path=SHAPEF
     except Exception as e:
         print(f"An error occurred in create_interactive_heatmap: {e}")
         return None
-    
-
-
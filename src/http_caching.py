@@ -0,0 +1,101 @@
+import gzip
+import hashlib
+import os
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:  # optional, responses fall back to gzip
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed, compressing them saves less than the headers cost
+COMPRESS_MIN_BYTES = 1024
+
+ENCODINGS = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def create_etag(*parts):
+    """
+    Create an ETag from the values a response body depends on, such as the dataset version.
+    """
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()[:20]
+
+
+def get_templates_version(template_dir):
+    """
+    Return a fingerprint of every template, so ETags change when a deploy changes the pages
+    even if the data did not. Every worker computes the same fingerprint for the same files.
+    """
+    digest = hashlib.sha1()
+    for root, _, file_names in sorted(os.walk(template_dir)):
+        for file_name in sorted(file_names):
+            with open(os.path.join(root, file_name), 'rb') as file:
+                digest.update(file_name.encode())
+                digest.update(file.read())
+    return digest.hexdigest()[:12]
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body)
+    return gzip.compress(body, compresslevel=6)
+
+
+def set_cache_headers(response, etag, max_age, private):
+    # Weak ETags, so the plain and every compressed variant of a body share one ETag
+    response.set_etag(etag, weak=True)
+    response.cache_control.private = private
+    response.cache_control.public = not private
+    if max_age:
+        response.cache_control.max_age = max_age
+    else:
+        # Session dependent pages can change under the same URL, the browser has to revalidate
+        response.cache_control.no_cache = True
+    response.vary.add('Accept-Encoding')
+    if private:
+        response.vary.add('Cookie')
+
+
+def make_cached_response(request, etag, render, compressed_cache, max_age=0, private=True,
+                         mimetype='text/html'):
+    """
+    Answer a GET with 304 Not Modified when the client already has the body for etag, without
+    calling render. Otherwise render the body and send it compressed when the client accepts it.
+
+    Compressed bodies are kept in compressed_cache under the ETag and encoding, so a body is
+    only compressed once per version however many clients ask for it.
+
+    Parameters:
+    request (flask.Request): The current request
+    etag (str): Identifies the body, see create_etag
+    render (callable): Returns the body as str or bytes, or a Response that is sent as it is,
+                       for example a redirect
+    compressed_cache (ResultCache): Cache of compressed bodies
+    max_age (int): Seconds the client may reuse the body without asking, 0 to always revalidate
+    private (bool): Whether the body depends on the session and must not be shared by proxies
+    mimetype (str): The mimetype of the body
+
+    Returns:
+    flask.Response: The response
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        set_cache_headers(response, etag, max_age, private)
+        return response
+
+    body = render()
+    if isinstance(body, Response):
+        return body
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+
+    response = Response(body, mimetype=mimetype)
+    set_cache_headers(response, etag, max_age, private)
+
+    encoding = request.accept_encodings.best_match(ENCODINGS) if len(body) >= COMPRESS_MIN_BYTES else None
+    if encoding is not None:
+        response.set_data(compressed_cache.get_or_load(('compressed', etag, encoding),
+                                                       lambda: compress(body, encoding)))
+        response.headers['Content-Encoding'] = encoding
+    return response
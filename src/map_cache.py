@@ -0,0 +1,65 @@
+import os
+import re
+
+from src.disk_cache import DiskCache
+from src.result_cache import ResultCache
+
+# rendered heatmaps will be stored in data/nyc_maps
+
+MAP_DIR = os.path.join(os.path.dirname(__file__), '../data/nyc_maps')
+
+
+def create_map_file_name(area, dataset_key, version):
+    """
+    Create a file name for the rendered heatmap of an area and dataset version.
+    """
+    return f"heatmap_{dataset_key}_{area.replace(' ', '-')}_{version}.html"
+
+
+class MapCache:
+    """
+    Two-tier cache of rendered heatmap HTML keyed by area, date range and dataset version.
+    Recently used maps are kept in memory; every map is also written to MAP_DIR so other
+    workers and restarts can reuse it. Both tiers are bounded by a byte budget.
+    """
+
+    def __init__(self, memory_max_bytes, disk_max_bytes, map_dir=MAP_DIR):
+        self.memory = ResultCache(memory_max_bytes)
+        self.disk = DiskCache(map_dir, disk_max_bytes)
+
+    def get(self, area, dataset_key, version):
+        """
+        Return the rendered heatmap HTML, or None if it is in neither tier.
+        A disk hit is promoted to the memory tier.
+        """
+        key = (area, dataset_key, version)
+        heatmap_html = self.memory.get(key)
+        if heatmap_html is not None:
+            return heatmap_html
+
+        data = self.disk.get(create_map_file_name(area, dataset_key, version))
+        if data is None:
+            return None
+        heatmap_html = data.decode('utf-8')
+
+        self.memory.set(key, heatmap_html)
+        return heatmap_html
+
+    def set(self, area, dataset_key, version, heatmap_html):
+        """
+        Store rendered heatmap HTML in both tiers; the disk tier evicts its least recently
+        used files to stay within its budget.
+        """
+        self.memory.set((area, dataset_key, version), heatmap_html)
+        self.disk.set(create_map_file_name(area, dataset_key, version), heatmap_html.encode('utf-8'))
+
+    def invalidate(self, dataset_key, version):
+        """
+        Delete the maps of a date range that were rendered from any other dataset version.
+        Called whenever the dataset for the date range is rebuilt.
+        """
+        pattern = re.compile(rf"heatmap_{re.escape(dataset_key)}_[^_]+_(\w+)\.html$")
+        for file_name in self.disk.file_names():
+            match = pattern.match(file_name)
+            if match and match.group(1) != version:
+                self.disk.discard(file_name)
@@ -0,0 +1,216 @@
+import json
+import os
+import threading
+import uuid
+
+import joblib
+import numpy as np
+from sklearn.neighbors import KDTree
+
+from src.data_processing import get_neighbor_majority
+from src.snapshot import file_lock
+
+# the reference index will be stored in data/nyc_reference
+
+REFERENCE_DIR = os.path.join(os.path.dirname(__file__), '../data/nyc_reference')
+
+TREE_FILE = 'tree.joblib'
+ZIP_CODES_FILE = 'zip_codes.npy'
+MANIFEST_FILE = 'manifest.json'
+
+# locations are deduplicated after rounding to about one meter
+COORDINATE_DECIMALS = 5
+
+# times a reload reads the manifest again when a writer removed the files it named in between
+RELOAD_ATTEMPTS = 3
+
+
+def create_month_label(month, year):
+    """
+    Create the label a month is recorded under in the manifest.
+    """
+    return f"{year}-{str(month).zfill(2)}"
+
+
+def replace_file(file_path, write):
+    """
+    Write a file under a temporary name with write(temp_path) and move it into place,
+    so other processes never load a partial file.
+    """
+    temp_path = f"{file_path}.{os.getpid()}.tmp"
+    write(temp_path)
+    os.replace(temp_path, file_path)
+
+
+class ReferenceIndex:
+    """
+    KD-tree over geocoded crash locations with known zip codes, used to vote on the zip code
+    of crashes that have coordinates but no zip code.
+
+    The tree is persisted in REFERENCE_DIR and memory-mapped when loaded, so every worker
+    shares one copy. New months only add locations that are not in the index yet, and the
+    tree is rebuilt once per batch of new months rather than on every request. Workers add
+    months under an fcntl lock next to the directory, so each one merges into the months
+    the others saved before it.
+
+    The tree and its zip codes are published together as the reference tuple, swapped in one
+    assignment, so request threads voting while a new version is loaded never pair the zip codes
+    of one version with the tree of another.
+    """
+
+    def __init__(self, reference_dir=REFERENCE_DIR):
+        self.reference_dir = reference_dir
+        self.lock_path = f"{os.path.normpath(reference_dir)}.lock"
+        # (tree, zip codes) of the current version, the tree is None while the index is empty
+        self.reference = (None, np.empty(0, dtype=np.int32))
+        self.months = set()
+        self._manifest_mtime = None
+        self._lock = threading.Lock()
+        self.reload()
+
+    def __len__(self):
+        return len(self.reference[1])
+
+    def reload(self):
+        """
+        Load the persisted index if it changed on disk since it was last loaded.
+        While add_months holds the lock it publishes a new version itself, so readers keep
+        the current one instead of waiting for the tree to be rebuilt.
+        """
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._reload()
+        finally:
+            self._lock.release()
+
+    def _reload(self):
+        """
+        Load the persisted index if it changed on disk. Must be called under self._lock.
+        """
+        manifest_path = os.path.join(self.reference_dir, MANIFEST_FILE)
+        for _ in range(RELOAD_ATTEMPTS):
+            try:
+                manifest_mtime = os.stat(manifest_path).st_mtime_ns
+                if manifest_mtime == self._manifest_mtime:
+                    return
+                with open(manifest_path) as file:
+                    manifest = json.load(file)
+                tree = joblib.load(os.path.join(self.reference_dir, manifest['tree']), mmap_mode='r')
+                zip_codes = np.load(os.path.join(self.reference_dir, manifest['zip_codes']), mmap_mode='r')
+            except FileNotFoundError:
+                if not os.path.exists(manifest_path):
+                    return
+                # Another worker saved a newer version after the manifest was read, read it again
+                continue
+            self.reference = (tree, zip_codes)
+            self.months = set(manifest['months'])
+            self._manifest_mtime = manifest_mtime
+            return
+
+    def add_months(self, months, latitudes, longitudes, zip_codes):
+        """
+        Add the geocoded crashes of new months to the index, then rebuild and persist the tree.
+        Months that are already in the index are ignored.
+
+        Parameters:
+        months (list): The (year, month) tuples the crashes were taken from
+        latitudes (np.ndarray): The latitude of each crash
+        longitudes (np.ndarray): The longitude of each crash
+        zip_codes (np.ndarray): The zip code of each crash
+        """
+        with self._lock, file_lock(self.lock_path):
+            self._reload()
+            new_months = {create_month_label(month, year) for year, month in months} - self.months
+            if not new_months:
+                return
+
+            new_points = np.column_stack([
+                np.round(np.asarray(latitudes, dtype=np.float64), COORDINATE_DECIMALS),
+                np.round(np.asarray(longitudes, dtype=np.float64), COORDINATE_DECIMALS),
+                np.asarray(zip_codes, dtype=np.float64),
+            ])
+            tree, reference_zip_codes = self.reference
+            if tree is not None:
+                coordinates = np.asarray(tree.get_arrays()[0])
+                new_points = np.vstack([
+                    np.column_stack([coordinates, reference_zip_codes]), new_points])
+            points = np.unique(new_points, axis=0)
+
+            coordinates = np.ascontiguousarray(points[:, :2])
+            self.reference = (KDTree(coordinates, metric="euclidean"), points[:, 2].astype(np.int32))
+            self.months = self.months | new_months
+            self.save()
+
+    def save(self):
+        """
+        Persist the tree, zip codes and manifest to REFERENCE_DIR. The manifest is written last
+        so other workers only reload once the new files are in place, then the files of earlier
+        versions are removed. Workers that still have them memory-mapped keep reading them.
+
+        Must be called under the lock at lock_path, so no other worker is writing a version.
+        """
+        os.makedirs(self.reference_dir, exist_ok=True)
+        tree, zip_codes = self.reference
+        version = uuid.uuid4().hex[:12]
+        tree_file = f"{version}_{TREE_FILE}"
+        zip_codes_file = f"{version}_{ZIP_CODES_FILE}"
+
+        replace_file(os.path.join(self.reference_dir, tree_file),
+                     lambda path: joblib.dump(tree, path))
+
+        def write_zip_codes(path):
+            with open(path, 'wb') as file:
+                np.save(file, zip_codes)
+        replace_file(os.path.join(self.reference_dir, zip_codes_file), write_zip_codes)
+
+        def write_manifest(path):
+            with open(path, 'w') as file:
+                json.dump({'tree': tree_file, 'zip_codes': zip_codes_file,
+                           'months': sorted(self.months)}, file)
+        replace_file(os.path.join(self.reference_dir, MANIFEST_FILE), write_manifest)
+        self._manifest_mtime = os.stat(os.path.join(self.reference_dir, MANIFEST_FILE)).st_mtime_ns
+
+        referenced = {tree_file, zip_codes_file}
+        for file_name in os.listdir(self.reference_dir):
+            if file_name.endswith((TREE_FILE, ZIP_CODES_FILE)) and file_name not in referenced:
+                try:
+                    os.remove(os.path.join(self.reference_dir, file_name))
+                except FileNotFoundError:
+                    pass
+
+    def assign_zip_codes(self, latitudes, longitudes, n_neighbors, weighted=False):
+        """
+        Vote on the zip code of each point among its nearest reference locations.
+
+        Parameters:
+        latitudes (np.ndarray): The latitude of each point
+        longitudes (np.ndarray): The longitude of each point
+        n_neighbors (int): Number of neighbors to consider
+        weighted (bool): Weight each neighbor's vote by the inverse of its distance
+
+        Returns:
+        np.ndarray: The zip code of each point
+        """
+        self.reload()
+        tree, zip_codes = self.reference
+        points = np.column_stack([np.asarray(latitudes, dtype=np.float64),
+                                  np.asarray(longitudes, dtype=np.float64)])
+        distances, indices = tree.query(points, k=min(n_neighbors, len(zip_codes)))
+        return get_neighbor_majority(np.asarray(zip_codes)[indices], distances if weighted else None)
+
+
+_reference_index = None
+_reference_index_lock = threading.Lock()
+
+
+def get_reference_index():
+    """
+    Return the process-wide reference index, loading it from REFERENCE_DIR the first time it is needed.
+    """
+    global _reference_index
+    if _reference_index is None:
+        with _reference_index_lock:
+            if _reference_index is None:
+                _reference_index = ReferenceIndex()
+    return _reference_index
@@ -0,0 +1,113 @@
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def create_dataset_key(start_month, start_year, end_month, end_year):
+    """
+    Create the cache key of an aggregated dataset based on the start and end dates.
+    """
+    return f"{int(start_month)}_{int(start_year)}-{int(end_month)}_{int(end_year)}"
+
+
+def estimate_size(value):
+    """
+    Estimate the number of bytes a cached value keeps alive.
+
+    Parameters:
+    value: The cached value, a DataFrame or a container of DataFrames and plain values
+
+    Returns:
+    int: The estimated size in bytes
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, (str, bytes)):
+        return sys.getsizeof(value)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value.values())
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    """
+    In-process cache of computed results with a byte budget and least recently used eviction.
+    Every session that asks for the same key shares the same object, so cached values must
+    be treated as read-only.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key, default=None):
+        """
+        Return the value cached under key and mark it as recently used, or default if it is missing.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def set(self, key, value, size=None):
+        """
+        Cache value under key, evicting the least recently used entries until it fits the budget.
+        Values larger than the whole budget are not cached.
+        """
+        if size is None:
+            size = estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            while self._entries and self.current_bytes + size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+
+    def get_or_load(self, key, loader):
+        """
+        Return the value cached under key, calling loader to compute and cache it on a miss.
+        A loader result of None is returned but not cached.
+        """
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def discard(self, key):
+        """
+        Remove key from the cache if it is present.
+        """
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        """
+        Remove every entry from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
@@ -0,0 +1,158 @@
+import contextlib
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, where the app is not run under gunicorn
+    fcntl = None
+
+# read-only snapshots shared by every worker will be stored in data/nyc_snapshot
+
+SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), '../data/nyc_snapshot')
+
+MANIFEST_FILE = 'manifest.json'
+
+DEFAULT_DATASET_SNAPSHOT = 'default_dataset'
+DATASET_COLUMNS = ['zip_code', 'borough', 'total_crashes']
+
+
+def to_column_arrays(values):
+    """
+    Convert a column to arrays np.load can memory-map without pickle: strings become fixed-width
+    unicode, and the missing values of a string column are stored as a separate boolean mask.
+
+    Returns:
+    tuple: (values, mask), mask is None when nothing is missing
+    """
+    array = np.asarray(values)
+    mask = None
+    if array.dtype == object or pd.api.types.is_string_dtype(array.dtype):
+        is_missing = pd.isna(array)
+        if is_missing.any():
+            mask = is_missing
+            array = np.where(is_missing, '', array)
+        array = array.astype(str)
+    return np.ascontiguousarray(array), mask
+
+
+def save_snapshot(name, columns, metadata=None, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Publish a named snapshot of columns as one .npy file per column.
+
+    String columns with missing values are loaded back as pandas string arrays, every other
+    column as a read-only memory-mapped array.
+
+    Every snapshot version is written to its own directory and the manifest is replaced last,
+    so readers either see the old or the new version. Older versions are removed afterwards;
+    processes that still have them memory-mapped keep reading them until they reload.
+
+    Parameters:
+    name (str): The snapshot name
+    columns (dict): Column name to array-like, numeric or string
+    metadata (dict): JSON serializable data stored with the snapshot
+    snapshot_dir (str): The directory of all snapshots
+    """
+    snapshot_path = os.path.join(snapshot_dir, name)
+    version = uuid.uuid4().hex[:12]
+    version_path = os.path.join(snapshot_path, version)
+    os.makedirs(version_path)
+
+    masked_columns = []
+    for column, values in columns.items():
+        array, mask = to_column_arrays(values)
+        with open(os.path.join(version_path, f"{column}.npy"), 'wb') as file:
+            np.save(file, array, allow_pickle=False)
+        if mask is not None:
+            masked_columns.append(column)
+            with open(os.path.join(version_path, f"{column}.mask.npy"), 'wb') as file:
+                np.save(file, mask, allow_pickle=False)
+
+    manifest_path = os.path.join(snapshot_path, MANIFEST_FILE)
+    temp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as file:
+        json.dump({'version': version, 'columns': list(columns), 'masked_columns': masked_columns,
+                   'metadata': metadata or {}}, file)
+    os.replace(temp_path, manifest_path)
+
+    for entry in os.listdir(snapshot_path):
+        entry_path = os.path.join(snapshot_path, entry)
+        if entry != version and os.path.isdir(entry_path):
+            shutil.rmtree(entry_path, ignore_errors=True)
+
+
+def load_snapshot(name, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Memory-map the current version of a named snapshot.
+
+    Returns:
+    tuple: (columns, metadata), or None if there is no snapshot
+    """
+    snapshot_path = os.path.join(snapshot_dir, name)
+    try:
+        with open(os.path.join(snapshot_path, MANIFEST_FILE)) as file:
+            manifest = json.load(file)
+        version_path = os.path.join(snapshot_path, manifest['version'])
+        columns = {}
+        for column in manifest['columns']:
+            array = np.load(os.path.join(version_path, f"{column}.npy"), mmap_mode='r', allow_pickle=False)
+            if column in manifest['masked_columns']:
+                mask = np.load(os.path.join(version_path, f"{column}.mask.npy"), allow_pickle=False)
+                array = pd.array(np.where(mask, None, array), dtype='str')
+            columns[column] = array
+    except FileNotFoundError:
+        return None
+    return columns, manifest['metadata']
+
+
+@contextlib.contextmanager
+def file_lock(lock_path):
+    """
+    Hold an exclusive fcntl lock on lock_path, shared by every process on the machine.
+    """
+    os.makedirs(os.path.dirname(lock_path) or '.', exist_ok=True)
+    with open(lock_path, 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def snapshot_lock(name, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Hold an exclusive lock on a named snapshot across processes, so only one worker builds it
+    while the others wait and then load what it built.
+    """
+    return file_lock(os.path.join(snapshot_dir, f"{name}.lock"))
+
+
+def save_dataset_snapshot(agg_df, date_range, name=DEFAULT_DATASET_SNAPSHOT, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Publish an aggregated dataset and its (start_month, start_year, end_month, end_year) date range.
+    """
+    save_snapshot(name, {column: agg_df[column].to_numpy() for column in DATASET_COLUMNS},
+                  {'date_range': [int(value) for value in date_range]}, snapshot_dir)
+
+
+def load_dataset_snapshot(name=DEFAULT_DATASET_SNAPSHOT, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Load an aggregated dataset published by save_dataset_snapshot.
+
+    Returns:
+    tuple: (date_range, agg_df), or None if there is no snapshot
+    """
+    snapshot = load_snapshot(name, snapshot_dir)
+    if snapshot is None:
+        return None
+    columns, metadata = snapshot
+    # copy=False keeps the numeric columns backed by the memory-mapped files
+    agg_df = pd.DataFrame({column: columns[column] for column in DATASET_COLUMNS}, copy=False)
+    return tuple(metadata['date_range']), agg_df
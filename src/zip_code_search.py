@@ -1,4 +1,9 @@
+import bisect
+
+import pandas as pd
+
 from src.data_cleaning import process_and_format_crash_data
+from src.result_cache import estimate_size
 
 
 def get_all_unique_zip_codes(df):
@@ -14,6 +19,105 @@ def get_all_unique_zip_codes(df):
     return df['zip_code'].unique()
 
 
+class ZipPrefixIndex:
+    """
+    The zip codes of one dataset as a sorted list of strings, so the zip codes starting with a
+    prefix are one contiguous slice found with two binary searches instead of a scan.
+    Built once per dataset; lookups only use plain Python lists.
+    """
+
+    def __init__(self, zip_codes):
+        unique_zip_codes = {int(zip_code) for zip_code in pd.Series(zip_codes).dropna().unique()}
+        self.zip_strings = sorted(str(zip_code) for zip_code in unique_zip_codes)
+        self.zip_codes = [int(zip_string) for zip_string in self.zip_strings]
+
+    def __len__(self):
+        return len(self.zip_codes)
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + estimate_size(self.zip_strings) + estimate_size(self.zip_codes)
+
+    def __contains__(self, zip_code):
+        zip_string = str(zip_code)
+        position = bisect.bisect_left(self.zip_strings, zip_string)
+        return position < len(self.zip_strings) and self.zip_strings[position] == zip_string
+
+    def lookup(self, prefix, limit=None):
+        """
+        Return the zip codes starting with prefix in ascending order.
+
+        Parameters:
+        prefix (str): The typed beginning of a zip code
+        limit (int): The maximum number of zip codes to return, all of them if None
+
+        Returns:
+        list: The matching zip codes as ints
+        """
+        start = bisect.bisect_left(self.zip_strings, prefix)
+        # every string starting with prefix sorts before prefix followed by the highest code point
+        end = bisect.bisect_left(self.zip_strings, prefix + '\U0010ffff', lo=start)
+        if limit is not None:
+            end = min(end, start + limit)
+        return self.zip_codes[start:end]
+
+
+def create_area_records(formatted_df):
+    """
+    Return the rank, decile and accident likelihood of every zip code in one formatted area table.
+    A zip code listed under several boroughs keeps its best ranked row, like search_zip_code.
+
+    Parameters:
+    formatted_df (pd.DataFrame): A table returned from process_and_format_crash_data
+
+    Returns:
+    dict: zip code to a record dictionary
+    """
+    highest_rank = int(formatted_df['Rank'].max()) if len(formatted_df) else 0
+    ranked_df = formatted_df.sort_values('Rank', kind='stable').drop_duplicates('Zip Code')
+    records = {}
+    for zip_code, borough, accident_count, rank, decile, accident_likelihood in zip(
+            ranked_df['Zip Code'].tolist(), ranked_df['Borough'].tolist(), ranked_df['Accident Count'].tolist(),
+            ranked_df['Rank'].tolist(), ranked_df['Decile'].tolist(), ranked_df['Accident Likelihood'].tolist()):
+        records[int(zip_code)] = {
+            "rank": int(rank),
+            "highest_rank": highest_rank,
+            "decile": int(decile),
+            "accident_likelihood": float(accident_likelihood),
+            "accident_count": int(accident_count),
+            "borough": borough
+        }
+    return records
+
+
+def create_zip_records(area_tables):
+    """
+    Build the search result of every zip code from the formatted tables of a dataset, so a search
+    is one dictionary lookup instead of ranking the dataset again.
+
+    Parameters:
+    area_tables (dict): Area to (total crashes, average crashes per zip code, formatted DataFrame)
+
+    Returns:
+    dict: zip code to the dictionary search_zip_code returns for it
+    """
+    area_records = {area: create_area_records(formatted_df)
+                    for area, (_, _, formatted_df) in area_tables.items()}
+
+    zip_records = {}
+    for zip_code, record in area_records['Citywide'].items():
+        borough_record = area_records.get(record['borough'], {}).get(zip_code)
+        zip_records[zip_code] = {
+            "citywide_record": record,
+            "borough_record": None if borough_record is None else {
+                "rank": borough_record['rank'],
+                "highest_rank": borough_record['highest_rank'],
+                "decile": borough_record['decile'],
+                "accident_likelihood": borough_record['accident_likelihood']
+            }
+        }
+    return zip_records
+
+
 def search_zip_code(df, zip_code):
     """
     Search for a zip code in the citywide dataset and return the rank, decile, accident likelihood, and accident count for the zip code.
@@ -23,19 +23,51 @@
 //         col.style.display = anyExpanded ? "table-cell" : "none";
 //     });
 // }
+// The rows of a decile are only fetched the first time it is expanded
+function loadAccordionRows(content) {
+    if (content.dataset.loaded) {
+        return Promise.resolve();
+    }
+    return fetch(content.dataset.url)
+        .then(function (response) {
+            if (!response.ok) {
+                throw new Error('Loading the decile rows failed with status ' + response.status);
+            }
+            return response.text();
+        })
+        .then(function (html) {
+            content.innerHTML = html;
+            content.dataset.loaded = 'true';
+        });
+}
+
 function toggleAccordion(id) {
     var content = document.getElementById(id);
     var button = document.getElementById('button-' + id);
     // Use computed style instead of inline style for a reliable check.
     var computedDisplay = window.getComputedStyle(content).display;
     if (computedDisplay === "none") {
-        content.style.display = "table-row-group";
-        button.textContent = "Collapse";
+        button.disabled = true;
+        loadAccordionRows(content)
+            .then(function () {
+                content.style.display = "table-row-group";
+                button.textContent = "Collapse";
+                updateExtraColumns();
+            })
+            .catch(function (error) {
+                console.error(error);
+            })
+            .finally(function () {
+                button.disabled = false;
+            });
     } else {
         content.style.display = "none";
         button.textContent = "Expand";
+        updateExtraColumns();
     }
-    
+}
+
+function updateExtraColumns() {
     // Check each accordion-content using computed style.
     var accordions = document.querySelectorAll('.accordion-content');
     var anyExpanded = false;
@@ -50,4 +82,4 @@ function toggleAccordion(id) {
     extraCols.forEach(function(col) {
         col.style.display = anyExpanded ? "table-cell" : "none";
     });
-}
\ No newline at end of file
+}
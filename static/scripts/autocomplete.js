@@ -1,27 +1,60 @@
 const searchInput = document.getElementById('zipcode-search');
 const autocompleteList = document.getElementById('autocomplete-list');
 
+// Wait for a pause in typing before asking the server, and reuse the suggestions of earlier queries
+const AUTOCOMPLETE_DELAY_MS = 150;
+const AUTOCOMPLETE_LIMIT = 10;
+const suggestionCache = new Map();
+let debounceTimer = null;
+let pendingRequest = null;
+
+function showSuggestions(data) {
+    autocompleteList.innerHTML = ''; // Clear any existing items
+
+    data.forEach(zipcode => {
+        const item = document.createElement('div');
+        item.textContent = zipcode;
+        item.addEventListener('click', function () {
+            searchInput.value = zipcode;
+            autocompleteList.innerHTML = ''; // Close the list after selection
+        });
+        autocompleteList.appendChild(item);
+    });
+}
+
+function fetchSuggestions(query) {
+    if (suggestionCache.has(query)) {
+        showSuggestions(suggestionCache.get(query));
+        return;
+    }
+    if (pendingRequest) {
+        pendingRequest.abort(); // Only the latest query is still shown
+    }
+    pendingRequest = new AbortController();
+    const params = new URLSearchParams({ query: query, limit: AUTOCOMPLETE_LIMIT });
+    fetch(`/autocomplete_zipcode?${params}`, { signal: pendingRequest.signal })
+        .then(response => response.json())
+        .then(data => {
+            suggestionCache.set(query, data);
+            if (searchInput.value === query) {
+                showSuggestions(data);
+            }
+        })
+        .catch(error => {
+            if (error.name !== 'AbortError') {
+                console.error('Error fetching zip code suggestions:', error);
+            }
+        });
+}
+
 // Autocomplete functionality
 searchInput.addEventListener('input', function () {
     const query = this.value;
-    if (query.length > 0) { // Fetch suggestions if input has more than 2 characters
-        fetch(`/autocomplete_zipcode?query=${query}`)
-            .then(response => response.json())
-            .then(data => {
-                autocompleteList.innerHTML = ''; // Clear any existing items
-
-                data.forEach(zipcode => {
-                    const item = document.createElement('div');
-                    item.textContent = zipcode;
-                    item.addEventListener('click', function () {
-                        searchInput.value = zipcode;
-                        autocompleteList.innerHTML = ''; // Close the list after selection
-                    });
-                    autocompleteList.appendChild(item);
-                });
-            });
+    clearTimeout(debounceTimer);
+    if (query.length > 0) { // Fetch suggestions once the user stops typing
+        debounceTimer = setTimeout(() => fetchSuggestions(query), AUTOCOMPLETE_DELAY_MS);
     } else {
-        autocompleteList.innerHTML = ''; // Clear list if input is too short
+        autocompleteList.innerHTML = ''; // Clear list if input is empty
     }
 });
 
@@ -0,0 +1,253 @@
+"""
+Local HTTP stand-in for the upstream crash APIs, backed by an in-memory SQLite database.
+
+/api/v2/sql?q=...                  runs the Carto SQL query against a crashes_all_prod table
+/resource/h9gi-nx95.json?$select=  runs the SoQL query against one row per crash, answering like Socrata:
+                                   every value is a string and null fields are left out
+
+Run as a module it serves seeded synthetic records until interrupted, so the app can be
+started against it instead of the live APIs:
+
+    python -m tests.stub_server --rows 200k --months 12 --port 8700 --latency 0.05
+"""
+import argparse
+import json
+import random
+import re
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CARTO_PATH = '/api/v2/sql'
+SOCRATA_PATH = '/resource/h9gi-nx95.json'
+
+
+def split_arguments(text):
+    """
+    Split a function's argument list on the commas that are not nested in parentheses.
+    """
+    arguments, depth, current = [], 0, ''
+    for character in text:
+        if character == ',' and depth == 0:
+            arguments.append(current.strip())
+            current = ''
+            continue
+        depth += {'(': 1, ')': -1}.get(character, 0)
+        current += character
+    arguments.append(current.strip())
+    return arguments
+
+
+def translate_soql(expression):
+    """
+    Translate the SoQL functions used by SocrataDataSource to SQLite.
+    """
+    expression = re.sub(r"date_extract_y\((\w+)\)", r"CAST(substr(\1, 1, 4) AS INTEGER)", expression)
+    expression = re.sub(r"date_extract_m\((\w+)\)", r"CAST(substr(\1, 6, 2) AS INTEGER)", expression)
+    while 'case(' in expression:
+        start = expression.index('case(')
+        depth, end = 0, start + len('case')
+        for end in range(start + len('case'), len(expression)):
+            depth += {'(': 1, ')': -1}.get(expression[end], 0)
+            if depth == 0:
+                break
+        arguments = split_arguments(expression[start + len('case('):end])
+        branches = ' '.join(f"WHEN {condition} THEN {value}"
+                            for condition, value in zip(arguments[::2], arguments[1::2]))
+        expression = f"{expression[:start]}CASE {branches} END{expression[end + 1:]}"
+    expression = re.sub(r":id\b", "rowid", expression)
+    return re.sub(r"\btrue\b", "1", expression)
+
+
+class StubCrashApi:
+    """
+    Serves the records, dictionaries with zip_code, borough, crash_count, latitude, longitude,
+    year and month, through both APIs on a background thread.
+
+    Every response is delayed by latency seconds, plus up to latency_jitter seconds at random
+    and latency_per_row seconds for every row it returns, so smaller pages cost more round
+    trips and larger pages longer transfers, like they do against the real APIs.
+    """
+
+    def __init__(self, records, host='127.0.0.1', port=0, latency=0.0, latency_jitter=0.0, latency_per_row=0.0,
+                 seed=None):
+        self.database = sqlite3.connect(':memory:', check_same_thread=False)
+        self.database.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        self.requests = []
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.latency_per_row = latency_per_row
+        self.random = random.Random(seed)
+        self.load(records)
+        self.server = ThreadingHTTPServer((host, port), self.create_handler())
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def carto_url(self):
+        return self.base_url + CARTO_PATH
+
+    @property
+    def socrata_url(self):
+        return self.base_url + SOCRATA_PATH
+
+    def load(self, records):
+        self.database.execute(
+            "CREATE TABLE crashes_all_prod (cartodb_id INTEGER PRIMARY KEY, zip_code INTEGER, borough TEXT, "
+            "crash_count INTEGER, latitude REAL, longitude REAL, year INTEGER, month INTEGER)")
+        # The page queries select one month at a time in cartodb_id order
+        self.database.execute("CREATE INDEX crashes_all_prod_month ON crashes_all_prod (year, month, cartodb_id)")
+        self.database.execute(
+            "CREATE TABLE socrata_crashes (zip_code TEXT, borough TEXT, latitude REAL, longitude REAL, "
+            "crash_date TEXT)")
+        columns = ['zip_code', 'borough', 'crash_count', 'latitude', 'longitude', 'year', 'month']
+        self.database.executemany(
+            f"INSERT INTO crashes_all_prod ({', '.join(columns)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [tuple(record.get(column) for column in columns) for record in records])
+        self.database.executemany(
+            "INSERT INTO socrata_crashes VALUES (?, ?, ?, ?, ?)",
+            [(None if record.get('zip_code') is None else str(record['zip_code']),
+              None if record.get('borough') is None else record['borough'].upper(),
+              record.get('latitude'), record.get('longitude'),
+              f"{record['year']}-{str(record['month']).zfill(2)}-15T00:00:00.000")
+             for record in records for _ in range(record.get('crash_count') or 1)])
+
+    @classmethod
+    def from_synthetic(cls, row_count, seed=0, start_month=1, start_year=2024, end_month=12, end_year=2024,
+                       **options):
+        """
+        Create a stub serving row_count records of benchmarks.synthetic_data, the same records for the same seed.
+        """
+        from benchmarks.synthetic_data import generate_crash_records, to_records
+
+        records = to_records(generate_crash_records(row_count, seed=seed, start_month=start_month,
+                                                    start_year=start_year, end_month=end_month, end_year=end_year))
+        return cls(records, seed=seed, **options)
+
+    def get_delay(self, row_count):
+        delay = self.latency + self.latency_per_row * row_count
+        if self.latency_jitter:
+            delay += self.random.uniform(0, self.latency_jitter)
+        return delay
+
+    def query(self, sql):
+        with self.lock:
+            return [dict(row) for row in self.database.execute(sql).fetchall()]
+
+    def run_carto(self, params):
+        sql = params['q']
+        if not sql.lstrip().upper().startswith('SELECT'):
+            raise ValueError('only SELECT queries are supported')
+        return {'rows': self.query(sql)}
+
+    def run_socrata(self, params):
+        sql = f"SELECT {translate_soql(params['$select'])} FROM socrata_crashes"
+        if '$where' in params:
+            sql += f" WHERE {translate_soql(params['$where'])}"
+        if '$group' in params:
+            sql += f" GROUP BY {translate_soql(params['$group'])}"
+        if '$order' in params:
+            sql += f" ORDER BY {translate_soql(params['$order'])}"
+        sql += f" LIMIT {int(params.get('$limit', 1000))} OFFSET {int(params.get('$offset', 0))}"
+        return [{key: str(value) for key, value in row.items() if value is not None}
+                for row in self.query(sql)]
+
+    def create_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                stub.requests.append((url.path, params))
+                try:
+                    if url.path == CARTO_PATH:
+                        body = stub.run_carto(params)
+                    elif url.path == SOCRATA_PATH:
+                        body = stub.run_socrata(params)
+                    else:
+                        self.send_error(404)
+                        return
+                except (ValueError, KeyError, sqlite3.Error) as e:
+                    self.send_error(400, str(e))
+                    return
+                # Slept outside the database lock, so slow responses overlap like they do upstream
+                time.sleep(stub.get_delay(len(body['rows'] if isinstance(body, dict) else body)))
+                payload = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.database.close()
+
+
+def get_recent_months(month_count):
+    """
+    Return the date range of the month_count months up to the latest month the app shows by default.
+
+    Returns:
+    tuple: (start_month, start_year, end_month, end_year)
+    """
+    from src.data_fetching import get_latest_date
+
+    latest_date = get_latest_date()
+    end_index = latest_date.year * 12 + latest_date.month - 2
+    start_index = end_index - month_count + 1
+    return start_index % 12 + 1, start_index // 12, end_index % 12 + 1, end_index // 12
+
+
+def main(argv=None):
+    from benchmarks.run_benchmarks import parse_row_count
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', default='100k', help="Number of synthetic records such as 100k or 1M")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--months', type=int, default=12, help="Months of records up to the latest month")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8700)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument('--latency-jitter', type=float, default=0.0, help="Up to this many more seconds at random")
+    parser.add_argument('--latency-per-row', type=float, default=0.0, help="Seconds added for every returned row")
+    args = parser.parse_args(argv)
+
+    start_month, start_year, end_month, end_year = get_recent_months(args.months)
+    stub = StubCrashApi.from_synthetic(
+        parse_row_count(args.rows), seed=args.seed, start_month=start_month, start_year=start_year,
+        end_month=end_month, end_year=end_year, host=args.host, port=args.port, latency=args.latency,
+        latency_jitter=args.latency_jitter, latency_per_row=args.latency_per_row)
+    print(f"Serving {args.rows} records of {start_year}-{start_month:02d} to {end_year}-{end_month:02d}, "
+          f"start the app with:\n"
+          f"    CRASH_DATA_SOURCE=carto CARTO_SQL_URL={stub.carto_url} SOCRATA_URL={stub.socrata_url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+        stub.database.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+import app
+from src.data_fetching import format_year_month
+from src.data_storage import fetch_csv_file
+from src.dataset_refresher import DatasetRefresher
+from src.dataset_views import DatasetViews
+from src.disk_cache import DiskCache
+from src.map_cache import MapCache
+from src.result_cache import ResultCache
+
+# The dataset shipped with the app, served for every date range
+SAMPLE_DATASET = 'accidents_2_2025-2_2025.csv'
+
+REPOSITORY_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+# Fails on any HTTP request made while app.py is imported
+IMPORT_WITHOUT_NETWORK = """
+from unittest import mock
+import requests
+with mock.patch.object(requests.Session, 'send', side_effect=AssertionError('app.py fetched on import')):
+    import app
+assert app.default_dataset.peek() is None
+"""
+
+
+class TestAppImport(unittest.TestCase):
+    def test_import_does_not_warm_up(self):
+        result = subprocess.run([sys.executable, '-c', IMPORT_WITHOUT_NETWORK], cwd=REPOSITORY_DIR,
+                                capture_output=True, text=True, timeout=120)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+
+class TestLoadAggregatedData(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.agg_df = pd.DataFrame({'zip_code': [10001, 11207], 'borough': ['Manhattan', 'Brooklyn'],
+                                    'total_crashes': [5, 3]})
+        for patcher in (mock.patch.object(app, 'dataset_cache', DiskCache(temp_dir.name, 10 ** 6)),
+                        mock.patch.object(app, 'fetch_and_aggregate_crash_data', return_value=self.agg_df)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_final_ranges_are_kept_on_disk(self):
+        app.load_aggregated_data(1, 2020, 2, 2020)
+        app.load_aggregated_data(1, 2020, 2, 2020)
+        self.assertEqual(app.fetch_and_aggregate_crash_data.call_count, 1)
+        self.assertEqual(len(app.dataset_cache.file_names()), 1)
+
+    def test_ranges_ending_in_a_recent_month_are_rebuilt(self):
+        date_range = app.get_default_date_range()
+        app.load_aggregated_data(1, 2020, *date_range[2:])
+        app.load_aggregated_data(*date_range)
+        app.load_aggregated_data(*date_range)
+        self.assertEqual(app.fetch_and_aggregate_crash_data.call_count, 3)
+        self.assertEqual(app.dataset_cache.file_names(), [])
+
+
+class AppTestCase(unittest.TestCase):
+    """
+    Runs the app on the shipped sample dataset with empty caches in a temporary directory,
+    without fetching crash data.
+    """
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.agg_df = fetch_csv_file(SAMPLE_DATASET)
+        default_dataset = DatasetRefresher(app.get_default_date_range, lambda date_range: None, 3600)
+        default_dataset.publish(app.get_default_date_range(), DatasetViews(self.agg_df.copy()))
+        self.addCleanup(default_dataset.stop)
+        patchers = [
+            mock.patch.object(app, 'default_dataset', default_dataset),
+            mock.patch.object(app, 'fetch_and_aggregate_crash_data', side_effect=lambda *args: self.agg_df.copy()),
+            mock.patch.object(app, 'dataset_cache', DiskCache(os.path.join(temp_dir.name, 'datasets'), 10 ** 8)),
+            mock.patch.object(app, 'result_cache', ResultCache(10 ** 8)),
+            mock.patch.object(app, 'compressed_cache', ResultCache(10 ** 8)),
+            mock.patch.object(app, 'map_cache', MapCache(10 ** 8, 10 ** 8, os.path.join(temp_dir.name, 'maps'))),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = app.app.test_client()
+
+
+class TestAutocomplete(AppTestCase):
+    def test_any_query_is_answered(self):
+        for query in ('1', '"', 'W/"x"', '\\', ' '):
+            response = self.client.get('/autocomplete_zipcode', query_string={'query': query})
+            self.assertEqual(response.status_code, 200, query)
+            suggestions = response.get_json()
+            self.assertTrue(all(str(zip_code).startswith(query) for zip_code in suggestions))
+
+            revalidated = self.client.get('/autocomplete_zipcode', query_string={'query': query},
+                                          headers={'If-None-Match': response.headers['ETag']})
+            self.assertEqual(revalidated.status_code, 304, query)
+        self.assertTrue(self.client.get('/autocomplete_zipcode?query=1').get_json())
+
+
+class TestViews(AppTestCase):
+    """
+    View URLs hold the whole state of a page, only the redirects to them read the session.
+    """
+
+    CANONICAL_URL = '/view/Queens/2025-01/2025-02'
+
+    def test_area_redirects_to_the_canonical_url(self):
+        start_month, start_year, end_month, end_year = app.get_default_date_range()
+        response = self.client.get('/view/Brooklyn')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.headers['Location'], '/view/Brooklyn/{}/{}'.format(
+            format_year_month(start_month, start_year), format_year_month(end_month, end_year)))
+        self.assertEqual(self.client.get('/view/Nowhere').status_code, 404)
+
+    def test_download_remembers_the_range(self):
+        response = self.client.post('/download', data={
+            'area': 'Queens', 'start_month': 1, 'start_year': 2025, 'end_month': 2, 'end_year': 2025})
+        self.assertEqual(response.status_code, 303)
+        self.assertEqual(response.headers['Location'], self.CANONICAL_URL)
+
+        self.assertEqual(self.client.get('/view/Manhattan').headers['Location'], '/view/Manhattan/2025-01/2025-02')
+        self.assertEqual(self.client.get('/view_map/Manhattan').headers['Location'],
+                         '/view_map/Manhattan/2025-01/2025-02')
+
+        # An invalid range goes back to the one chosen before
+        response = self.client.get('/download', query_string={
+            'area': 'Queens', 'start_month': 3, 'start_year': 2025, 'end_month': 1, 'end_year': 2025})
+        self.assertEqual(response.status_code, 303)
+        self.assertEqual(response.headers['Location'], self.CANONICAL_URL)
+
+    def test_invalid_ranges_are_not_found(self):
+        for url in ('/view/Citywide/2025-13/2025-02',
+                    '/view/Citywide/2025-03/2025-01',
+                    '/view/Citywide/2025-1/2025-02',
+                    '/view/Citywide/2025/2025-02',
+                    '/view/Citywide/abcd-01/2025-02',
+                    '/view/Citywide/1900-01/1900-02',
+                    '/view/Nowhere/2025-01/2025-02',
+                    '/view/Citywide/2025-03/2025-01/deciles/1',
+                    '/view_map/Citywide/2025-13/2025-02'):
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+
+    def test_canonical_responses_are_shared(self):
+        # One client without a session and one that chose a range before
+        with_session = app.app.test_client()
+        with_session.post('/download', data={
+            'area': 'Queens', 'start_month': 1, 'start_year': 2025, 'end_month': 2, 'end_year': 2025})
+
+        for url in (self.CANONICAL_URL, self.CANONICAL_URL + '/deciles/1', '/view_map/Queens/2025-01/2025-02'):
+            responses = [client.get(url) for client in (self.client, with_session)]
+            for response in responses:
+                self.assertEqual(response.status_code, 200, url)
+                self.assertIn('public', response.headers['Cache-Control'], url)
+                self.assertNotIn('private', response.headers['Cache-Control'], url)
+                self.assertNotIn('cookie', response.headers.get('Vary', '').lower(), url)
+                self.assertNotIn('Set-Cookie', response.headers, url)
+            self.assertEqual(responses[0].data, responses[1].data, url)
+        self.assertEqual(app.fetch_and_aggregate_crash_data.call_count, 1)
+
+    def test_repeat_request_is_not_modified(self):
+        response = self.client.get(self.CANONICAL_URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Queens', response.data)
+
+        revalidated = self.client.get(self.CANONICAL_URL, headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.headers['ETag'], response.headers['ETag'])
+        self.assertFalse(revalidated.data)
+        self.assertEqual(self.client.get('/view/Manhattan/2025-01/2025-02', headers={
+            'If-None-Match': response.headers['ETag']}).status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
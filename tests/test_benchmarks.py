@@ -0,0 +1,76 @@
+import unittest
+
+import numpy as np
+import shapely
+
+from benchmarks.load_test import get_route_label, summarize
+from benchmarks.run_benchmarks import compare_results, parse_row_count
+from benchmarks.synthetic_data import generate_crash_records, get_zip_polygons
+
+
+class TestSyntheticData(unittest.TestCase):
+    def test_same_seed_same_records(self):
+        df = generate_crash_records(2000, seed=3)
+        self.assertTrue(df.equals(generate_crash_records(2000, seed=3)))
+        self.assertFalse(df.equals(generate_crash_records(2000, seed=4)))
+
+    def test_points_fall_inside_their_zip_code(self):
+        df = generate_crash_records(2000, seed=1, missing_zip_rate=0, missing_coordinates_rate=0,
+                                    partial_coordinates_rate=0)
+        zip_codes, _, polygons = get_zip_polygons()
+        polygon_by_zip = dict(zip(zip_codes.tolist(), polygons))
+        inside = [shapely.contains_xy(polygon_by_zip[int(zip_code)], longitude, latitude)
+                  for zip_code, latitude, longitude in zip(df['zip_code'], df['latitude'], df['longitude'])]
+        # Coordinates are rounded to 6 decimals, which can move a point just across a border
+        self.assertGreater(np.mean(inside), 0.99)
+
+    def test_missing_rates(self):
+        df = generate_crash_records(20000, seed=2, missing_zip_rate=0.3, missing_borough_rate=0.2,
+                                    missing_coordinates_rate=0.1, partial_coordinates_rate=0)
+        self.assertAlmostEqual(df['zip_code'].isna().mean(), 0.3, delta=0.02)
+        self.assertAlmostEqual(df['borough'].isna().mean(), 0.2, delta=0.02)
+        self.assertAlmostEqual(df['latitude'].isna().mean(), 0.1, delta=0.02)
+        self.assertTrue((df['latitude'].isna() == df['longitude'].isna()).all())
+
+
+class TestCompareResults(unittest.TestCase):
+    def test_regressions_beyond_tolerance(self):
+        baseline = [{'stage': 'fill_missing_data', 'rows': 10000, 'wall_seconds': 0.1, 'peak_memory_bytes': 10 * 2 ** 20},
+                    {'stage': 'preprocess_dataframe', 'rows': 10000, 'wall_seconds': 0.001, 'peak_memory_bytes': 0}]
+        results = [{'stage': 'fill_missing_data', 'rows': 10000, 'wall_seconds': 0.2, 'peak_memory_bytes': 11 * 2 ** 20},
+                   {'stage': 'preprocess_dataframe', 'rows': 10000, 'wall_seconds': 0.003, 'peak_memory_bytes': 0},
+                   {'stage': 'fill_missing_data', 'rows': 100000, 'wall_seconds': 5.0, 'peak_memory_bytes': 0}]
+        regressions = compare_results(baseline, results, max_slowdown=0.25, max_memory_growth=0.25)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn('fill_missing_data at 10,000 rows', regressions[0])
+
+    def test_parse_row_count(self):
+        self.assertEqual([parse_row_count(value) for value in ('10k', '1M', '2.5m', '500')],
+                         [10000, 1000000, 2500000, 500])
+
+
+class TestLoadTestSummary(unittest.TestCase):
+    def test_route_labels(self):
+        self.assertEqual(get_route_label('http://localhost/'), '/')
+        self.assertEqual(get_route_label('/view/The%20Bronx'), '/view/<area>')
+        self.assertEqual(get_route_label('/view/Citywide/2025-01/2025-03?x=1'), '/view/<area>/<start>/<end>')
+        self.assertEqual(get_route_label('/view/Citywide/2025-01/2025-03/deciles/4'),
+                         '/view/<area>/<start>/<end>/deciles/<decile>')
+        self.assertEqual(get_route_label('/search?zipcode=10001'), '/search')
+
+    def test_percentiles_and_errors_per_route(self):
+        samples = [('/search', 200, seconds / 1000) for seconds in range(1, 101)]
+        samples += [('/', 304, 0.002), ('/', 500, 0.004), ('/', None, 0.006)]
+        summary = summarize(samples, elapsed=2.0)
+
+        self.assertEqual([row['route'] for row in summary], ['/', '/search', 'all'])
+        index, search, total = summary
+        self.assertEqual((index['requests'], index['errors'], index['not_modified']), (3, 2, 1))
+        self.assertAlmostEqual(search['p50_ms'], 50.5)
+        self.assertAlmostEqual(search['p99_ms'], 99.01)
+        self.assertEqual(total['requests'], 103)
+        self.assertAlmostEqual(total['throughput_rps'], 51.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src.crash_cube import CrashCube
+from src.data_cleaning import aggregate_crashes_by_zip
+
+
+def create_month_df(rng):
+    zip_codes = rng.choice([10001, 10002, 11207, 11385, 10451], size=6)
+    return pd.DataFrame({
+        'zip_code': zip_codes,
+        'borough': np.where(zip_codes >= 11000, 'Brooklyn', 'Manhattan'),
+        'crash_count': rng.integers(0, 20, size=6),
+    }).drop_duplicates(['zip_code', 'borough'])
+
+
+class TestCrashCube(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.monthly_dfs = {(year, month): create_month_df(rng)
+                            for year in (2019, 2020) for month in range(1, 13)}
+        self.cube = CrashCube()
+        self.cube.add_months(self.monthly_dfs)
+
+    def test_aggregate_matches_groupby(self):
+        for start, end in [((1, 2019), (12, 2020)), ((3, 2019), (3, 2019)), ((11, 2019), (2, 2020))]:
+            months = [key for key in self.monthly_dfs if start[::-1] <= key <= end[::-1]]
+            expected = aggregate_crashes_by_zip(pd.concat([self.monthly_dfs[key] for key in months]))
+            actual = self.cube.aggregate(*start, *end)
+            pd.testing.assert_frame_equal(actual.reset_index(drop=True), expected.reset_index(drop=True),
+                                          check_dtype=False)
+
+    def test_covers_range(self):
+        self.assertTrue(self.cube.covers_range(1, 2019, 12, 2020))
+        self.assertFalse(self.cube.covers_range(12, 2020, 1, 2021))
+        self.assertFalse(self.cube.has_month(1, 2018))
+
+    def test_added_month_replaces_earlier_counts(self):
+        replacement = pd.DataFrame({'zip_code': [10001], 'borough': ['Manhattan'], 'crash_count': [5]})
+        self.cube.add_months({(2020, 6): replacement})
+        pd.testing.assert_frame_equal(self.cube.sum_range(6, 2020, 6, 2020), replacement, check_dtype=False)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,15 @@
-from src.data_fetching import is_date_range_valid, get_current_month, get_current_year, fetch_crash_data
+from src.data_fetching import is_date_range_valid, get_current_month, get_current_year, fetch_crash_data, get_months_in_range, group_consecutive_months, map_months, parse_year_month, format_year_month
+import threading
+import time
 import unittest
 import sys
 import os
+import requests
+from unittest import mock
+
+from src import data_fetching
+from src.data_sources import CartoDataSource
+from stub_server import StubCrashApi
 
 # Add the src directory to the Python path
 sys.path.insert(0, os.path.abspath(
@@ -87,6 +95,108 @@ class TestIsDateRangeValid(unittest.TestCase):
         pass
 
 
+class TestMonthRanges(unittest.TestCase):
+    def test_months_in_range_crosses_year(self):
+        self.assertEqual(get_months_in_range(11, 2023, 2, 2024),
+                         [(2023, 11), (2023, 12), (2024, 1), (2024, 2)])
+
+    def test_single_month_range(self):
+        self.assertEqual(get_months_in_range(8, 2011, 8, 2011), [(2011, 8)])
+
+    def test_group_consecutive_months(self):
+        months = [(2023, 11), (2023, 12), (2024, 2), (2024, 3), (2024, 5)]
+        self.assertEqual(group_consecutive_months(months),
+                         [[(2023, 11), (2023, 12)], [(2024, 2), (2024, 3)], [(2024, 5)]])
+
+    def test_parse_year_month(self):
+        self.assertEqual(parse_year_month('2025-02'), (2, 2025))
+        self.assertEqual(format_year_month(*parse_year_month('2011-12')), '2011-12')
+        for value in ('2025-2', '2025-13', '25-02', '2025/02', 'abcd-ef', ''):
+            with self.assertRaises(ValueError):
+                parse_year_month(value)
+
+
+class TestMapMonths(unittest.TestCase):
+    def test_results_keep_month_order_under_concurrency(self):
+        months = get_months_in_range(1, 2020, 12, 2021)
+        lock = threading.Lock()
+        running, peak = [0], [0]
+
+        def fetch_month(year, month):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.01 * (month % 3))  # later months often finish first
+            with lock:
+                running[0] -= 1
+            return year * 100 + month
+
+        results = list(map_months(fetch_month, months, max_workers=4))
+        self.assertEqual(results, [((year, month), year * 100 + month) for year, month in months])
+        self.assertLessEqual(peak[0], 4)
+        self.assertGreater(peak[0], 1)
+
+    def test_failed_month_is_retried(self):
+        attempts = []
+
+        def fetch_month(year, month):
+            attempts.append((year, month))
+            if (year, month) == (2020, 2) and attempts.count((2020, 2)) == 1:
+                raise requests.exceptions.Timeout('timed out')
+            return month
+
+        results = list(map_months(fetch_month, [(2020, 1), (2020, 2), (2020, 3)], max_workers=2))
+        self.assertEqual([result for _, result in results], [1, 2, 3])
+        self.assertEqual(attempts.count((2020, 2)), 2)
+
+
+class TestFetchCrashDataFromStub(unittest.TestCase):
+    """
+    fetch_crash_data against the local stand-in of the Carto API instead of the live one.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = StubCrashApi.from_synthetic(3000, seed=5, start_month=1, start_year=2020, end_month=3,
+                                               end_year=2020, latency=0.02).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.stop()
+
+    def fetch(self, page_size, *date_range):
+        source = CartoDataSource(self.stub.carto_url)
+        with mock.patch.object(data_fetching, 'get_data_source', return_value=source), \
+                mock.patch.object(data_fetching, 'PAGE_SIZE', page_size):
+            return fetch_crash_data(*date_range)
+
+    def test_valid_range(self):
+        records = self.fetch(500, 1, 2020, 3, 2020)
+        self.assertEqual(len(records), 3000)
+        self.assertEqual([record['id'] for record in records], list(range(3000)))
+        months = [record['month'] for record in records]
+        self.assertEqual(months, sorted(months))
+
+    def test_records_are_numbered_in_place(self):
+        pages = [[{'zip_code': 10001}, {'zip_code': 11207}], [{'zip_code': 10463}]]
+        with mock.patch.object(data_fetching, 'iter_crash_data_months', return_value=[((2020, 1), pages)]):
+            records = fetch_crash_data(1, 2020, 1, 2020)
+        self.assertEqual([record['id'] for record in records], [0, 1, 2])
+        self.assertTrue(all(record is page_record
+                            for record, page_record in zip(records, pages[0] + pages[1])))
+
+    def test_range_without_data(self):
+        self.assertEqual(self.fetch(500, 8, 2011, 9, 2011), [])
+
+    def test_page_size_sets_requests_and_latency(self):
+        requests_before = len(self.stub.requests)
+        start = time.perf_counter()
+        records = self.fetch(400, 2, 2020, 2, 2020)
+        elapsed = time.perf_counter() - start
+        # Every full page is followed by one more request, the last one is short or empty
+        pages = len(self.stub.requests) - requests_before
+        self.assertEqual(pages, len(records) // 400 + 1)
+        self.assertGreaterEqual(elapsed, pages * self.stub.latency)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,94 @@
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_data import generate_crash_records
+from src import data_cleaning
+from src.data_cleaning import fill_missing_data, preprocess_dataframe
+from src.data_loading import (NO_ZIP_LAT_LONG_BOROUGH, NO_ZIP_LAT_LONG_NO_BOROUGH, NO_ZIP_NO_LAT_LONG_BOROUGH,
+                              NO_ZIP_NO_LAT_LONG_NO_BOROUGH, PARTIAL_LAT_LONG, ZIP_LAT_LONG_BOROUGH,
+                              ZIP_LAT_LONG_NO_BOROUGH, ZIP_NO_LAT_LONG_BOROUGH, ZIP_NO_LAT_LONG_NO_BOROUGH,
+                              get_missingness_codes)
+from src.data_processing import assign_zip_codes_polygon, create_zip_to_borough_dict, update_boroughs
+from src.reference_index import ReferenceIndex
+
+K = 5
+
+
+def split_masks(df):
+    """
+    The conditions the dataframe used to be split on, one per combination of present and missing data.
+    """
+    has_zip = df["zip_code"].notna()
+    has_lat_long = df["latitude"].notna() & df["longitude"].notna()
+    no_lat_long = df["latitude"].isna() & df["longitude"].isna()
+    has_borough = df["borough"].notna()
+    return {
+        ZIP_LAT_LONG_BOROUGH: has_zip & has_lat_long & has_borough,
+        ZIP_LAT_LONG_NO_BOROUGH: has_zip & has_lat_long & ~has_borough,
+        ZIP_NO_LAT_LONG_BOROUGH: has_zip & no_lat_long & has_borough,
+        ZIP_NO_LAT_LONG_NO_BOROUGH: has_zip & no_lat_long & ~has_borough,
+        NO_ZIP_LAT_LONG_BOROUGH: ~has_zip & has_lat_long & has_borough,
+        NO_ZIP_LAT_LONG_NO_BOROUGH: ~has_zip & has_lat_long & ~has_borough,
+        NO_ZIP_NO_LAT_LONG_BOROUGH: ~has_zip & no_lat_long & has_borough,
+        NO_ZIP_NO_LAT_LONG_NO_BOROUGH: ~has_zip & no_lat_long & ~has_borough,
+    }
+
+
+def fill_missing_data_by_splitting(df, k, reference_index):
+    """
+    fill_missing_data as it was before get_missingness_codes: split, fill the parts and concatenate them.
+    """
+    masks = split_masks(df)
+    # The parts without a zip code and a location can not be filled and were left out
+    parts = {code: df[mask] for code, mask in masks.items()
+             if code not in (NO_ZIP_NO_LAT_LONG_BOROUGH, NO_ZIP_NO_LAT_LONG_NO_BOROUGH)}
+    training = parts[ZIP_LAT_LONG_BOROUGH]
+    zip_borough_map = create_zip_to_borough_dict(training)
+    for code in (NO_ZIP_LAT_LONG_BOROUGH, NO_ZIP_LAT_LONG_NO_BOROUGH):
+        if not parts[code].empty:
+            parts[code] = assign_zip_codes_polygon(training, parts[code].copy(), k, reference_index=reference_index)
+    return update_boroughs(pd.concat(parts.values()), zip_borough_map)
+
+
+def create_frame():
+    df = generate_crash_records(3000, seed=7, missing_zip_rate=0.4, missing_borough_rate=0.4,
+                                missing_coordinates_rate=0.3, partial_coordinates_rate=0.05)
+    # Crashes without a zip code in the harbor, outside every polygon
+    harbor = pd.DataFrame({'zip_code': [np.nan, np.nan], 'borough': pd.array(['Manhattan', None], dtype='str'),
+                           'crash_count': [1, 2], 'latitude': [40.69, 40.68], 'longitude': [-74.03, -74.04],
+                           'year': [2024, 2024], 'month': [1, 1]})
+    return preprocess_dataframe(pd.concat([df, harbor], ignore_index=True))
+
+
+class TestMissingnessCodes(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.reference_index = ReferenceIndex(temp_dir.name)
+        patcher = mock.patch.object(data_cleaning, 'get_reference_index', return_value=self.reference_index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.df = create_frame()
+
+    def test_codes_match_split_conditions(self):
+        codes = get_missingness_codes(self.df)
+        masks = split_masks(self.df)
+        for code, mask in masks.items():
+            self.assertTrue(mask.any(), f"no rows of combination {code}")
+            np.testing.assert_array_equal(codes == code, mask.to_numpy())
+        partial = self.df["latitude"].notna() != self.df["longitude"].notna()
+        self.assertTrue(partial.any())
+        np.testing.assert_array_equal(codes == PARTIAL_LAT_LONG, partial.to_numpy())
+
+    def test_fill_missing_data_matches_splitting(self):
+        expected = fill_missing_data_by_splitting(self.df.copy(), K, self.reference_index).sort_index()
+        result = fill_missing_data(self.df.copy(), K).sort_index()
+        pd.testing.assert_frame_equal(result, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src.data_processing import assign_zip_codes_polygon, get_neighbor_majority
+from src.geometry_registry import get_zip_geometry_registry
+
+
+class TestNeighborMajority(unittest.TestCase):
+    def test_matches_bincount_argmax(self):
+        rng = np.random.default_rng(0)
+        neighbor_zips = rng.choice([10001, 10463, 11207, 11434], size=(2000, 5))
+        expected = np.apply_along_axis(lambda zips: np.bincount(zips).argmax(), 1, neighbor_zips)
+        np.testing.assert_array_equal(get_neighbor_majority(neighbor_zips), expected)
+
+    def test_tie_goes_to_smallest_zip(self):
+        neighbor_zips = np.array([[11434, 10001, 11434, 10001, 11207]])
+        self.assertEqual(get_neighbor_majority(neighbor_zips)[0], 10001)
+
+    def test_distance_weighted_vote(self):
+        neighbor_zips = np.array([[11207, 10001, 10001]])
+        distances = np.array([[0.001, 0.01, 0.01]])
+        self.assertEqual(get_neighbor_majority(neighbor_zips)[0], 10001)
+        self.assertEqual(get_neighbor_majority(neighbor_zips, distances)[0], 11207)
+
+
+class TestAssignZipCodesPolygon(unittest.TestCase):
+    def test_polygon_lookup_with_knn_fallback(self):
+        registry = get_zip_geometry_registry()
+        row = registry.zip_to_row['11207']
+        df_with_zip = pd.DataFrame({'zip_code': pd.array([10001, 10280], dtype='Int32'),
+                                    'latitude': [40.75, 40.70], 'longitude': [-73.99, -74.02]})
+        df_without_zip = pd.DataFrame({
+            'zip_code': pd.array([None, None], dtype='Int32'),
+            # the centroid of 11207 and a point in the harbor outside every polygon
+            'latitude': np.array([registry.centroid_latitudes[row], 40.69], dtype='float32'),
+            'longitude': np.array([registry.centroid_longitudes[row], -74.03], dtype='float32'),
+        })
+
+        result = assign_zip_codes_polygon(df_with_zip, df_without_zip, 1, registry)
+        self.assertListEqual(list(result['zip_code']), [11207, 10280])
+
+
+if __name__ == "__main__":
+    unittest.main()
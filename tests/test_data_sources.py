@@ -0,0 +1,179 @@
+import multiprocessing
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+import requests
+
+from src import data_cleaning, data_fetching, data_sources
+from src.data_sources import CartoDataSource, CrashDataSource, SocrataDataSource, PageFetchError, ResumePoint
+from src.geometry_registry import get_zip_geometry_registry
+from src.reference_index import ReferenceIndex
+from stub_server import StubCrashApi
+
+
+def create_records():
+    registry = get_zip_geometry_registry()
+    records = []
+    for month in (1, 2):
+        for zip_code, borough in (('11207', 'Brooklyn'), ('10001', 'Manhattan'), ('10463', 'Bronx')):
+            row = registry.zip_to_row[zip_code]
+            latitude = float(registry.centroid_latitudes[row])
+            longitude = float(registry.centroid_longitudes[row])
+            records += [
+                {'zip_code': int(zip_code), 'borough': borough, 'crash_count': 2,
+                 'latitude': latitude, 'longitude': longitude, 'year': 2020, 'month': month},
+                {'zip_code': int(zip_code), 'borough': None, 'crash_count': 1,
+                 'latitude': None, 'longitude': None, 'year': 2020, 'month': month},
+                {'zip_code': None, 'borough': None, 'crash_count': 3,
+                 'latitude': latitude, 'longitude': longitude, 'year': 2020, 'month': month},
+                {'zip_code': int(zip_code), 'borough': borough, 'crash_count': 5,
+                 'latitude': latitude, 'longitude': None, 'year': 2020, 'month': month},
+            ]
+    return records
+
+
+def exit_with_fresh_session(parent_session):
+    # Exits with 0 when the forked process builds its own session rather than reusing the parent's
+    fresh = data_sources._http_session is None and data_sources.get_http_session() is not parent_session
+    raise SystemExit(0 if fresh else 1)
+
+
+class TestDataSources(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.records = create_records()
+        cls.stub = StubCrashApi(cls.records).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.stop()
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.reference_index = ReferenceIndex(temp_dir.name)
+        patcher = mock.patch.object(data_cleaning, 'get_reference_index', return_value=self.reference_index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def clean_months(self, source, pushdown, page_size=data_fetching.PAGE_SIZE):
+        with mock.patch.object(data_cleaning, 'get_data_source', return_value=source), \
+                mock.patch.object(data_fetching, 'get_data_source', return_value=source), \
+                mock.patch.object(data_fetching, 'PAGE_SIZE', page_size), \
+                mock.patch.object(data_cleaning, 'PUSHDOWN_ENABLED', pushdown), \
+                mock.patch.object(data_cleaning, 'update_reference_index'):
+            monthly_dfs = data_cleaning.fetch_and_clean_months([(2020, 1), (2020, 2)], 5)
+        return pd.concat(list(monthly_dfs.values()), ignore_index=True).astype({'zip_code': 'int64'})
+
+    def test_carto_fetch_records(self):
+        records = CartoDataSource(self.stub.carto_url).fetch_records(2, 2020, 2, 2020)
+        self.assertEqual(len(records), len(self.records) // 2)
+        self.assertEqual({record['month'] for record in records}, {2})
+
+    def test_socrata_zip_counts(self):
+        zip_counts = SocrataDataSource(self.stub.socrata_url).fetch_zip_counts(1, 2020, 1, 2020)
+        brooklyn = [row for row in zip_counts if row['zip_code'] == '11207' and row.get('borough') == 'Brooklyn']
+        self.assertEqual(sorted((row['location_state'], row['crash_count']) for row in brooklyn), [(1, 5), (2, 2)])
+
+    def test_pushdown_matches_raw_records(self):
+        self.reference_index.add_months([(2019, 1)], [40.75], [-73.99], [10001])
+        for source in (CartoDataSource(self.stub.carto_url), SocrataDataSource(self.stub.socrata_url)):
+            raw_df = self.clean_months(source, pushdown=False)
+            pushdown_df = self.clean_months(source, pushdown=True)
+            pd.testing.assert_frame_equal(raw_df, pushdown_df, check_dtype=False)
+            self.assertEqual(raw_df['crash_count'].sum(), 2 * 3 * (2 + 1 + 3))
+
+    def test_pushdown_adds_new_months_to_the_reference_index(self):
+        for source in (CartoDataSource(self.stub.carto_url), SocrataDataSource(self.stub.socrata_url)):
+            with tempfile.TemporaryDirectory() as reference_dir:
+                reference_index = ReferenceIndex(reference_dir)
+                reference_index.add_months([(2019, 1)], [40.75], [-73.99], [10001])
+                with mock.patch.object(data_cleaning, 'get_reference_index', return_value=reference_index), \
+                        mock.patch.object(data_cleaning, 'get_data_source', return_value=source), \
+                        mock.patch.object(data_cleaning, 'PUSHDOWN_ENABLED', True), \
+                        mock.patch.object(data_cleaning, 'fetch_and_clean_months_pushdown',
+                                          wraps=data_cleaning.fetch_and_clean_months_pushdown) as pushdown:
+                    data_cleaning.fetch_and_clean_months([(2020, 1)], 5)
+                    self.assertEqual(reference_index.months, {'2019-01', '2020-01'})
+                    data_cleaning.fetch_and_clean_months([(2020, 2)], 5)
+                    self.assertEqual(reference_index.months, {'2019-01', '2020-01', '2020-02'})
+                self.assertEqual(pushdown.call_count, 2)
+                # One geocoded location with a zip code and borough per zip code, the same in both months
+                self.assertEqual(len(reference_index), 1 + 3)
+
+    def test_socrata_queries_are_paged(self):
+        source = SocrataDataSource(self.stub.socrata_url)
+        with mock.patch('src.data_sources.PAGE_SIZE', 4):
+            zip_counts = source.fetch_zip_counts(1, 2020, 2, 2020)
+            records = source.fetch_records(1, 2020, 2, 2020)
+        self.assertEqual(sorted(map(str, zip_counts)), sorted(map(str, source.fetch_zip_counts(1, 2020, 2, 2020))))
+        self.assertEqual(len(records), sum(record['crash_count'] for record in self.records))
+
+    def test_base_source_is_abstract(self):
+        with self.assertRaises(TypeError):
+            CrashDataSource('http://localhost')
+
+    def test_forked_process_gets_its_own_session(self):
+        source = CartoDataSource(self.stub.carto_url)
+        source.fetch_records(1, 2020, 1, 2020)
+        parent_session = data_sources.get_http_session()
+        self.assertIs(source.session, parent_session)
+
+        process = multiprocessing.get_context('fork').Process(target=exit_with_fresh_session, args=(parent_session,))
+        process.start()
+        process.join()
+        self.assertEqual(process.exitcode, 0)
+        # The parent keeps its pooled connections
+        self.assertIs(data_sources.get_http_session(), parent_session)
+
+    def test_pages_cover_every_record_once(self):
+        for source in (CartoDataSource(self.stub.carto_url), SocrataDataSource(self.stub.socrata_url)):
+            pages = list(source.iter_record_pages(1, 2020, 2, 2020, page_size=5))
+            self.assertTrue(all(len(page.records) <= 5 for page in pages))
+            paged = [record for page in pages for record in page.records]
+            self.assertEqual(sorted(map(str, paged)),
+                             sorted(map(str, source.fetch_records(1, 2020, 2, 2020))))
+
+            resumed = source.iter_record_pages(1, 2020, 2, 2020, page_size=5, resume_point=pages[1].resume_point)
+            self.assertEqual([page.records for page in resumed], [page.records for page in pages[2:]])
+
+    def test_failed_page_reports_resume_point(self):
+        source = CartoDataSource(self.stub.carto_url)
+        first_page = next(source.iter_record_pages(1, 2020, 2, 2020, page_size=5))
+        with mock.patch.object(source, 'fetch_page', side_effect=requests.exceptions.Timeout('timed out')):
+            with self.assertRaises(PageFetchError) as context:
+                next(source.iter_record_pages(1, 2020, 2, 2020, page_size=5,
+                                              resume_point=first_page.resume_point))
+        self.assertEqual(context.exception.resume_point, ResumePoint(2020, 1, first_page.resume_point.cursor))
+
+    def test_failed_month_resumes_after_the_last_page(self):
+        source = CartoDataSource(self.stub.carto_url)
+        fetch_page = source.fetch_page
+        cursors = []
+
+        def fail_second_page_once(year, month, cursor, page_size):
+            cursors.append(cursor)
+            if cursor is not None and cursors.count(cursor) == 1:
+                raise requests.exceptions.Timeout('timed out')
+            return fetch_page(year, month, cursor, page_size)
+
+        with mock.patch.object(data_fetching, 'get_data_source', return_value=source), \
+                mock.patch.object(source, 'fetch_page', side_effect=fail_second_page_once), \
+                mock.patch('src.data_sources.PAGE_RETRIES', 0):
+            (_, pages), = data_fetching.iter_crash_data_months([(2020, 1)], page_size=5)
+
+        self.assertEqual(sorted(map(str, [record for page in pages for record in page])),
+                         sorted(map(str, source.fetch_records(1, 2020, 1, 2020))))
+        # The first page was not fetched again after the second one failed
+        self.assertEqual(cursors.count(None), 1)
+
+    def test_small_pages_match_single_page(self):
+        source = CartoDataSource(self.stub.carto_url)
+        pd.testing.assert_frame_equal(self.clean_months(source, pushdown=False, page_size=3),
+                                      self.clean_months(source, pushdown=False))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from src import data_cleaning, data_storage
+from src.crash_cube import CrashCube
+from src.reference_index import ReferenceIndex
+
+
+class TestMonthStore(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(data_storage, 'MONTH_DIR', self.temp_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.temp_dir.cleanup)
+        reference_index = ReferenceIndex(os.path.join(self.temp_dir.name, 'reference'))
+        patcher = mock.patch.object(data_cleaning, 'get_reference_index', return_value=reference_index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.crash_cube = CrashCube()
+        patcher = mock.patch.object(data_cleaning, 'get_crash_cube', return_value=self.crash_cube)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_save_and_fetch_month(self):
+        df = pd.DataFrame({'zip_code': [11207, 10001], 'borough': ['Brooklyn', 'Manhattan'],
+                           'crash_count': [4, 2]})
+        self.assertIsNone(data_storage.fetch_month_file(1, 2020))
+        data_storage.save_month_file(df, 1, 2020)
+        self.assertEqual(data_storage.list_stored_months(), [(2020, 1)])
+        pd.testing.assert_frame_equal(data_storage.fetch_month_file(1, 2020), df)
+        self.assertIn('crashes_2020_01.csv', os.listdir(self.temp_dir.name))
+
+    def test_only_missing_months_are_fetched(self):
+        stored = pd.DataFrame({'zip_code': [11207], 'borough': ['Brooklyn'], 'crash_count': [3]})
+        data_storage.save_month_file(stored, 1, 2020)
+        data_storage.save_month_file(stored, 3, 2020)
+        fetched = [
+            {'zip_code': 11207, 'borough': 'BROOKLYN', 'crash_count': 2, 'latitude': 40.67,
+             'longitude': -73.9, 'year': 2020, 'month': 2},
+        ]
+
+        with mock.patch.object(data_cleaning, 'iter_crash_data_months',
+                               return_value=[((2020, 2), [fetched])]) as fetch:
+            agg_df = data_cleaning.fetch_and_aggregate_crash_data(1, 2020, 3, 2020, 5)
+
+        fetch.assert_called_once_with([(2020, 2)])
+        self.assertEqual(data_storage.list_stored_months(), [(2020, 1), (2020, 2), (2020, 3)])
+        self.assertEqual(data_storage.fetch_month_file(2, 2020)['crash_count'].tolist(), [2])
+        self.assertEqual(sorted(zip(agg_df['borough'], agg_df['total_crashes'])),
+                         [('BROOKLYN', 2), ('Brooklyn', 6)])
+        self.assertTrue(self.crash_cube.covers_range(1, 2020, 3, 2020))
+
+        with mock.patch.object(data_cleaning, 'iter_crash_data_months') as fetch:
+            cached_df = data_cleaning.fetch_and_aggregate_crash_data(1, 2020, 3, 2020, 5)
+        fetch.assert_not_called()
+        self.assertEqual(sorted(zip(cached_df['borough'], cached_df['total_crashes'])),
+                         [('BROOKLYN', 2), ('Brooklyn', 6)])
+
+
+if __name__ == "__main__":
+    unittest.main()
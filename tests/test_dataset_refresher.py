@@ -0,0 +1,57 @@
+import threading
+import unittest
+
+from src.dataset_refresher import DatasetRefresher
+
+
+class TestDatasetRefresher(unittest.TestCase):
+    def test_previous_dataset_is_served_during_rebuild(self):
+        target = ['2025-01']
+        loading, release = threading.Event(), threading.Event()
+
+        def load(month):
+            loading.set()
+            release.wait(5)
+            return f"views of {month}"
+
+        refresher = DatasetRefresher(lambda: target[0], load, interval=60)
+        refresher.publish('2024-12', 'views of 2024-12')
+        thread = threading.Thread(target=refresher.refresh)
+        thread.start()
+        self.assertTrue(loading.wait(5))
+        self.assertEqual(refresher.get(), ('2024-12', 'views of 2024-12'))
+
+        release.set()
+        thread.join(5)
+        self.assertEqual(refresher.get(), ('2025-01', 'views of 2025-01'))
+        self.assertFalse(refresher.refresh())
+
+    def test_month_rollover_triggers_rebuild(self):
+        target = ['2025-01']
+        loads = []
+        refresher = DatasetRefresher(lambda: target[0], lambda month: loads.append(month) or month, interval=60)
+        self.assertTrue(refresher.refresh())
+        self.assertFalse(refresher.refresh())
+        target[0] = '2025-02'
+        self.assertTrue(refresher.is_stale())
+        self.assertTrue(refresher.refresh())
+        self.assertEqual(loads, ['2025-01', '2025-02'])
+
+    def test_failed_rebuild_keeps_previous_dataset(self):
+        def load(month):
+            raise RuntimeError('upstream unavailable')
+
+        refresher = DatasetRefresher(lambda: '2025-01', load, interval=60)
+        refresher.publish('2024-12', 'views of 2024-12')
+        self.assertFalse(refresher.refresh())
+        self.assertEqual(refresher.get(), ('2024-12', 'views of 2024-12'))
+
+    def test_background_thread_publishes_first_dataset(self):
+        refresher = DatasetRefresher(lambda: '2025-01', lambda month: month, interval=60)
+        refresher.start()
+        self.addCleanup(refresher.stop, 5)
+        self.assertEqual(refresher.get(timeout=5), ('2025-01', '2025-01'))
+
+
+if __name__ == "__main__":
+    unittest.main()
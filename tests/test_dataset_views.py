@@ -0,0 +1,102 @@
+import json
+import os
+import sys
+import unittest
+
+import pandas as pd
+
+from src.data_cleaning import process_and_format_crash_data
+from src.dataset_views import AREAS, DatasetViews, get_decile_lookup
+from src.result_cache import estimate_size
+from src.zip_code_search import search_zip_code
+
+SAMPLE_CSV = os.path.join(os.path.dirname(__file__), '../data/nyc_csv/accidents_2_2025-2_2025.csv')
+
+
+class TestDatasetViews(unittest.TestCase):
+    def setUp(self):
+        self.agg_df = pd.read_csv(SAMPLE_CSV)
+
+    def test_matches_process_and_format_crash_data(self):
+        views = DatasetViews(self.agg_df)
+        for area in AREAS:
+            total, average, formatted_df = process_and_format_crash_data(self.agg_df, area)
+            view_total, view_average, view_df = views.get_area(area)
+            self.assertEqual(total, view_total)
+            self.assertEqual(average, view_average)
+            pd.testing.assert_frame_equal(formatted_df, view_df)
+
+    def test_decile_lookup_matches_qcut(self):
+        for zip_count in (2, 9, 10, 11, 57, 178):
+            ranks = pd.DataFrame({'rank': range(1, zip_count + 1)})
+            expected = pd.qcut(ranks['rank'], 10, labels=False) + 1
+            self.assertListEqual(list(get_decile_lookup(zip_count)), list(expected))
+
+    def test_zip_prefix_index_matches_scan(self):
+        index = DatasetViews(self.agg_df).zip_prefix_index
+        zip_codes = self.agg_df['zip_code'].unique()
+        for query in ('', '1', '10', '112', '11207', '2', 'x'):
+            expected = sorted(int(zip_code) for zip_code in zip_codes if str(zip_code).startswith(query))
+            self.assertListEqual(index.lookup(query), expected)
+        self.assertListEqual(index.lookup('1', limit=3), index.lookup('1')[:3])
+
+    def test_zip_records_match_search_zip_code(self):
+        views = DatasetViews(self.agg_df)
+        in_borough = self.agg_df.dropna(subset=['borough'])
+        for zip_code in in_borough['zip_code'].unique()[:25]:
+            self.assertEqual(views.get_zip_record(int(zip_code)), search_zip_code(self.agg_df, int(zip_code)))
+        self.assertIsNone(views.get_zip_record(99999))
+
+    def test_size_counts_everything_the_views_hold(self):
+        views = DatasetViews(self.agg_df)
+        index = views.zip_prefix_index
+        self.assertGreaterEqual(sys.getsizeof(index), estimate_size(index.zip_strings) + estimate_size(index.zip_codes))
+
+        tables_size = sum(sys.getsizeof(table) + int(formatted_df.memory_usage(deep=True).sum())
+                          for table in views.area_tables.values() for formatted_df in table[2:])
+        members_size = (int(self.agg_df.memory_usage(deep=True).sum()) + tables_size + sys.getsizeof(index)
+                        + estimate_size(views.zip_records) + estimate_size(views.area_columns)
+                        + estimate_size(views.decile_summaries))
+        self.assertGreaterEqual(sys.getsizeof(views), members_size)
+
+    def test_decile_summary_matches_grouped_table(self):
+        views = DatasetViews(self.agg_df)
+        total, _, formatted_df = views.get_area('Citywide')
+        summary = views.get_decile_summary('Citywide')
+        self.assertEqual(sum(decile['total_accidents'] for decile in summary), total)
+        for decile in summary:
+            group = formatted_df[formatted_df['Decile'] == decile['decile']]
+            self.assertEqual(decile['total_accidents'], group['Accident Count'].sum())
+            self.assertListEqual([row['zip_code'] for row in decile['rows']], group['Zip Code'].tolist())
+
+    def test_dataset_without_crashes(self):
+        empty_df = self.agg_df.iloc[0:0]
+        zero_df = self.agg_df.assign(total_crashes=0)
+        for agg_df in (empty_df, zero_df):
+            views = DatasetViews(agg_df)
+            for area in AREAS:
+                summary = views.get_decile_summary(area)
+                self.assertTrue(all(decile['percentage'] == 0 for decile in summary))
+                self.assertTrue(all(row['accident_likelihood'] == 0 for decile in summary for row in decile['rows']))
+                columns = views.get_area_columns(area)
+                self.assertTrue(all(likelihood == 0 for likelihood in columns['accident_likelihood']))
+                # The API payload serializes as strict JSON, without NaN or Infinity
+                json.dumps(columns, allow_nan=False)
+        self.assertEqual(DatasetViews(empty_df).get_decile_summary('Citywide'), [])
+        self.assertEqual(len(DatasetViews(zero_df).get_decile_summary('Citywide')), 10)
+
+    def test_area_columns_match_table(self):
+        views = DatasetViews(self.agg_df)
+        _, _, formatted_df = views.get_area('Brooklyn')
+        columns = views.get_area_columns('Brooklyn')
+        self.assertListEqual(columns['zip_code'], formatted_df['Zip Code'].tolist())
+        self.assertListEqual(columns['rank'], formatted_df['Rank'].tolist())
+        self.assertTrue(all(len(values) == len(formatted_df) for values in columns.values()))
+
+    def test_unknown_area(self):
+        with self.assertRaises(KeyError):
+            DatasetViews(self.agg_df).get_area('Nowhere')
+
+
+if __name__ == "__main__":
+    unittest.main()
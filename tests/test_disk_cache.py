@@ -0,0 +1,62 @@
+import os
+import tempfile
+import threading
+import unittest
+
+import pandas as pd
+
+from src.disk_cache import DiskCache
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.directory = os.path.join(temp_dir.name, 'cache')
+
+    def test_dataframe_round_trip(self):
+        cache = DiskCache(self.directory, 10**6)
+        df = pd.DataFrame({'zip_code': [11207, 10000], 'borough': ['Brooklyn', None],
+                           'total_crashes': [12, 7]})
+        self.assertIsNone(cache.get_dataframe('accidents_1_2024-1_2024.npz'))
+        cache.set_dataframe('accidents_1_2024-1_2024.npz', df)
+        loaded_df = cache.get_dataframe('accidents_1_2024-1_2024.npz')
+        pd.testing.assert_frame_equal(loaded_df, df, check_dtype=False)
+        self.assertEqual(loaded_df['total_crashes'].dtype, 'int64')
+
+    def test_recently_read_files_survive_eviction(self):
+        cache = DiskCache(self.directory, 25)
+        cache.set('popular', b'x' * 10)
+        cache.set('one-off', b'x' * 10)
+        os.utime(cache.get_path('popular'), (0, 0))
+        os.utime(cache.get_path('one-off'), (1, 1))
+        cache.get('popular')
+        cache.set('new', b'x' * 10)
+        self.assertEqual(sorted(cache.file_names()), ['new', 'popular'])
+
+    def test_readers_never_see_partial_files(self):
+        cache = DiskCache(self.directory, 10**8)
+        payloads = [bytes([value]) * 10**6 for value in range(4)]
+        cache.set('shared', payloads[0])
+        seen = []
+
+        def write(payload):
+            for _ in range(5):
+                cache.set('shared', payload)
+
+        def read():
+            for _ in range(20):
+                seen.append(cache.get('shared'))
+
+        threads = [threading.Thread(target=write, args=(payload,)) for payload in payloads]
+        threads += [threading.Thread(target=read) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(all(data in payloads for data in seen))
+        self.assertEqual(cache.file_names(), ['shared'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import contextlib
+import unittest
+from unittest import mock
+
+import pandas as pd
+import shapely
+
+from src import geometry_registry
+from src.geometry_registry import SHAPEFILE_PATH, ZipGeometryRegistry
+from src.heatmap_generation import create_interactive_heatmap
+
+# Inside the 10001 polygon, near Penn Station
+PENN_STATION = (40.7506, -73.9935)
+
+# Points inside known zip codes of every borough
+KNOWN_POINTS = {
+    11207: (40.6702, -73.8942),
+    10463: (40.8800, -73.9070),
+    10301: (40.6437, -74.0770),
+    10036: (40.7580, -73.9855),
+    11368: (40.7498, -73.8627),
+}
+
+
+class TestZipGeometryRegistry(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.registry = ZipGeometryRegistry(SHAPEFILE_PATH)
+
+    def test_known_zip_polygon(self):
+        row = self.registry.zip_to_row['10001']
+        polygon = self.registry.zip_gdf.geometry.values[row]
+        latitude, longitude = PENN_STATION
+        self.assertTrue(shapely.contains_xy(polygon, longitude, latitude))
+        self.assertTrue(shapely.contains_xy(polygon, self.registry.centroid_longitudes[row],
+                                            self.registry.centroid_latitudes[row]))
+        self.assertEqual(self.registry.lookup_zip_codes([latitude, 0.0], [longitude, 0.0]).tolist(), [10001, -1])
+
+    def test_points_resolve_to_their_zip_codes(self):
+        latitudes, longitudes = zip(*KNOWN_POINTS.values())
+        self.assertEqual(self.registry.lookup_zip_codes(latitudes, longitudes).tolist(), list(KNOWN_POINTS))
+        # Out in the harbor, outside every polygon
+        self.assertEqual(self.registry.lookup_zip_codes([40.60], [-74.03]).tolist(), [-1])
+        self.assertEqual(self.registry.get_rows(['11207', '10001', '00000']).tolist(),
+                         sorted([self.registry.zip_to_row['10001'], self.registry.zip_to_row['11207']]))
+
+    def test_heatmap_of_a_borough(self):
+        decile_table = pd.DataFrame({
+            'Zip Code': [10001, 11207], 'Borough': ['Manhattan', 'Brooklyn'],
+            'Accident Count': [40, 30], 'Rank': [1, 2], 'Decile': [1, 2]})
+        html = create_interactive_heatmap('Manhattan', decile_table).get_root().render()
+        self.assertIn('Zip Code: 10001', html)
+        self.assertNotIn('Zip Code: 11207', html)
+
+    def test_snapshot_is_saved_under_the_snapshot_lock(self):
+        events = []
+
+        @contextlib.contextmanager
+        def snapshot_lock(name):
+            events.append(('lock', name))
+            yield
+            events.append(('unlock', name))
+
+        with mock.patch.object(geometry_registry, 'load_snapshot', return_value=None), \
+                mock.patch.object(geometry_registry, 'snapshot_lock', snapshot_lock), \
+                mock.patch.object(ZipGeometryRegistry, 'save_snapshot',
+                                  side_effect=lambda metadata: events.append(('save', None))):
+            geometry_registry.load_zip_geometry_registry()
+        self.assertEqual(events, [('lock', 'zip_geometry'), ('save', None), ('unlock', 'zip_geometry')])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import gzip
+import unittest
+
+from flask import Flask, request
+
+from src.http_caching import create_etag, make_cached_response
+from src.result_cache import ResultCache
+
+
+class TestMakeCachedResponse(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.compressed_cache = ResultCache(1024 * 1024)
+        self.renders = []
+        self.etag = create_etag('view', 'Citywide', 'version-1')
+
+        @self.app.route('/page')
+        def page():
+            def render():
+                self.renders.append(1)
+                return '<tr>row</tr>' * 500
+            return make_cached_response(request, self.etag, render, self.compressed_cache)
+
+        self.client = self.app.test_client()
+
+    def test_matching_etag_skips_render(self):
+        response = self.client.get('/page')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response.headers['Cache-Control'])
+
+        revalidated = self.client.get('/page', headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.data, b'')
+        self.assertEqual(len(self.renders), 1)
+
+    def test_large_body_is_compressed_once(self):
+        plain = self.client.get('/page').data
+        for _ in range(2):
+            response = self.client.get('/page', headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(gzip.decompress(response.data), plain)
+        self.assertEqual(len(self.compressed_cache), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
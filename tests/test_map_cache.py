@@ -0,0 +1,37 @@
+import os
+import tempfile
+import unittest
+
+from src.map_cache import MapCache
+
+
+class TestMapCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def test_disk_tier_is_shared_between_instances(self):
+        MapCache(10**6, 10**6, self.temp_dir.name).set('Staten Island', '1_2024-2_2024', 'v1', '<html>')
+        other = MapCache(10**6, 10**6, self.temp_dir.name)
+        self.assertEqual(other.get('Staten Island', '1_2024-2_2024', 'v1'), '<html>')
+        self.assertIsNone(other.get('Staten Island', '1_2024-2_2024', 'v2'))
+
+    def test_invalidate_removes_other_versions(self):
+        cache = MapCache(10**6, 10**6, self.temp_dir.name)
+        cache.set('Queens', '1_2024-2_2024', 'v1', '<old>')
+        cache.set('Queens', '3_2024-3_2024', 'v1', '<other range>')
+        cache.invalidate('1_2024-2_2024', 'v2')
+        self.assertIsNone(MapCache(10**6, 10**6, self.temp_dir.name).get('Queens', '1_2024-2_2024', 'v1'))
+        self.assertEqual(len(os.listdir(self.temp_dir.name)), 1)
+
+    def test_disk_tier_is_bounded(self):
+        cache = MapCache(10**6, 25, self.temp_dir.name)
+        cache.set('Queens', '1_2024-1_2024', 'v1', 'x' * 10)
+        cache.set('Queens', '2_2024-2_2024', 'v1', 'x' * 10)
+        os.utime(os.path.join(self.temp_dir.name, os.listdir(self.temp_dir.name)[0]), (0, 0))
+        cache.set('Queens', '3_2024-3_2024', 'v1', 'x' * 10)
+        self.assertEqual(len(os.listdir(self.temp_dir.name)), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from src.reference_index import ReferenceIndex
+
+
+def add_month(reference_dir, month):
+    ReferenceIndex(reference_dir).add_months([(2020, month)], [40.6 + month / 100], [-73.9], [10001])
+
+
+class TestReferenceIndex(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def test_persisted_and_reloaded(self):
+        index = ReferenceIndex(self.temp_dir.name)
+        index.add_months([(2020, 1)], [40.75, 40.75, 40.65], [-73.99, -73.99, -73.90], [10001, 10001, 11207])
+        self.assertEqual(len(index), 2)
+
+        reloaded = ReferenceIndex(self.temp_dir.name)
+        self.assertEqual(reloaded.months, {'2020-01'})
+        np.testing.assert_array_equal(
+            reloaded.assign_zip_codes([40.751, 40.64], [-73.99, -73.91], 1), [10001, 11207])
+
+    def test_months_are_added_once(self):
+        index = ReferenceIndex(self.temp_dir.name)
+        index.add_months([(2020, 1)], [40.75], [-73.99], [10001])
+        index.add_months([(2020, 1)], [40.65], [-73.90], [11207])
+        index.add_months([(2020, 2)], [40.60], [-73.95], [11229])
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.months, {'2020-01', '2020-02'})
+
+    def test_other_instances_pick_up_new_months(self):
+        index = ReferenceIndex(self.temp_dir.name)
+        other = ReferenceIndex(self.temp_dir.name)
+        index.add_months([(2020, 1)], [40.75], [-73.99], [10001])
+        np.testing.assert_array_equal(other.assign_zip_codes([40.7], [-74.0], 5), [10001])
+
+    def test_concurrent_workers_keep_each_others_months(self):
+        # Every process starts from the same empty index, like workers forked from one master
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=add_month, args=(self.temp_dir.name, month)) for month in range(1, 9)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertTrue(all(process.exitcode == 0 for process in processes))
+
+        index = ReferenceIndex(self.temp_dir.name)
+        self.assertEqual(index.months, {f"2020-{month:02d}" for month in range(1, 9)})
+        self.assertEqual(len(index), 8)
+        # Only the files of the current version are left
+        self.assertEqual(len([name for name in os.listdir(self.temp_dir.name) if name.endswith(('.joblib', '.npy'))]), 2)
+
+    def test_votes_while_months_are_added(self):
+        index = ReferenceIndex(self.temp_dir.name)
+        index.add_months([(2020, 1)], [40.75], [-73.99], [10001])
+        errors = []
+        stop = threading.Event()
+
+        def vote():
+            while not stop.is_set():
+                try:
+                    votes = index.assign_zip_codes([40.7, 40.6], [-73.95, -73.9], 5)
+                    self.assertTrue(set(votes.tolist()) <= {10001, 11207})
+                except Exception as e:
+                    errors.append(e)
+                    return
+
+        voter = threading.Thread(target=vote)
+        voter.start()
+        rng = np.random.default_rng(0)
+        for month in range(2, 13):
+            count = month * 50
+            index.add_months([(2020, month)], rng.uniform(40.5, 40.9, count), rng.uniform(-74.1, -73.7, count),
+                             rng.choice([10001, 11207], count))
+        stop.set()
+        voter.join()
+        self.assertEqual(errors, [])
+        tree, zip_codes = index.reference
+        self.assertEqual(len(np.asarray(tree.get_arrays()[0])), len(zip_codes))
+
+    def test_readers_do_not_wait_for_a_writer(self):
+        index = ReferenceIndex(self.temp_dir.name)
+        index.add_months([(2020, 1)], [40.75], [-73.99], [10001])
+        ReferenceIndex(self.temp_dir.name).add_months([(2020, 2)], [40.65], [-73.90], [11207])
+
+        # While this instance adds months it keeps voting on the version it has
+        with index._lock:
+            np.testing.assert_array_equal(index.assign_zip_codes([40.64], [-73.91], 1), [10001])
+            self.assertEqual(index.months, {'2020-01'})
+        np.testing.assert_array_equal(index.assign_zip_codes([40.64], [-73.91], 1), [11207])
+        self.assertEqual(index.months, {'2020-01', '2020-02'})
+
+
+if __name__ == "__main__":
+    unittest.main()
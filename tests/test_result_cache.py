@@ -0,0 +1,48 @@
+import unittest
+
+import pandas as pd
+
+from src.result_cache import ResultCache, create_dataset_key
+
+
+class TestResultCache(unittest.TestCase):
+    def test_dataset_key(self):
+        self.assertEqual(create_dataset_key('2', '2025', 3, 2025), '2_2025-3_2025')
+
+    def test_least_recently_used_is_evicted(self):
+        cache = ResultCache(max_bytes=100)
+        cache.set('a', 'a', size=40)
+        cache.set('b', 'b', size=40)
+        cache.get('a')
+        cache.set('c', 'c', size=40)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.current_bytes, 80)
+
+    def test_value_larger_than_budget_is_not_cached(self):
+        cache = ResultCache(max_bytes=10)
+        cache.set('a', 'a', size=11)
+        self.assertNotIn('a', cache)
+        self.assertEqual(cache.current_bytes, 0)
+
+    def test_get_or_load_calls_loader_once(self):
+        cache = ResultCache(max_bytes=10**6)
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return pd.DataFrame({'zip_code': [11207]})
+
+        first = cache.get_or_load('key', loader)
+        second = cache.get_or_load('key', loader)
+        self.assertIs(first, second)
+        self.assertEqual(len(calls), 1)
+
+    def test_none_is_not_cached(self):
+        cache = ResultCache(max_bytes=10**6)
+        self.assertIsNone(cache.get_or_load('key', lambda: None))
+        self.assertNotIn('key', cache)
+
+
+if __name__ == "__main__":
+    unittest.main()
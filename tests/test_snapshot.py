@@ -0,0 +1,47 @@
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src.geometry_registry import GEOMETRY_SNAPSHOT, ZipGeometryRegistry, get_zip_geometry_registry
+from src.snapshot import save_dataset_snapshot, load_dataset_snapshot, save_snapshot, load_snapshot
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.snapshot_dir = temp_dir.name
+
+    def test_dataset_round_trip_with_missing_borough(self):
+        agg_df = pd.DataFrame({'zip_code': [11207, 10000], 'borough': ['Brooklyn', None],
+                               'total_crashes': [12, 7]})
+        save_dataset_snapshot(agg_df, ('2', '2025', 2, 2025), snapshot_dir=self.snapshot_dir)
+        date_range, loaded_df = load_dataset_snapshot(snapshot_dir=self.snapshot_dir)
+        self.assertEqual(date_range, (2, 2025, 2, 2025))
+        pd.testing.assert_frame_equal(loaded_df.copy(), agg_df, check_dtype=False)
+        self.assertTrue(loaded_df['borough'].isna().iloc[1])
+
+    def test_columns_are_memory_mapped_and_replaced(self):
+        self.assertIsNone(load_snapshot('numbers', self.snapshot_dir))
+        save_snapshot('numbers', {'values': np.arange(3)}, snapshot_dir=self.snapshot_dir)
+        save_snapshot('numbers', {'values': np.arange(4)}, {'run': 2}, snapshot_dir=self.snapshot_dir)
+        columns, metadata = load_snapshot('numbers', self.snapshot_dir)
+        self.assertIsInstance(columns['values'], np.memmap)
+        self.assertEqual(columns['values'].tolist(), [0, 1, 2, 3])
+        self.assertEqual(metadata, {'run': 2})
+
+    def test_geometry_registry_round_trip(self):
+        registry = get_zip_geometry_registry()
+        registry.save_snapshot({}, self.snapshot_dir)
+        columns, metadata = load_snapshot(GEOMETRY_SNAPSHOT, self.snapshot_dir)
+        loaded = ZipGeometryRegistry.from_snapshot(columns, metadata)
+        self.assertEqual(loaded.zip_gdf.to_json(), registry.zip_gdf.to_json())
+        np.testing.assert_array_equal(loaded.centroid_latitudes, registry.centroid_latitudes)
+        self.assertEqual(loaded.lookup_zip_codes([40.6700], [-73.8950]).tolist(),
+                         registry.lookup_zip_codes([40.6700], [-73.8950]).tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()